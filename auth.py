@@ -0,0 +1,287 @@
+"""Password hashing and signed session tokens.
+
+bcrypt runs on a small worker pool instead of the Streamlit script thread, so a
+burst of sign-ins queues for ``WORKERS`` hashing threads rather than piling up
+CPU-bound work (pyca/bcrypt releases the GIL, so the workers really do run in
+parallel).  At most ``MAX_PENDING`` hashes may be queued or running; past
+that ``AuthBusy`` is raised instead of letting the queue grow without bound.
+
+The cost factor comes from ``LEBRONSIM_BCRYPT_ROUNDS``.  To pick one for this
+machine:
+
+    python -m auth calibrate --target-ms 250
+
+Stored hashes with a different cost are upgraded the next time their owner
+signs in.
+
+A signed-in browser gets an HMAC-SHA256 session token carrying the username,
+the user's token generation and an expiry.  Checking it takes microseconds:
+the HMAC plus the caller's lookup of the current generation, never bcrypt.
+Bumping a user's generation (on logout or a password change) revokes every
+token issued to them before.  The key comes from ``LEBRONSIM_SECRET`` (at least 32 bytes) or,
+failing that, a random key kept in ``LEBRONSIM_SECRET_FILE``; changing the key
+signs everyone out.
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("LEBRONSIM_BCRYPT_ROUNDS") or 12)
+WORKERS = int(os.environ.get("LEBRONSIM_AUTH_WORKERS") or 0) or os.cpu_count() or 1
+MAX_PENDING = WORKERS * 8
+WAIT_SECONDS = 10.0
+SECRET_PATH = os.environ.get("LEBRONSIM_SECRET_FILE", ".session_secret")
+MIN_SECRET_BYTES = 32
+TOKEN_SECONDS = 12 * 60 * 60
+
+
+class AuthBusy(Exception):
+    """The hashing pool is full; the caller should ask the user to try again."""
+
+
+class HashPool:
+    """A bounded pool of bcrypt threads with queue depth and timing counters."""
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="bcrypt")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "pending": 0,
+            "peak_pending": 0,
+            "queue_seconds": 0.0,
+            "work_seconds": 0.0,
+        }
+        self.max_pending = max_pending
+
+    def run(self, func, *args, wait=WAIT_SECONDS):
+        """Run ``func(*args)`` on the pool and return its result; ``AuthBusy`` if no slot frees up in ``wait`` seconds."""
+        counters = self.counters
+        if not self.slots.acquire(timeout=wait):
+            with self.lock:
+                counters["rejected"] += 1
+            raise AuthBusy(f"{self.max_pending} password checks already pending")
+        with self.lock:
+            counters["submitted"] += 1
+            counters["pending"] += 1
+            counters["peak_pending"] = max(counters["peak_pending"], counters["pending"])
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                with self.lock:
+                    counters["queue_seconds"] += started - submitted
+                    counters["work_seconds"] += time.perf_counter() - started
+
+        try:
+            return self.executor.submit(task).result()
+        finally:
+            with self.lock:
+                counters["pending"] -= 1
+                counters["completed"] += 1
+            self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["workers"] = self.workers
+        stats["max_pending"] = self.max_pending
+        stats["queue_depth"] = max(0, stats["pending"] - self.workers)
+        done = stats["completed"] or 1
+        stats["mean_queue_ms"] = stats["queue_seconds"] / done * 1000
+        stats["mean_work_ms"] = stats["work_seconds"] / done * 1000
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashPool()
+        return _pool
+
+
+def hash_password(password, rounds=None):
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return pool().run(bcrypt.hashpw, password.encode(), salt)
+
+
+def check_password(password, hashed):
+    return pool().run(bcrypt.checkpw, password.encode(), hashed)
+
+
+def cost(hashed):
+    """The cost factor recorded in a bcrypt hash (``$2b$12$...`` -> 12)."""
+    return int(hashed.split(b"$")[2])
+
+
+def needs_rehash(hashed, rounds=None):
+    return cost(hashed) != (rounds or BCRYPT_ROUNDS)
+
+
+def calibrate(target_ms, min_rounds=4, max_rounds=16, repeat=3):
+    """Time one hash per cost factor until past ``target_ms``; returns the timings and the slowest cost within target."""
+    timings = []
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        salt = bcrypt.gensalt(rounds)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bcrypt.hashpw(b"calibration password", salt)
+            samples.append((time.perf_counter() - start) * 1000)
+        ms = sorted(samples)[len(samples) // 2]
+        timings.append({"rounds": rounds, "ms": ms})
+        if ms > target_ms:
+            break
+        chosen = rounds
+    return {"target_ms": target_ms, "rounds": chosen, "timings": timings}
+
+
+# -- session tokens --
+
+_secret = None
+_secret_lock = threading.Lock()
+
+
+def read_secret_file():
+    """The key in ``SECRET_PATH``, or None if there is no file or it is too short to trust."""
+    try:
+        with open(SECRET_PATH, "rb") as f:
+            key = f.read()
+    except FileNotFoundError:
+        return None
+    return key if len(key) >= MIN_SECRET_BYTES else None
+
+
+def write_secret_file():
+    """Put a fresh key in ``SECRET_PATH`` unless another process already has.
+
+    The key is written and fsynced under a temporary name first, then linked
+    into place with ``os.link``, which fails if the file exists, so a partly
+    written key is never visible and racing processes agree on one key.  An
+    existing file is replaced only if re-reading it still finds it too short
+    (e.g. left by a crash).  Callers re-read ``SECRET_PATH`` afterwards.
+    """
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(SECRET_PATH)), prefix=".session_secret.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(MIN_SECRET_BYTES))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(temp, SECRET_PATH)
+        except FileExistsError:
+            if read_secret_file() is None:
+                os.replace(temp, SECRET_PATH)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def secret():
+    """The token signing key: ``LEBRONSIM_SECRET``, else a random key created once in ``SECRET_PATH``."""
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            configured = os.environ.get("LEBRONSIM_SECRET")
+            if configured:
+                if len(configured.encode()) < MIN_SECRET_BYTES:
+                    raise RuntimeError(f"LEBRONSIM_SECRET must be at least {MIN_SECRET_BYTES} bytes")
+                _secret = configured.encode()
+            else:
+                key = read_secret_file()
+                if key is None:
+                    write_secret_file()
+                    key = read_secret_file()
+                if key is None:
+                    raise RuntimeError(f"could not create a session key in {SECRET_PATH}")
+                _secret = key
+        return _secret
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(payload):
+    return hmac.new(secret(), payload, hashlib.sha256).digest()
+
+
+def issue_token(username, generation, ttl=TOKEN_SECONDS, now=None):
+    """A ``payload.signature`` token for ``username`` at token ``generation``, expiring in ``ttl`` seconds."""
+    expires = int((now or time.time()) + ttl)
+    payload = f"{expires}:{generation}:{username}".encode()
+    return f"{_b64(payload)}.{_b64(sign(payload))}"
+
+
+def verify_token(token, current_generation, now=None):
+    """The username a token was issued for, or None if it is forged, malformed, expired or revoked.
+
+    ``current_generation(username)`` returns the user's token generation now,
+    or None if there is no such user; only tokens issued at that generation pass.
+    """
+    try:
+        payload_part, signature_part = token.split(".")
+        payload = _unb64(payload_part)
+        signature = _unb64(signature_part)
+        expires, generation, username = payload.decode().split(":", 2)
+        expires = int(expires)
+        generation = int(generation)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+    if not hmac.compare_digest(signature, sign(payload)):
+        return None
+    if expires < (now or time.time()):
+        return None
+    if current_generation(username) != generation:
+        return None
+    return username
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Password hashing tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="pick a bcrypt cost for a target hash time on this machine")
+    calibrate_parser.add_argument("--target-ms", type=float, default=250.0)
+    calibrate_parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    if args.command == "calibrate":
+        result = calibrate(args.target_ms, max_rounds=args.max_rounds)
+        for row in result["timings"]:
+            print(f"rounds {row['rounds']:>2}: {row['ms']:9.1f} ms")
+        print(f"\nslowest cost within {args.target_ms:g} ms: {result['rounds']} (currently {BCRYPT_ROUNDS})")
+        print(f"export LEBRONSIM_BCRYPT_ROUNDS={result['rounds']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""Headless, vectorized Player vs LeBron battle simulator.
+
+Every field of every battle lives in a NumPy array and a round is resolved for
+all live battles at once with array operations.  The rules mirror
+``Player``/``LeBron`` and the round order of ``process_round`` in
+``lebronsim.py``:
+
+1. LeBron picks a move (``LeBron.choose_action(player)``)
+2. defends resolve (player first, then LeBron)
+3. the player's attack / special / rest resolves
+4. LeBron's attack / special / rest resolves
+5. damage lands on LeBron, then on the player
+6. both defend flags reset
+
+Run ``python batch_sim.py --difficulty Hard -n 1000000`` for a quick summary.
+"""
+
+import argparse
+import copy
+import random
+import time
+from functools import lru_cache
+
+import numpy as np
+
+import policy_table
+
+ATTACK, DEFEND, REST, SPECIAL = 0, 1, 2, 3
+ACTIONS = ("attack", "defend", "rest", "special")
+
+WIN, LOSS, TIE, UNFINISHED = 0, 1, 2, 3
+OUTCOMES = ("win", "loss", "tie", "unfinished")
+
+PLAYER_MAX_HEALTH = 140
+MAX_STAMINA = 100
+MAX_SPECIAL = 100
+
+LEBRON_HEALTH = {"Easy": 100, "Medium": 160, "Hard": 180}
+MOVE_PATTERNS = policy_table.MOVE_PATTERNS
+SPECIAL_THRESHOLD = {"Medium": 0.6, "Hard": 0.8}
+SPECIAL_MULTIPLIER = {"Easy": None, "Medium": 1.1, "Hard": 1.2}
+
+
+class BattleBatch:
+    """Struct-of-arrays state for ``n`` independent battles."""
+
+    FIELDS = (
+        "index", "rounds",
+        "p_health", "p_stamina", "p_special", "p_defending",
+        "l_health", "l_stamina", "l_special", "l_defending",
+        "consecutive_attacks", "consecutive_defends", "turn_count",
+        "player_last_hp", "player_last_stamina", "memory",
+    )
+
+    def __init__(self, difficulty, n):
+        if difficulty not in LEBRON_HEALTH:
+            raise ValueError(f"Unknown difficulty: {difficulty}")
+        self.difficulty = difficulty
+        self.l_max_health = LEBRON_HEALTH[difficulty]
+
+        self.index = np.arange(n)
+        self.rounds = np.ones(n, dtype=np.int32)
+
+        self.p_health = np.full(n, PLAYER_MAX_HEALTH, dtype=np.int32)
+        self.p_stamina = np.full(n, MAX_STAMINA, dtype=np.int32)
+        self.p_special = np.zeros(n, dtype=np.int32)
+        self.p_defending = np.zeros(n, dtype=bool)
+
+        self.l_health = np.full(n, self.l_max_health, dtype=np.int32)
+        self.l_stamina = np.full(n, MAX_STAMINA, dtype=np.int32)
+        self.l_special = np.zeros(n, dtype=np.int32)
+        self.l_defending = np.zeros(n, dtype=bool)
+
+        self.consecutive_attacks = np.zeros(n, dtype=np.int32)
+        self.consecutive_defends = np.zeros(n, dtype=np.int32)
+        self.turn_count = np.zeros(n, dtype=np.int32)
+        self.player_last_hp = np.full(n, PLAYER_MAX_HEALTH, dtype=np.int32)
+        self.player_last_stamina = np.full(n, MAX_STAMINA, dtype=np.int32)
+        # Last three observed player moves, oldest first, -1 for empty slots
+        self.memory = np.full((n, 3), -1, dtype=np.int8)
+
+    @classmethod
+    def from_fighters(cls, difficulty, fighters):
+        """Pack ``(engine.LeBron, engine.Player)`` pairs into one batch."""
+        batch = cls(difficulty, len(fighters))
+        columns = {
+            "p_health": lambda lebron, player: player.health,
+            "p_stamina": lambda lebron, player: player.stamina,
+            "p_special": lambda lebron, player: player.special_meter,
+            "p_defending": lambda lebron, player: player.is_defending,
+            "l_health": lambda lebron, player: lebron.health,
+            "l_stamina": lambda lebron, player: lebron.stamina,
+            "l_special": lambda lebron, player: lebron.special_meter,
+            "l_defending": lambda lebron, player: lebron.is_defending,
+            "consecutive_attacks": lambda lebron, player: lebron.consecutive_attacks,
+            "consecutive_defends": lambda lebron, player: lebron.consecutive_defends,
+            "turn_count": lambda lebron, player: lebron.turn_count,
+            "player_last_hp": lambda lebron, player: lebron.player_last_hp,
+            "player_last_stamina": lambda lebron, player: lebron.player_last_stamina,
+        }
+        for field, read in columns.items():
+            column = getattr(batch, field)
+            column[:] = [read(lebron, player) for lebron, player in fighters]
+        for row, (lebron, player) in enumerate(fighters):
+            moves = [ACTIONS.index(move) for move in lebron.player_pattern_memory[-3:]]
+            if moves:
+                batch.memory[row, 3 - len(moves):] = moves
+        return batch
+
+    def __len__(self):
+        return len(self.index)
+
+    def keep(self, mask):
+        """Drop every battle where ``mask`` is False."""
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field)[mask])
+
+
+def valid_moves(batch):
+    """(n, 4) mask of the moves the UI would leave enabled for the player."""
+    valid = np.empty((len(batch), 4), dtype=bool)
+    valid[:, ATTACK] = batch.p_stamina >= 15
+    valid[:, DEFEND] = batch.p_stamina >= 10
+    valid[:, REST] = True
+    valid[:, SPECIAL] = (batch.p_special >= MAX_SPECIAL) & (batch.p_stamina >= 25)
+    return valid
+
+
+def random_policy(batch, rng):
+    """Pick uniformly among the enabled moves."""
+    valid = valid_moves(batch)
+    counts = valid.sum(axis=1)
+    pick = (rng.random(len(batch)) * counts).astype(np.int64)
+    return np.argmax(np.cumsum(valid, axis=1) > pick[:, None], axis=1)
+
+
+def greedy_policy(batch, rng):
+    """Special when it is ready, otherwise attack, otherwise rest."""
+    valid = valid_moves(batch)
+    return np.where(valid[:, SPECIAL], SPECIAL, np.where(valid[:, ATTACK], ATTACK, REST))
+
+
+def scripted_policy(script):
+    """Cycle through ``script`` (action names) by round, resting when a move is disabled."""
+    moves = np.array([ACTIONS.index(action) for action in script])
+
+    def policy(batch, rng):
+        wanted = moves[(batch.rounds - 1) % len(moves)]
+        valid = valid_moves(batch)
+        return np.where(valid[np.arange(len(batch)), wanted], wanted, REST)
+
+    return policy
+
+
+POLICIES = {"random": random_policy, "greedy": greedy_policy}
+
+
+def _observe_player(batch):
+    """Vectorized ``LeBron.analyze_player_pattern``."""
+    damage_taken = batch.player_last_hp - batch.p_health
+    batch.player_last_hp = batch.p_health.copy()
+
+    move = np.full(len(batch), -1, dtype=np.int8)
+    took_damage = damage_taken > 0
+    rested = ~took_damage & (batch.p_stamina > batch.player_last_stamina)
+    defended = ~took_damage & ~rested & batch.p_defending
+    move[took_damage] = np.where(damage_taken[took_damage] > 35, SPECIAL, ATTACK)
+    move[rested] = REST
+    move[defended] = DEFEND
+    batch.player_last_stamina = batch.p_stamina.copy()
+
+    seen = move >= 0
+    batch.memory[seen, :2] = batch.memory[seen, 1:]
+    batch.memory[seen, 2] = move[seen]
+
+
+BAND_BY_STAMINA = np.array([policy_table.stamina_band(s) for s in range(MAX_STAMINA + 1)])
+OUTCOME_ACTION = np.array([ACTIONS.index(action) for action, _ in policy_table.OUTCOMES])
+OUTCOME_STREAK = np.array([streak for _, streak in policy_table.OUTCOMES])
+
+
+def policy_keys(batch):
+    """Vectorized ``policy_table.state_key`` for every battle in ``batch``."""
+    memory = batch.memory
+    predicts_special = (
+        (batch.difficulty == "Hard")
+        & (batch.p_special >= 75)
+        & (memory[:, 1] >= 0)
+        & (memory[:, 2] != REST)
+        & ((memory == ATTACK).sum(axis=1) >= 2)
+    )
+    flags = (
+        batch.l_special >= MAX_SPECIAL,
+        batch.l_health < batch.l_max_health * 0.3,
+        batch.l_health > batch.l_max_health * 0.8,
+        batch.turn_count < 5,
+        batch.p_health < PLAYER_MAX_HEALTH * 0.4,
+        batch.p_health < PLAYER_MAX_HEALTH * 0.3,
+        batch.p_defending,
+        predicts_special,
+        batch.consecutive_attacks >= 2,
+        batch.consecutive_defends >= 2,
+    )
+    key = BAND_BY_STAMINA[np.clip(batch.l_stamina, 0, MAX_STAMINA)]
+    for flag in flags:
+        key = (key << 1) | flag
+    return key
+
+
+@lru_cache(maxsize=None)
+def policy_array(difficulty):
+    return np.array(policy_table.compile_table(difficulty))
+
+
+def choose_actions(batch, rng):
+    """Batched ``LeBron.choose_action(player)``: one action code per battle.
+
+    Updates turn counts, pattern memory and streak counters in ``batch`` exactly
+    like the scalar path, and samples from the same compiled table with one
+    uniform draw per battle.
+    """
+    batch.turn_count += 1
+    if batch.difficulty in ("Medium", "Hard"):
+        _observe_player(batch)
+
+    rows = policy_array(batch.difficulty)[policy_keys(batch)]
+    outcome = (rows <= rng.random(len(batch))[:, None]).sum(axis=1)
+    chosen = OUTCOME_ACTION[outcome]
+
+    streak = OUTCOME_STREAK[outcome]
+    attacked = streak & (chosen == ATTACK)
+    defended = streak & (chosen == DEFEND)
+    other = streak & ~attacked & ~defended
+    batch.consecutive_attacks[attacked] += 1
+    batch.consecutive_defends[attacked] = 0
+    batch.consecutive_defends[defended] += 1
+    batch.consecutive_attacks[defended] = 0
+    batch.consecutive_attacks[other] = 0
+    batch.consecutive_defends[other] = 0
+    return chosen
+
+
+def verify_choose_actions(difficulty, states=200, draws=20000, seed=0):
+    """Check ``choose_actions`` against the scalar path's exact distribution.
+
+    Each random game state is replicated ``draws`` times and decided in one
+    batched call; returns the largest z-score of any outcome frequency.
+    """
+    rng = random.Random(seed)
+    generator = np.random.default_rng(seed)
+    worst = 0.0
+    for _ in range(states):
+        lebron, player = policy_table.random_state(difficulty, rng)
+        if player is None:
+            continue
+        # The scalar path observes the player before deciding; do it once here
+        scalar = copy.copy(lebron)
+        scalar.player_pattern_memory = list(lebron.player_pattern_memory)
+        scalar.turn_count += 1
+        scalar.analyze_player_pattern(player)
+        expected = {k: float(p) for k, p in policy_table.reference_distribution(scalar, player).items()}
+
+        batch = BattleBatch.from_fighters(difficulty, [(lebron, player)] * draws)
+        chosen = choose_actions(batch, generator)
+        observed = {}
+        for code, attacks, defends in zip(chosen, batch.consecutive_attacks, batch.consecutive_defends):
+            key = (ACTIONS[code], int(attacks), int(defends))
+            observed[key] = observed.get(key, 0) + 1
+        for key in set(expected) | set(observed):
+            p = expected.get(key, 0.0)
+            count = observed.get(key, 0)
+            if p <= 0 or p >= 1:
+                if count != draws * p:
+                    return float("inf")
+                continue
+            z = abs(count - draws * p) / np.sqrt(draws * p * (1 - p))
+            worst = max(worst, z)
+    return worst
+
+
+def _defend(stamina, special, defending, mask):
+    stamina[mask] = np.maximum(stamina[mask] - 10, 0)
+    special[mask] = np.minimum(special[mask] + 15, MAX_SPECIAL)
+    defending[mask] = True
+
+
+def _offense(action, stamina, special, rng, special_multiplier=None):
+    """Resolve attack / special / rest in place and return the damage dealt."""
+    n = len(action)
+    damage = np.zeros(n, dtype=np.int32)
+
+    attacks = (action == ATTACK) & (stamina >= 15)
+    stamina[attacks] -= 15
+    special[attacks] = np.minimum(special[attacks] + 10, MAX_SPECIAL)
+    base = rng.integers(15, 31, size=n, dtype=np.int32)
+    critical = rng.random(n) < 0.2
+    base = np.where(critical, (base * 1.5).astype(np.int32), base)
+    damage[attacks] = base[attacks]
+
+    specials = (action == SPECIAL) & (special >= MAX_SPECIAL)
+    special[specials] = 0
+    stamina[specials] = np.maximum(stamina[specials] - 25, 0)
+    big = rng.integers(40, 61, size=n, dtype=np.int32)
+    if special_multiplier is not None:
+        big = (big * special_multiplier).astype(np.int32)
+    damage[specials] = big[specials]
+
+    rests = action == REST
+    gained = rng.integers(25, 41, size=n, dtype=np.int32)
+    stamina[rests] = np.minimum(stamina[rests] + gained[rests], MAX_STAMINA)
+    special[rests] = np.minimum(special[rests] + 5, MAX_SPECIAL)
+
+    return damage
+
+
+def play_round(batch, player_action, rng):
+    """Resolve one ``process_round`` for every battle in ``batch``."""
+    lebron_action = choose_actions(batch, rng)
+
+    _defend(batch.p_stamina, batch.p_special, batch.p_defending, player_action == DEFEND)
+    _defend(batch.l_stamina, batch.l_special, batch.l_defending, lebron_action == DEFEND)
+
+    player_damage = _offense(player_action, batch.p_stamina, batch.p_special, rng)
+    lebron_damage = _offense(
+        lebron_action, batch.l_stamina, batch.l_special, rng,
+        SPECIAL_MULTIPLIER[batch.difficulty],
+    )
+
+    # LeBron.take_damage: a block halves the hit and heals half of what got through
+    hit = player_damage > 0
+    reduced = player_damage // 2
+    blocked = hit & batch.l_defending
+    health = batch.l_health
+    health[blocked] = np.minimum(health[blocked] + reduced[blocked] // 2, batch.l_max_health)
+    health[blocked] -= reduced[blocked]
+    health[hit & ~blocked] -= player_damage[hit & ~blocked]
+    np.maximum(health, 0, out=health)
+
+    # Player.take_damage
+    hit = lebron_damage > 0
+    blocked = hit & batch.p_defending
+    lebron_damage[blocked] //= 2
+    batch.p_health[hit] -= lebron_damage[hit]
+    np.maximum(batch.p_health, 0, out=batch.p_health)
+
+    batch.p_defending[:] = False
+    batch.l_defending[:] = False
+    batch.rounds += 1
+    return lebron_action
+
+
+def simulate_batch(difficulty, n, policy="random", seed=None, rng=None, max_rounds=500):
+    """Play ``n`` battles to completion and return per-battle result arrays.
+
+    ``rounds`` matches ``st.session_state.round`` on the game over screen, so a
+    battle decided in its first exchange reports round 2.
+    """
+    if rng is None:
+        rng = np.random.default_rng(seed)
+    if isinstance(policy, str):
+        policy = POLICIES[policy]
+
+    batch = BattleBatch(difficulty, n)
+    outcome = np.full(n, UNFINISHED, dtype=np.int8)
+    rounds = np.zeros(n, dtype=np.int32)
+    player_health = np.zeros(n, dtype=np.int32)
+    lebron_health = np.zeros(n, dtype=np.int32)
+
+    def record(mask, result):
+        index = batch.index[mask]
+        outcome[index] = result
+        rounds[index] = batch.rounds[mask]
+        player_health[index] = batch.p_health[mask]
+        lebron_health[index] = batch.l_health[mask]
+
+    for _ in range(max_rounds):
+        if not len(batch):
+            break
+        play_round(batch, policy(batch, rng), rng)
+
+        player_down = batch.p_health <= 0
+        lebron_down = batch.l_health <= 0
+        over = player_down | lebron_down
+        if over.any():
+            record(player_down & lebron_down, TIE)
+            record(lebron_down & ~player_down, WIN)
+            record(player_down & ~lebron_down, LOSS)
+            batch.keep(~over)
+
+    if len(batch):
+        record(np.ones(len(batch), dtype=bool), UNFINISHED)
+
+    return {
+        "outcome": outcome,
+        "rounds": rounds,
+        "player_health": player_health,
+        "lebron_health": lebron_health,
+    }
+
+
+def summarize(results):
+    """Collapse ``simulate_batch`` arrays into win/loss/tie rates."""
+    counts = np.bincount(results["outcome"], minlength=len(OUTCOMES))
+    total = counts.sum()
+    summary = {name: counts[code] / total for code, name in enumerate(OUTCOMES)}
+    summary["battles"] = int(total)
+    summary["avg_rounds"] = float(results["rounds"].mean()) if total else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-simulate Player vs LeBron battles")
+    parser.add_argument("--difficulty", default="Medium", choices=list(LEBRON_HEALTH))
+    parser.add_argument("--policy", default="random", choices=list(POLICIES))
+    parser.add_argument("-n", "--battles", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=250_000, help="battles per vectorized batch")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verify-ai", action="store_true",
+                        help="compare batched LeBron decisions with the scalar path first")
+    args = parser.parse_args()
+
+    if args.verify_ai:
+        worst = verify_choose_actions(args.difficulty, seed=args.seed or 0)
+        print(f"batched vs scalar LeBron decisions: worst z-score {worst:.2f}")
+
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    chunks = []
+    remaining = args.battles
+    while remaining > 0:
+        size = min(args.chunk, remaining)
+        chunks.append(simulate_batch(args.difficulty, size, args.policy, rng=rng))
+        remaining -= size
+    elapsed = time.perf_counter() - start
+
+    results = {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+    summary = summarize(results)
+    print(f"{args.battles:,} {args.difficulty} battles in {elapsed:.2f}s "
+          f"({args.battles / elapsed * 60:,.0f} battles/min)")
+    for name in OUTCOMES:
+        print(f"  {name:>10}: {summary[name]:.4f}")
+    print(f"  avg rounds: {summary['avg_rounds']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Timed benchmarks for the engine, progression and database hot paths.
+
+Each scenario runs for a fixed wall clock slice and reports ops/sec with p50
+and p99 latency.  Results can be saved as a JSON baseline and later runs fail
+when any scenario's p50 slows down by more than ``--threshold``.
+
+The Streamlit app is imported in bare mode against a throwaway SQLite file, so
+the database scenarios never touch ``users.db``.
+
+    python -m bench --save              # record .bench/baseline.json
+    python -m bench --threshold 0.25    # compare against it, exit 1 on regression
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import db
+import migrations
+from engine import LeBron, Player
+
+BASELINE = os.path.join(".bench", "baseline.json")
+ROOM_CODE = "BENCH1"
+USERNAME = "bench_user"
+MOVES = ("attack", "defend", "rest", "special")
+
+SCENARIOS = []
+
+
+def scenario(name, inner=1):
+    """Register a factory returning ``(before, op)``; ``before`` runs untimed before each op."""
+    def register(factory):
+        SCENARIOS.append((name, factory, inner))
+        return factory
+    return register
+
+
+def load_app(db_path):
+    """Import lebronsim quietly against ``db_path`` and create its tables."""
+    db.DB_PATH = db_path
+    import streamlit.logger
+
+    # Bare mode warns about the missing script run context on every st call.
+    for name in (
+        "root",
+        "streamlit.runtime.scriptrunner_utils.script_run_context",
+        "streamlit.runtime.state.session_state_proxy",
+    ):
+        streamlit.logger.get_logger(name).disabled = True
+    import lebronsim
+
+    migrations.migrate()
+    return lebronsim
+
+
+def random_fighters(difficulty, rng):
+    player = Player("You", 140, 100, rng=rng)
+    lebron = LeBron(difficulty, rng=rng)
+
+    def before():
+        player.health = rng.randint(1, 140)
+        player.stamina = rng.randint(0, 100)
+        player.special_meter = rng.choice((0, 30, 60, 100))
+        player.is_defending = rng.random() < 0.25
+        lebron.health = rng.randint(1, lebron.max_health)
+        lebron.stamina = rng.randint(0, 100)
+        lebron.special_meter = rng.choice((0, 30, 60, 100))
+
+    return player, lebron, before
+
+
+def choose_action_scenario(difficulty):
+    def factory(app, rng):
+        player, lebron, before = random_fighters(difficulty, rng)
+        return before, lambda: lebron.choose_action(player)
+    return factory
+
+
+for _difficulty in ("Easy", "Medium", "Hard", "Nightmare"):
+    scenario(f"choose_action[{_difficulty}]")(choose_action_scenario(_difficulty))
+
+
+@scenario("process_round")
+def process_round(app, rng):
+    state = app.st.session_state
+
+    def before():
+        if "battle" not in state or state.battle.is_over():
+            app.start_battle("Medium")
+            app.reset_battle_log()
+        player = state.battle.player
+        moves = ["rest"]
+        if player.stamina >= 15:
+            moves.append("attack")
+        if player.stamina >= 10:
+            moves.append("defend")
+        if player.special_meter >= 100 and player.stamina >= 25:
+            moves.append("special")
+        state.current_player_action = rng.choice(moves)
+
+    return before, app.process_round
+
+
+def create_bench_room(app):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM multiplayer_rooms WHERE room_code = ?", (ROOM_CODE,))
+        conn.execute(
+            "INSERT INTO multiplayer_rooms (room_code, player1, player2, game_state) VALUES (?, ?, ?, 'playing')",
+            (ROOM_CODE, "bench_p1", "bench_p2"),
+        )
+
+
+@scenario("process_multiplayer_turn")
+def process_multiplayer_turn(app, rng):
+    create_bench_room(app)
+
+    def before():
+        # Keep both fighters healthy so every op is an ordinary mid-match turn.
+        db.rollback_stale()
+        with db.transaction() as conn:
+            conn.execute(
+                """UPDATE multiplayer_rooms
+                   SET player1_move = ?, player2_move = ?, player1_ready = 1, player2_ready = 1,
+                       player1_hp = 140, player2_hp = 140, game_state = 'playing'
+                   WHERE room_code = ?""",
+                (rng.choice(MOVES), rng.choice(MOVES), ROOM_CODE),
+            )
+
+    return before, lambda: app.rooms.process_multiplayer_turn(ROOM_CODE)
+
+
+@scenario("create_room")
+def create_room(app, rng):
+    return None, lambda: app.rooms.create_room("bench_host")
+
+
+@scenario("update_player_move")
+def update_player_move(app, rng):
+    create_bench_room(app)
+
+    def before():
+        with db.transaction() as conn:
+            conn.execute(
+                "UPDATE multiplayer_rooms SET player1_move = NULL, player1_ready = 0 WHERE room_code = ?",
+                (ROOM_CODE,),
+            )
+
+    return before, lambda: app.rooms.update_player_move(ROOM_CODE, "bench_p1", rng.choice(MOVES))
+
+
+@scenario("get_room_state")
+def get_room_state(app, rng):
+    create_bench_room(app)
+    return None, lambda: app.rooms.get_room_state(ROOM_CODE)
+
+
+@scenario("get_room_events")
+def get_room_events(app, rng):
+    # A long match's worth of turns; each poll after a turn fetches just the newest one.
+    next_turn, play = process_multiplayer_turn(app, rng)
+    for _ in range(200):
+        next_turn()
+        play()
+    last_seq = app.rooms.get_room_events(ROOM_CODE)[-1]["seq"]
+    return None, lambda: app.rooms.get_room_events(ROOM_CODE, last_seq - 1)
+
+
+@scenario("update_user_xp_fixed")
+def update_user_xp_fixed(app, rng):
+    app.update_user_xp_fixed(USERNAME, 0, won=True)
+    return None, lambda: app.update_user_xp_fixed(USERNAME, rng.randint(10, 250), won=rng.random() < 0.5)
+
+
+@scenario("xp_required_for_level", inner=60)
+def xp_required_for_level(app, rng):
+    xp_required_for_level = app.xp_required_for_level
+
+    def op():
+        for level in range(1, 61):
+            xp_required_for_level(level)
+
+    return None, op
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(before, op, seconds, min_ops=20, inner=1):
+    """Time ``op`` repeatedly; returns ops/sec and latency percentiles in microseconds."""
+    for _ in range(3):
+        if before:
+            before()
+        op()
+
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < min_ops or time.perf_counter() < deadline:
+        if before:
+            before()
+        start = time.perf_counter_ns()
+        op()
+        samples.append(time.perf_counter_ns() - start)
+
+    samples.sort()
+    total = sum(samples)
+    return {
+        "ops": len(samples) * inner,
+        "ops_per_sec": len(samples) * inner / (total / 1e9) if total else float("inf"),
+        "p50_us": percentile(samples, 0.50) / inner / 1000,
+        "p99_us": percentile(samples, 0.99) / inner / 1000,
+    }
+
+
+def run(only=None, seconds=1.0, seed=0):
+    """Run every (or every matching) scenario and return ``{name: result}``."""
+    workdir = tempfile.mkdtemp(prefix="lebronsim-bench-")
+    results = {}
+    try:
+        app = load_app(os.path.join(workdir, "bench.db"))
+        for name, factory, inner in SCENARIOS:
+            if only and not any(part in name for part in only):
+                continue
+            rng = random.Random(seed)
+            try:
+                before, op = factory(app, rng)
+                results[name] = measure(before, op, seconds, inner=inner)
+            except Exception as exc:
+                results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+    finally:
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Names of scenarios whose p50 regressed by more than ``threshold`` (or newly fail)."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "error" in base:
+            continue
+        if "error" in result or result["p50_us"] > base["p50_us"] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, indent=2, sort_keys=True)
+
+
+def report(results, baseline=None):
+    print(f"{'scenario':<28}{'ops/sec':>14}{'p50 us':>12}{'p99 us':>12}{'vs base':>10}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<28}  ERROR {result['error']}")
+            continue
+        change = ""
+        base = (baseline or {}).get(name)
+        if base and "error" not in base:
+            change = f"{result['p50_us'] / base['p50_us'] - 1:+.0%}"
+        print(f"{name:<28}{result['ops_per_sec']:>14,.0f}{result['p50_us']:>12.2f}{result['p99_us']:>12.2f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LeBron engine, progression and DB paths")
+    parser.add_argument("--only", nargs="*", default=None, help="run scenarios whose name contains any of these")
+    parser.add_argument("--seconds", type=float, default=1.0, help="timed slice per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed p50 slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument("--json", default=None, help="also write this run's results to a file")
+    args = parser.parse_args()
+
+    results = run(args.only, args.seconds, args.seed)
+    baseline = load_baseline(args.baseline)
+    report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save to record one.")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"Regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,219 @@
+"""Bulk user import and export for moving leagues between deployments.
+
+Both directions stream, so memory stays flat however many users there are.
+Imports read CSV or JSONL a batch at a time. Plain-text passwords are hashed
+on a process pool while the previous batch is written, and each batch is one
+``executemany`` in one transaction. Passwords that are already bcrypt hashes
+(e.g. from ``export --with-passwords`` on another deployment) are stored as
+they are. Exports walk a cursor instead of calling ``fetchall``.
+
+    python -m bulk_users import league.csv --workers 4
+    python -m bulk_users export league.jsonl --with-passwords
+
+Columns (CSV header or JSONL keys): ``username``, ``password`` and, optionally,
+``xp``, ``level``, ``wins``, ``losses``, ``multiplayer_wins`` and
+``multiplayer_losses``. A level below what the XP has earned is raised to match.
+The format comes from the file extension unless ``--format`` is given; ``-``
+means stdin or stdout.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import bcrypt
+
+import auth
+import db
+import migrations
+from progression import levels_for_xp
+
+BATCH_SIZE = 2000
+COUNTERS = ("xp", "level", "wins", "losses", "multiplayer_wins", "multiplayer_losses")
+EXPORT_COLUMNS = ("username",) + COUNTERS
+BCRYPT_HASH = re.compile(rb"^\$2[aby]\$\d\d\$[./A-Za-z0-9]{53}$")
+
+INSERT_SQL = f"""
+    INSERT INTO users (username, password, {", ".join(COUNTERS)})
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(username) DO NOTHING
+"""
+# --on-conflict update: keep the existing password when the file has none, and
+# revoke the user's session tokens when it changes
+UPSERT_SQL = INSERT_SQL.replace(
+    "DO NOTHING",
+    "DO UPDATE SET password = COALESCE(excluded.password, users.password), "
+    "token_generation = token_generation + (excluded.password IS NOT NULL AND excluded.password IS NOT users.password), "
+    + ", ".join(f"{name} = excluded.{name}" for name in COUNTERS),
+)
+
+
+def file_format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"can't tell the format of {path!r}; pass --format csv or --format jsonl")
+
+
+def read_rows(f, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def prepare(row):
+    """``(username, password, counters, needs_hash)`` for one input row, or None if it is unusable."""
+    username = (row.get("username") or "").strip()
+    if not username:
+        return None
+    try:
+        counters = [int(row.get(name) or 0) for name in COUNTERS]
+    except (TypeError, ValueError):
+        return None
+    password = row.get("password") or None
+    if password is None:
+        return username, None, counters, False
+    password = password.encode()
+    if BCRYPT_HASH.match(password):
+        return username, password, counters, False
+    return username, password, counters, True
+
+
+def hash_one(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def write_batch(conn, sql, prepared, hashes):
+    """Insert one batch in one transaction; returns how many rows changed."""
+    levels = levels_for_xp([counters[0] for _, _, counters, _ in prepared])
+    params = []
+    for (username, password, counters, needs_hash), level in zip(prepared, levels):
+        if needs_hash:
+            password = next(hashes)
+        counters[1] = max(counters[1], int(level))
+        params.append((username, password, *counters))
+    before = conn.total_changes
+    with db.transaction(conn.path, immediate=True):
+        conn.executemany(sql, params)
+    return conn.total_changes - before
+
+
+def import_users(f, fmt, on_conflict="skip", workers=None, batch_size=BATCH_SIZE, rounds=None, path=None):
+    """Stream users from ``f`` into the users table; returns counts and timing."""
+    start = time.perf_counter()
+    migrations.migrate(path)
+    conn = db.connect(path)
+    sql = UPSERT_SQL if on_conflict == "update" else INSERT_SQL
+    rounds = rounds or auth.BCRYPT_ROUNDS
+    workers = workers or os.cpu_count() or 1
+    stats = {"read": 0, "invalid": 0, "hashed": 0, "passed_through": 0, "written": 0}
+
+    rows = read_rows(f, fmt)
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        # hash batch N on the pool while batch N-1 is written
+        pending = None
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                break
+            stats["read"] += len(chunk)
+            prepared = [item for item in map(prepare, chunk) if item is not None]
+            stats["invalid"] += len(chunk) - len(prepared)
+            plain = [password for _, password, _, needs_hash in prepared if needs_hash]
+            stats["hashed"] += len(plain)
+            stats["passed_through"] += sum(1 for _, password, _, needs_hash in prepared if password and not needs_hash)
+            if pool:
+                hashes = pool.map(hash_one, plain, itertools.repeat(rounds),
+                                  chunksize=max(1, len(plain) // (workers * 4)))
+            else:
+                hashes = map(hash_one, plain, itertools.repeat(rounds))
+            if pending:
+                stats["written"] += write_batch(conn, sql, *pending)
+            pending = (prepared, iter(hashes))
+        if pending:
+            stats["written"] += write_batch(conn, sql, *pending)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def export_users(f, fmt, with_passwords=False, path=None):
+    """Stream every user to ``f``, one row at a time; returns counts and timing."""
+    start = time.perf_counter()
+    columns = EXPORT_COLUMNS + (("password",) if with_passwords else ())
+    cursor = db.connect(path).execute(f"SELECT {', '.join(columns)} FROM users ORDER BY username")
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(columns)
+    exported = 0
+    for row in cursor:
+        if with_passwords and isinstance(row[-1], bytes):
+            row = row[:-1] + (row[-1].decode(),)
+        if fmt == "csv":
+            writer.writerow(row)
+        else:
+            f.write(json.dumps(dict(zip(columns, row))) + "\n")
+        exported += 1
+    return {"exported": exported, "seconds": time.perf_counter() - start}
+
+
+def open_file(path, mode):
+    if path == "-":
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export users in bulk")
+    parser.add_argument("--db", default=None, help="database file (default: LEBRONSIM_DB or users.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="create users from a CSV or JSONL file")
+    import_parser.add_argument("file", help="input file, or - for stdin")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    import_parser.add_argument("--on-conflict", choices=["skip", "update"], default="skip",
+                               help="what to do with usernames that already exist")
+    import_parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: one per CPU)")
+    import_parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="rows per transaction")
+    import_parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost (default: LEBRONSIM_BCRYPT_ROUNDS)")
+
+    export_parser = commands.add_parser("export", help="write every user's stats to a CSV or JSONL file")
+    export_parser.add_argument("file", help="output file, or - for stdout")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    export_parser.add_argument("--with-passwords", action="store_true", help="include bcrypt hashes, for re-import elsewhere")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db.DB_PATH = args.db
+    fmt = file_format(args.file, args.format)
+    if args.command == "import":
+        with open_file(args.file, "r") as f:
+            stats = import_users(f, fmt, args.on_conflict, args.workers, args.batch, args.rounds)
+        print(f"read {stats['read']:,} rows, wrote {stats['written']:,} users in {stats['seconds']:.1f}s "
+              f"({stats['hashed']:,} hashed, {stats['passed_through']:,} already hashed, {stats['invalid']:,} invalid)",
+              file=sys.stderr)
+    else:
+        with open_file(args.file, "w") as f:
+            stats = export_users(f, fmt, args.with_passwords)
+        print(f"exported {stats['exported']:,} users in {stats['seconds']:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
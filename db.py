@@ -0,0 +1,184 @@
+"""Shared SQLite connections for the app.
+
+Every thread gets one long-lived connection per database file instead of a
+connect/close per statement.  Connections are opened in WAL mode with
+``synchronous=NORMAL``, a busy timeout and a prepared statement cache, and
+count their own statements, time, commits and lock errors.
+
+Streamlit runs each rerun on a fresh script thread, so a thread that needs a
+connection first adopts one whose owner thread has exited before opening a new
+one.  The pool therefore grows to the peak number of concurrent threads and
+no further.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DB_PATH = os.environ.get("LEBRONSIM_DB", "users.db")
+BUSY_TIMEOUT = 5.0
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_pool = []
+_pool_lock = threading.Lock()
+
+
+class Cursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return self.timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.timed(super().executemany, sql, seq_of_parameters)
+
+    def timed(self, run, sql, parameters):
+        stats = self.connection.stats
+        start = time.perf_counter()
+        try:
+            return run(sql, parameters)
+        except sqlite3.OperationalError as exc:
+            if "locked" in str(exc) or "busy" in str(exc):
+                stats["busy_errors"] += 1
+            raise
+        finally:
+            stats["statements"] += 1
+            stats["seconds"] += time.perf_counter() - start
+
+
+class Connection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.owner = threading.current_thread()
+        self.closed = False
+        self.stats = {
+            "opened": time.time(),
+            "statements": 0,
+            "seconds": 0.0,
+            "commits": 0,
+            "rollbacks": 0,
+            "busy_errors": 0,
+            "adoptions": 0,
+            "lock_waits": 0,
+            "lock_wait_seconds": 0.0,
+            "lock_wait_max": 0.0,
+        }
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self.stats["commits"] += 1
+        super().commit()
+
+    def rollback(self):
+        self.stats["rollbacks"] += 1
+        super().rollback()
+
+    def close(self):
+        # seen by connect() on whichever thread still holds this connection
+        self.closed = True
+        super().close()
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT,
+        factory=Connection,
+        cached_statements=CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    conn.path = path
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _pool_lock:
+        _pool.append(conn)
+    return conn
+
+
+def _adopt(path):
+    thread = threading.current_thread()
+    with _pool_lock:
+        for conn in _pool:
+            if conn.path == path and not conn.owner.is_alive():
+                conn.owner = thread
+                break
+        else:
+            return None
+    if conn.in_transaction:
+        conn.rollback()
+    conn.stats["adoptions"] += 1
+    return conn
+
+
+def connect(path=None):
+    """This thread's connection to ``path`` (default ``DB_PATH``); never close it."""
+    path = path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None or conn.closed:
+        conn = connections[path] = _adopt(path) or _open(path)
+    return conn
+
+
+@contextmanager
+def transaction(path=None, immediate=False):
+    """Commit on success, roll back on error; ``immediate`` takes the write lock up front.
+
+    The time spent waiting for that lock is added to the connection's stats.
+    """
+    conn = connect(path)
+    if immediate:
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        waited = time.perf_counter() - start
+        conn.stats["lock_waits"] += 1
+        conn.stats["lock_wait_seconds"] += waited
+        conn.stats["lock_wait_max"] = max(conn.stats["lock_wait_max"], waited)
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def rollback_stale(path=None):
+    """Roll back a transaction an earlier error left open on this thread's connection."""
+    conn = connect(path)
+    if conn.in_transaction:
+        conn.rollback()
+
+
+def stats():
+    """One dict of counters per pooled connection."""
+    with _pool_lock:
+        connections = list(_pool)
+    return [
+        dict(conn.stats, path=conn.path, thread=conn.owner.name, alive=conn.owner.is_alive())
+        for conn in connections
+    ]
+
+
+def close_all():
+    """Close every pooled connection (tests and shutdown only).
+
+    Threads still holding one open a fresh connection on their next ``connect``.
+    """
+    with _pool_lock:
+        connections = list(_pool)
+        _pool.clear()
+    for conn in connections:
+        conn.close()
@@ -0,0 +1,540 @@
+"""Headless combat engine for the single player LeBron battle.
+
+Nothing in here touches Streamlit: a ``Battle`` owns its fighters and its own
+seeded ``random.Random`` and returns structured log events, so the same code
+drives the UI, batch jobs, benchmarks and replays.
+"""
+
+import random
+
+import expectimax
+import policy_table
+
+
+class Player:
+    def __init__(self, name, health, stamina, special_meter=0, rng=None):
+        self.name = name
+        self.rng = rng if rng is not None else random
+        self.max_health = health
+        self.health = health
+        self.max_stamina = 100
+        self.stamina = stamina
+        self.special_meter = special_meter
+        self.is_defending = False
+        self.buffs = []
+        self.debuffs = []
+
+    def attack(self):
+        if self.stamina < 15:
+            return (0, f"{self.name} is too tired to attack!")
+        self.stamina -= 15
+        self.special_meter += 10
+        if self.special_meter > 100:
+            self.special_meter = 100
+        base_damage = self.rng.randint(15, 30)
+        critical = self.rng.random() < 0.2
+        if critical:
+            base_damage = int(base_damage * 1.5)
+            return (base_damage, f"{self.name} lands a CRITICAL hit for {base_damage} damage!")
+        return (base_damage, f"{self.name} attacks for {base_damage} damage!")
+
+    def special_attack(self):
+        if self.special_meter < 100:
+            return (0, f"{self.name} doesn't have enough energy for a special attack!")
+        self.special_meter = 0
+        self.stamina -= 25
+        if self.stamina < 0:
+            self.stamina = 0
+        damage = self.rng.randint(40, 60)
+        return (damage, f"{self.name} unleashes a SPECIAL ATTACK for {damage} massive damage!")
+
+    def defend(self):
+        self.stamina -= 10
+        if self.stamina < 0:
+            self.stamina = 0
+        self.is_defending = True
+        self.special_meter += 15
+        if self.special_meter > 100:
+            self.special_meter = 100
+        return f"{self.name} takes a defensive stance, ready to reduce and heal from incoming damage!"
+
+    def rest(self):
+        gained = self.rng.randint(25, 40)
+        self.stamina += gained
+        if self.stamina > self.max_stamina:
+            self.stamina = self.max_stamina
+        self.special_meter += 5
+        if self.special_meter > 100:
+            self.special_meter = 100
+        return f"{self.name} rests and recovers {gained} stamina."
+
+    def take_damage(self, damage):
+        if self.is_defending:
+            damage = int(damage * 0.5)
+            result = f"{self.name} blocks and reduces damage to {damage}!"
+            self.is_defending = False
+        else:
+            result = f"{self.name} takes {damage} damage!"
+        self.health -= damage
+        if self.health < 0:
+            self.health = 0
+        return result
+
+    def is_alive(self):
+        return self.health > 0
+
+    def reset_turn(self):
+        self.is_defending = False
+
+
+class LeBron(Player):
+    def __init__(self, difficulty, rng=None):
+        health = 100 if difficulty == "Easy" else 160 if difficulty == "Medium" else 180
+        super().__init__("LeBron James", health, 100, rng=rng)
+        self.difficulty = difficulty
+        self.special_move_name = "Signature Slam Dunk"
+        self.abilities = {
+            "POSTERIZER": "Quick attack that has a chance to lower opponent's stamina",
+            "BLOCKED BY JAMES": "Strong defensive move that also recovers stamina",
+            "ALLEY-OOP TO DAVIS": "Tactical move that increases special meter gain",
+            f"{self.special_move_name}": "Devastating special attack that deals massive damage",
+        }
+        self.move_patterns = self.set_move_patterns()
+        self.consecutive_attacks = 0
+        self.consecutive_defends = 0
+        self.player_last_hp = 140
+        self.player_pattern_memory = []
+        self.turn_count = 0
+        self.player_last_stamina = 100
+        self.search = expectimax.Expectimax(health) if difficulty == "Nightmare" else None
+
+    def set_move_patterns(self):
+        if self.difficulty == "Easy":
+            return {"attack": 0.4, "defend": 0.3, "rest": 0.25, "special": 0.05}
+        elif self.difficulty == "Medium":
+            return {"attack": 0.45, "defend": 0.25, "rest": 0.2, "special": 0.1}
+        else:
+            return {"attack": 0.5, "defend": 0.2, "rest": 0.15, "special": 0.15}
+
+    def analyze_player_pattern(self, player):
+        if self.difficulty == "Easy":
+            return
+
+        damage_taken = self.player_last_hp - player.health
+        self.player_last_hp = player.health
+        player_move = None
+
+        if damage_taken > 0:
+            if damage_taken > 35:
+                player_move = "special"
+            else:
+                player_move = "attack"
+        elif player.stamina > self.player_last_stamina:
+            player_move = "rest"
+        elif player.is_defending:
+            player_move = "defend"
+
+        self.player_last_stamina = player.stamina
+
+        if player_move:
+            self.player_pattern_memory.append(player_move)
+            if len(self.player_pattern_memory) > 3:
+                self.player_pattern_memory.pop(0)
+
+    def predict_player_action(self):
+        if len(self.player_pattern_memory) < 2 or self.difficulty == "Easy":
+            return None
+
+        if self.difficulty == "Hard":
+            if self.player_pattern_memory[-1] == "rest":
+                return "attack"
+            if self.player_pattern_memory.count("attack") >= 2:
+                return "special"
+            if "special" in self.player_pattern_memory:
+                return "rest"
+        return None
+
+    def choose_action(self, player=None):
+        self.turn_count += 1
+        if player:
+            self.analyze_player_pattern(player)
+
+        if self.search is not None and player is not None:
+            chosen_action = self.search.choose(self, player)
+            self.update_streaks(chosen_action)
+            return chosen_action
+
+        chosen_action, streak = policy_table.decide(self, player, self.rng)
+        if streak:
+            self.update_streaks(chosen_action)
+        return chosen_action
+
+    def update_streaks(self, chosen_action):
+        if chosen_action == "attack":
+            self.consecutive_attacks += 1
+            self.consecutive_defends = 0
+        elif chosen_action == "defend":
+            self.consecutive_defends += 1
+            self.consecutive_attacks = 0
+        else:
+            self.consecutive_attacks = 0
+            self.consecutive_defends = 0
+
+    def reference_decide(self, player=None):
+        """Weight-by-weight decision that ``policy_table`` is compiled from.
+
+        Kept as the source of truth for ``policy_table.verify``; the game itself
+        goes through the compiled table in ``choose_action``.
+        """
+        weights = {
+            "attack": self.move_patterns["attack"],
+            "defend": self.move_patterns["defend"],
+            "rest": self.move_patterns["rest"],
+            "special": 0 if self.special_meter < 100 else self.move_patterns["special"],
+        }
+
+        if self.stamina <= 30:
+            rest_urgency = (30 - self.stamina) / 30
+            weights["rest"] *= 1 + 2 * rest_urgency
+            if self.stamina < 15:
+                return "rest"
+        else:
+            weights["rest"] *= 0.2
+
+        if self.difficulty in ["Hard", "Medium"]:
+            if self.health < self.max_health * 0.3:
+                weights["defend"] *= 2.0
+
+            predicted_move = self.predict_player_action()
+            if predicted_move == "special" and player and player.special_meter >= 75:
+                weights["defend"] *= 3.0
+
+            if self.special_meter >= 100 and player and player.health < player.max_health * 0.4:
+                return "special"
+
+            if self.consecutive_attacks >= 2:
+                weights["attack"] *= 0.5
+
+            if self.consecutive_defends >= 2:
+                weights["defend"] *= 0.3
+
+            if self.special_meter >= 100:
+                special_threshold = 0.8 if self.difficulty == "Hard" else 0.6
+                if self.rng.random() < special_threshold:
+                    return "special"
+
+            if player and player.is_defending:
+                weights["attack"] *= 0.4
+                weights["rest"] *= 1.5
+
+        if self.difficulty == "Hard":
+            if 15 < self.stamina < 40:
+                weights["rest"] *= 1.5
+            if player and player.health < player.max_health * 0.3:
+                weights["attack"] *= 1.5
+            if self.turn_count < 5 and self.health > self.max_health * 0.8:
+                weights["defend"] *= 1.3
+
+        if self.stamina > 50:
+            weights["attack"] *= 1.3
+
+        actions = list(weights.keys())
+        weights_list = list(weights.values())
+        chosen_action = self.rng.choices(actions, weights=weights_list)[0]
+
+        if chosen_action == "rest" and self.stamina > 30:
+            weights["rest"] = 0.1
+            actions = list(weights.keys())
+            weights_list = list(weights.values())
+            chosen_action = self.rng.choices(actions, weights=weights_list)[0]
+
+        self.update_streaks(chosen_action)
+        return chosen_action
+
+    def attack(self):
+        damage, msg = super().attack()
+        poster_chance = 0.2 if self.difficulty == "Easy" else 0.35 if self.difficulty == "Medium" else 0.5
+        if self.rng.random() < poster_chance:
+            return (damage, "LeBron POSTERS YOU for " + str(damage) + " damage and reduces your stamina!")
+        return (damage, msg)
+
+    def special_attack(self):
+        damage, _ = super().special_attack()
+        if self.difficulty == "Medium":
+            damage = int(damage * 1.1)
+        elif self.difficulty in ("Hard", "Nightmare"):
+            damage = int(damage * 1.2)
+        return (damage, f"LeBron unleashes his {self.special_move_name} for {damage} MASSIVE damage!")
+
+    def take_damage(self, damage):
+        if self.is_defending:
+            reduction = 0.5
+            reduced_damage = int(damage * (1 - reduction))
+            heal_percent = 0.5
+            heal_amount = int(reduced_damage * heal_percent)
+            self.health += heal_amount
+            if self.health > self.max_health:
+                self.health = self.max_health
+            self.health -= reduced_damage
+            if self.health < 0:
+                self.health = 0
+            self.is_defending = False
+            return f"{self.name} blocks and reduces damage to {reduced_damage}, then heals {heal_amount} health!"
+        else:
+            self.health -= damage
+            if self.health < 0:
+                self.health = 0
+            return f"{self.name} takes {damage} damage!"
+
+
+def new_seed():
+    return random.SystemRandom().randrange(2**63)
+
+
+class Battle:
+    """One Player vs LeBron fight, resolved a round at a time."""
+
+    def __init__(self, difficulty="Medium", seed=None, player_name="You"):
+        self.difficulty = difficulty
+        self.seed = new_seed() if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.player = Player(player_name, 140, 100, rng=self.rng)
+        self.lebron = LeBron(difficulty, rng=self.rng)
+        self.round = 1
+        self.turn = 0
+        self.animation_state = None
+        self.actions = []
+
+    @classmethod
+    def replay(cls, difficulty, seed, actions, player_name="You"):
+        """Rebuild a battle by feeding the recorded player actions back in."""
+        battle = cls(difficulty, seed=seed, player_name=player_name)
+        for action in actions:
+            battle.play_round(action)
+        return battle
+
+    def event(self, events, message, entry_type, action=None, damage=0):
+        events.append(
+            {
+                "round": self.round,
+                "type": entry_type,
+                "message": message,
+                "action": action,
+                "damage": damage,
+            }
+        )
+
+    def is_over(self):
+        return not (self.player.is_alive() and self.lebron.is_alive())
+
+    def outcome(self):
+        """Return "win", "loss" or "tie" once the battle is over, else None."""
+        if not self.is_over():
+            return None
+        if not self.player.is_alive() and not self.lebron.is_alive():
+            return "tie"
+        return "win" if self.player.is_alive() else "loss"
+
+    def play_round(self, player_action):
+        """Resolve a simultaneous round and return its log events."""
+        player = self.player
+        lebron = self.lebron
+        events = []
+        self.actions.append(player_action)
+
+        lebron_action = lebron.choose_action(player)
+        player_damage = 0
+        lebron_damage = 0
+
+        self.event(events, f"Round {self.round} begins - both fighters prepare their moves!", "system")
+
+        if player_action == "defend":
+            self.event(events, player.defend(), "player", "defend")
+            self.animation_state = "player_defend"
+
+        if lebron_action == "defend":
+            self.event(events, lebron.defend(), "lebron", "defend")
+            self.animation_state = "lebron_defend"
+
+        if player_action == "attack":
+            player_damage, msg = player.attack()
+            self.event(events, msg, "player", "attack", player_damage)
+            self.animation_state = "player_attack"
+        elif player_action == "special":
+            player_damage, msg = player.special_attack()
+            self.event(events, msg, "player", "special", player_damage)
+            self.animation_state = "player_special"
+        elif player_action == "rest":
+            self.event(events, player.rest(), "player", "rest")
+            self.animation_state = "player_rest"
+
+        if lebron_action == "attack":
+            lebron_damage, msg = lebron.attack()
+            self.event(events, msg, "lebron", "attack", lebron_damage)
+        elif lebron_action == "special":
+            lebron_damage, msg = lebron.special_attack()
+            self.event(events, msg, "lebron", "special", lebron_damage)
+        elif lebron_action == "rest":
+            self.event(events, lebron.rest(), "lebron", "rest")
+
+        if player_damage > 0:
+            self.event(events, lebron.take_damage(player_damage), "lebron")
+        if lebron_damage > 0:
+            self.event(events, player.take_damage(lebron_damage), "player")
+
+        player.reset_turn()
+        lebron.reset_turn()
+        self.round += 1
+        return events
+
+    def lebron_turn(self):
+        """Resolve a turn-based LeBron move and return its log events."""
+        lebron = self.lebron
+        player = self.player
+        events = []
+        action = lebron.choose_action()
+        self.animation_state = f"lebron_{action}"
+
+        if action == "attack":
+            dmg, msg = lebron.attack()
+            self.event(events, msg, "lebron", "attack", dmg)
+            if dmg > 0:
+                self.event(events, player.take_damage(dmg), "player")
+
+        elif action == "defend":
+            self.event(events, lebron.defend(), "lebron", "defend")
+
+        elif action == "rest":
+            self.event(events, lebron.rest(), "lebron", "rest")
+
+        elif action == "special":
+            dmg, msg = lebron.special_attack()
+            self.event(events, msg, "lebron", "special", dmg)
+            if dmg > 0:
+                self.event(events, player.take_damage(dmg), "player")
+
+        self.turn += 1
+
+        if self.turn % 2 == 0:
+            player.reset_turn()
+            lebron.reset_turn()
+            self.round += 1
+            self.event(events, f"Round {self.round} begins!", "system")
+        return events
+
+
+PVP_HEALTH = 140
+PVP_WINS_NEEDED = 2
+
+
+def pvp_move(move, stamina, special, rng):
+    """One side of a PvP turn; returns (damage, stamina, special, defending)."""
+    damage = 0
+    defending = False
+    if move == "attack":
+        if stamina >= 15:
+            damage = rng.randint(15, 30)
+            if rng.random() < 0.2:
+                damage = int(damage * 1.5)
+            stamina -= 15
+            special = min(special + 10, 100)
+    elif move == "defend":
+        if stamina >= 10:
+            stamina -= 10
+            special = min(special + 15, 100)
+            defending = True
+    elif move == "rest":
+        stamina = min(stamina + rng.randint(25, 40), 100)
+        special = min(special + 5, 100)
+    elif move == "special":
+        if special >= 100 and stamina >= 25:
+            damage = rng.randint(40, 60)
+            special = 0
+            stamina = max(stamina - 25, 0)
+    return damage, stamina, special, defending
+
+
+def resolve_pvp_turn(room, rng):
+    """Resolve one PvP turn from a room snapshot without touching the database.
+
+    ``room`` is a ``multiplayer_rooms`` row as a dict with both moves set.
+    Returns the column ``updates`` to write, a compact ``turn`` record of what
+    happened, and the match winner/loser once someone reaches two round wins.
+    """
+    p1_damage, p1_stamina, p1_special, p1_defending = pvp_move(
+        room["player1_move"], room["player1_stamina"], room["player1_special"], rng
+    )
+    p2_damage, p2_stamina, p2_special, p2_defending = pvp_move(
+        room["player2_move"], room["player2_stamina"], room["player2_special"], rng
+    )
+    if p1_defending:
+        p2_damage = int(p2_damage * 0.5)
+    if p2_defending:
+        p1_damage = int(p1_damage * 0.5)
+
+    p1_hp = max(room["player1_hp"] - p2_damage, 0)
+    p2_hp = max(room["player2_hp"] - p1_damage, 0)
+    turn = {
+        "match_round": room["match_round"],
+        "round": room["current_round"],
+        "player1_move": room["player1_move"],
+        "player2_move": room["player2_move"],
+        "player1_damage": p1_damage,
+        "player2_damage": p2_damage,
+        "player1_hp": p1_hp,
+        "player2_hp": p2_hp,
+        "player1_stamina": p1_stamina,
+        "player2_stamina": p2_stamina,
+        "player1_special": p1_special,
+        "player2_special": p2_special,
+    }
+    updates = {
+        "player1_hp": p1_hp,
+        "player2_hp": p2_hp,
+        "player1_stamina": p1_stamina,
+        "player2_stamina": p2_stamina,
+        "player1_special": p1_special,
+        "player2_special": p2_special,
+        "current_round": room["current_round"] + 1,
+        "player1_move": None,
+        "player2_move": None,
+        "player1_ready": 0,
+        "player2_ready": 0,
+        "current_turn": 2 if room["current_turn"] == 1 else 1,
+    }
+    result = {"updates": updates, "turn": turn, "round_winner": None, "match_winner": None, "match_loser": None}
+    if p1_hp > 0 and p2_hp > 0:
+        return result
+
+    p1_wins = room["player1_wins"]
+    p2_wins = room["player2_wins"]
+    match_round = room["match_round"]
+    if p1_hp <= 0 and p2_hp > 0:
+        result["round_winner"] = room["player2"]
+        p2_wins += 1
+        match_round += 1
+    elif p2_hp <= 0 and p1_hp > 0:
+        result["round_winner"] = room["player1"]
+        p1_wins += 1
+        match_round += 1
+    updates.update(player1_wins=p1_wins, player2_wins=p2_wins, match_round=match_round)
+
+    if p1_wins >= PVP_WINS_NEEDED or p2_wins >= PVP_WINS_NEEDED:
+        winner, loser = ("player1", "player2") if p1_wins >= PVP_WINS_NEEDED else ("player2", "player1")
+        result["match_winner"] = room[winner]
+        result["match_loser"] = room[loser]
+        updates.update(game_state="match_over", winner=room[winner])
+    else:
+        updates.update(
+            player1_hp=PVP_HEALTH,
+            player2_hp=PVP_HEALTH,
+            player1_stamina=100,
+            player2_stamina=100,
+            player1_special=0,
+            player2_special=0,
+            current_round=1,
+            current_turn=1,
+            game_state="playing",
+            winner=None,
+        )
+    return result
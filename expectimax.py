@@ -0,0 +1,229 @@
+"""Depth-limited expectimax search behind the Nightmare LeBron.
+
+LeBron is the max node; the player's simultaneous move and every damage, crit
+and rest roll are chance nodes.  Roll distributions are the real ones from
+``engine.Player`` (15-30 with a 20% x1.5 crit, 40-60 specials, 25-40 rest)
+split into equal-mass buckets that keep their conditional mean, and the player
+is modelled as picking uniformly among the moves the UI leaves enabled.
+
+Search runs by iterative deepening against a wall clock budget per move, so a
+decision never costs more than ``budget`` seconds however busy the server is.
+Finished subtrees go into a transposition table keyed by a packed integer of
+the six round-start numbers plus the remaining depth.
+"""
+
+import time
+
+ATTACK, DEFEND, REST, SPECIAL = 0, 1, 2, 3
+ACTIONS = ("attack", "defend", "rest", "special")
+
+WIN, LOSS, TIE = 1.0, -1.0, 0.0
+
+
+class OutOfTime(Exception):
+    pass
+
+
+def attack_pmf():
+    pmf = {}
+    for base in range(15, 31):
+        pmf[base] = pmf.get(base, 0) + 0.8 / 16
+        crit = int(base * 1.5)
+        pmf[crit] = pmf.get(crit, 0) + 0.2 / 16
+    return pmf
+
+
+def uniform_pmf(low, high, multiplier=None):
+    pmf = {}
+    for value in range(low, high + 1):
+        if multiplier:
+            value = int(value * multiplier)
+        pmf[value] = pmf.get(value, 0) + 1 / (high - low + 1)
+    return pmf
+
+
+def buckets(pmf, count):
+    """Split a pmf into ``count`` equal-mass groups of (probability, mean value)."""
+    groups = []
+    mass = 0.0
+    total = 0.0
+    edge = 1 / count
+    for value, p in sorted(pmf.items()):
+        mass += p
+        total += value * p
+        if mass >= edge * (len(groups) + 1) - 1e-9 and len(groups) < count - 1:
+            groups.append((mass, total))
+    groups.append((mass, total))
+    result = []
+    previous_mass = previous_total = 0.0
+    for mass, total in groups:
+        p = mass - previous_mass
+        if p > 1e-12:
+            result.append((p, int(round((total - previous_total) / p))))
+        previous_mass, previous_total = mass, total
+    return tuple(result)
+
+
+def pack(state):
+    p_hp, p_st, p_m, l_hp, l_st, l_m = state
+    return (((((p_hp << 7 | p_st) << 7 | p_m) << 8 | l_hp) << 7 | l_st) << 7) | l_m
+
+
+class Expectimax:
+    def __init__(self, lebron_max_health=180, player_max_health=140, special_multiplier=1.2,
+                 budget=0.02, max_depth=6, rolls=3, table_size=200_000):
+        self.lebron_max_health = lebron_max_health
+        self.player_max_health = player_max_health
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table_size = table_size
+        self.table = {}
+        self.player_rolls = {
+            ATTACK: buckets(attack_pmf(), rolls),
+            SPECIAL: buckets(uniform_pmf(40, 60), rolls),
+            REST: buckets(uniform_pmf(25, 40), rolls),
+            DEFEND: ((1.0, 0),),
+        }
+        self.lebron_rolls = dict(self.player_rolls)
+        self.lebron_rolls[SPECIAL] = buckets(uniform_pmf(40, 60, special_multiplier), rolls)
+        self.deadline = 0.0
+        self.nodes = 0
+        self.last_depth = 0
+
+    def player_moves(self, p_st, p_m):
+        moves = [REST]
+        if p_st >= 15:
+            moves.append(ATTACK)
+        if p_st >= 10:
+            moves.append(DEFEND)
+        if p_m >= 100 and p_st >= 25:
+            moves.append(SPECIAL)
+        return moves
+
+    def lebron_moves(self, l_st, l_m):
+        moves = [DEFEND, REST]
+        if l_st >= 15:
+            moves.append(ATTACK)
+        if l_m >= 100:
+            moves.append(SPECIAL)
+        return moves
+
+    def resolve(self, state, p_action, l_action, p_roll, l_roll):
+        """One ``process_round`` with the rolls already decided."""
+        p_hp, p_st, p_m, l_hp, l_st, l_m = state
+        p_def = l_def = False
+        p_dmg = l_dmg = 0
+
+        if p_action == DEFEND:
+            p_st = max(p_st - 10, 0)
+            p_m = min(p_m + 15, 100)
+            p_def = True
+        if l_action == DEFEND:
+            l_st = max(l_st - 10, 0)
+            l_m = min(l_m + 15, 100)
+            l_def = True
+
+        if p_action == ATTACK and p_st >= 15:
+            p_st -= 15
+            p_m = min(p_m + 10, 100)
+            p_dmg = p_roll
+        elif p_action == SPECIAL and p_m >= 100:
+            p_m = 0
+            p_st = max(p_st - 25, 0)
+            p_dmg = p_roll
+        elif p_action == REST:
+            p_st = min(p_st + p_roll, 100)
+            p_m = min(p_m + 5, 100)
+
+        if l_action == ATTACK and l_st >= 15:
+            l_st -= 15
+            l_m = min(l_m + 10, 100)
+            l_dmg = l_roll
+        elif l_action == SPECIAL and l_m >= 100:
+            l_m = 0
+            l_st = max(l_st - 25, 0)
+            l_dmg = l_roll
+        elif l_action == REST:
+            l_st = min(l_st + l_roll, 100)
+            l_m = min(l_m + 5, 100)
+
+        if p_dmg > 0:
+            if l_def:
+                reduced = p_dmg // 2
+                l_hp = max(0, min(l_hp + reduced // 2, self.lebron_max_health) - reduced)
+            else:
+                l_hp = max(0, l_hp - p_dmg)
+        if l_dmg > 0:
+            if p_def:
+                l_dmg //= 2
+            p_hp = max(0, p_hp - l_dmg)
+        return (p_hp, p_st, p_m, l_hp, l_st, l_m)
+
+    def evaluate(self, state):
+        """Heuristic value in (-1, 1) from LeBron's side."""
+        p_hp, p_st, p_m, l_hp, l_st, l_m = state
+        score = (
+            0.8 * (l_hp / self.lebron_max_health - p_hp / self.player_max_health)
+            + 0.1 * (l_m - p_m) / 100
+            + 0.05 * (l_st - p_st) / 100
+        )
+        return max(-0.99, min(0.99, score))
+
+    def action_value(self, state, l_action, depth):
+        p_moves = self.player_moves(state[1], state[2])
+        weight = 1 / len(p_moves)
+        total = 0.0
+        for p_action in p_moves:
+            for p_prob, p_roll in self.player_rolls[p_action]:
+                for l_prob, l_roll in self.lebron_rolls[l_action]:
+                    child = self.resolve(state, p_action, l_action, p_roll, l_roll)
+                    total += weight * p_prob * l_prob * self.value(child, depth - 1)
+        return total
+
+    def value(self, state, depth):
+        p_hp, l_hp = state[0], state[3]
+        if p_hp <= 0 or l_hp <= 0:
+            if p_hp <= 0 and l_hp <= 0:
+                return TIE
+            return WIN if p_hp <= 0 else LOSS
+        if depth == 0:
+            return self.evaluate(state)
+
+        key = pack(state) << 4 | depth
+        cached = self.table.get(key)
+        if cached is not None:
+            return cached
+
+        self.nodes += 1
+        if not self.nodes & 7 and time.perf_counter() > self.deadline:
+            raise OutOfTime
+
+        best = max(self.action_value(state, a, depth) for a in self.lebron_moves(state[4], state[5]))
+        self.table[key] = best
+        return best
+
+    def search(self, state, budget=None):
+        """Best LeBron action for ``state`` within the time budget."""
+        self.deadline = time.perf_counter() + (self.budget if budget is None else budget)
+        self.nodes = 0
+        if len(self.table) > self.table_size:
+            self.table.clear()
+
+        moves = self.lebron_moves(state[4], state[5])
+        best = ATTACK if ATTACK in moves else REST
+        self.last_depth = 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                scored = [(self.action_value(state, a, depth), a) for a in moves]
+                best = max(scored)[1]
+                self.last_depth = depth
+        except OutOfTime:
+            pass
+        return ACTIONS[best]
+
+    def choose(self, lebron, player):
+        state = (
+            player.health, player.stamina, player.special_meter,
+            lebron.health, lebron.stamina, lebron.special_meter,
+        )
+        return self.search(state)
@@ -0,0 +1,840 @@
+"""Optional asyncio WebSocket server that owns the PvP rooms in memory.
+
+Run it with ``python -m game_server`` and point the app at it with
+``LEBRONSIM_GAME_SERVER=ws://127.0.0.1:8765``.  Rooms then live in this one
+process: moves are applied and turns resolved with ``engine.resolve_pvp_turn``
+(the rules ``rooms.process_multiplayer_turn`` uses), and every change is pushed
+to the room's subscribers as a diff of the columns that moved.  SQLite is only
+written by a checkpoint every ``CHECKPOINT_SECONDS``, and straight away when a
+match ends so nobody's XP waits on the timer.  The move clock runs here too: a
+heap of deadlines, one per room change, plays ``rooms.DEFAULT_MOVE`` for any
+seat still undecided ``rooms.TURN_SECONDS`` after the room last changed, both
+seats if need be, until ``rooms.MAX_IDLE_TURNS`` such turns end the match.
+
+The protocol is JSON text frames.  A request is ``{"id": n, "op": ..., ...}`` and
+its reply ``{"id": n, "ok": true, "result": ...}`` (or ``"ok": false`` with an
+``error``).  Pushes have no id: ``{"room": code, "version": v, "changes": {...},
+"events": [...]}``, or ``{"room": code, "deleted": true}``.  ``subscribe``
+replies with the whole room and its turn log; pushes follow from there until
+``unsubscribe``.  A frame that is not valid JSON or lacks a field gets an
+``"ok": false`` reply and the connection stays open.
+
+Requests name the user they act for and the server takes that on trust, so it
+only listens on a loopback address: it is a backend for Streamlit processes on
+the same machine, not something browsers connect to.  Only a room's host may
+restart or delete it.
+
+``python -m game_server --selftest`` plays thousands of matches against a
+scratch database over loopback and reports turn latency.
+"""
+
+import argparse
+import asyncio
+import heapq
+import ipaddress
+import itertools
+import json
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.asyncio.client import connect as async_connect
+from websockets.asyncio.server import broadcast, serve
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+import db
+import migrations
+import rooms
+import users
+from engine import PVP_HEALTH, resolve_pvp_turn
+
+SERVER_URL = os.environ.get("LEBRONSIM_GAME_SERVER")
+HOST = "127.0.0.1"
+PORT = 8765
+CHECKPOINT_SECONDS = 5.0
+SUBSCRIPTION_IDLE_SECONDS = 120
+REQUEST_TIMEOUT = 5.0
+MOVES = ("attack", "defend", "rest", "special")
+
+
+class GameServerError(Exception):
+    pass
+
+
+def timestamp():
+    """``CURRENT_TIMESTAMP`` as SQLite writes it, so saved rows look the same either way."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
+def new_room(room_code, player, now):
+    return {
+        "room_code": room_code,
+        "player1": player,
+        "player2": None,
+        "player1_ready": 0,
+        "player2_ready": 0,
+        "player1_move": None,
+        "player2_move": None,
+        "player1_hp": PVP_HEALTH,
+        "player2_hp": PVP_HEALTH,
+        "player1_stamina": 100,
+        "player2_stamina": 100,
+        "player1_special": 0,
+        "player2_special": 0,
+        "current_round": 1,
+        "current_turn": 1,
+        "game_state": "waiting",
+        "winner": None,
+        "created_at": now,
+        "last_action": now,
+        "player1_wins": 0,
+        "player2_wins": 0,
+        "match_round": 1,
+        "idle_turns": 0,
+        "version": 0,
+    }
+
+
+RESTART = {
+    "player1_hp": PVP_HEALTH,
+    "player2_hp": PVP_HEALTH,
+    "player1_stamina": 100,
+    "player2_stamina": 100,
+    "player1_special": 0,
+    "player2_special": 0,
+    "player1_move": None,
+    "player2_move": None,
+    "player1_ready": 0,
+    "player2_ready": 0,
+    "current_round": 1,
+    "current_turn": 1,
+    "game_state": "playing",
+    "winner": None,
+    "player1_wins": 0,
+    "player2_wins": 0,
+    "match_round": 1,
+    "idle_turns": 0,
+}
+
+
+class GameServer:
+    """Authoritative room state for one process.
+
+    Every op runs to completion on the event loop thread, so room state needs
+    no locks; SQLite work is handed to a single writer thread as a snapshot.
+    """
+
+    def __init__(self, path=None, checkpoint_seconds=CHECKPOINT_SECONDS, rng=random, turn_seconds=rooms.TURN_SECONDS):
+        self.path = path
+        self.checkpoint_seconds = checkpoint_seconds
+        self.turn_seconds = turn_seconds
+        self.deadlines = []
+        self.rng = rng
+        self.rooms = {}
+        self.events = {}
+        self.subscribers = {}
+        self.subscriptions = {}
+        self.dirty = set()
+        self.deleted = set()
+        self.unsaved_events = []
+        self.results = []
+        self.saves = set()
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="game-server-db")
+        self.columns = None
+        self.stats = {"requests": 0, "bad_requests": 0, "turns": 0, "pushes": 0, "checkpoints": 0, "rooms_saved": 0, "timeouts": 0, "errors": 0}
+
+    # -- persistence --
+
+    def load(self):
+        """Run migrations and pull every saved room and its turn log into memory."""
+        migrations.migrate(self.path)
+        conn = db.connect(self.path)
+        c = conn.execute("SELECT * FROM multiplayer_rooms")
+        self.columns = [col[0] for col in c.description]
+        for row in c.fetchall():
+            room = dict(zip(self.columns, row))
+            self.rooms[room["room_code"]] = room
+            self.events[room["room_code"]] = []
+            self.start_clock(room)
+        c = conn.execute(f"SELECT room_code, {', '.join(rooms.EVENT_COLUMNS)} FROM room_events ORDER BY room_code, seq")
+        for row in c.fetchall():
+            if row[0] in self.events:
+                self.events[row[0]].append(dict(zip(rooms.EVENT_COLUMNS, row[1:])))
+        conn.commit()
+        return len(self.rooms)
+
+    def take_batch(self):
+        batch = {
+            "rooms": [dict(self.rooms[code]) for code in self.dirty if code in self.rooms],
+            "events": [(code, event) for code, event in self.unsaved_events if code not in self.deleted],
+            "deleted": list(self.deleted),
+            "results": self.results,
+        }
+        self.dirty, self.deleted, self.unsaved_events, self.results = set(), set(), [], []
+        return batch
+
+    def return_batch(self, batch):
+        """Put a batch that failed to save back in line for the next checkpoint."""
+        self.dirty.update(room["room_code"] for room in batch["rooms"])
+        self.deleted.update(batch["deleted"])
+        self.unsaved_events[:0] = batch["events"]
+        self.results[:0] = batch["results"]
+
+    def save(self, batch):
+        """Write one batch in one transaction (runs on the writer thread)."""
+        columns = self.columns
+        upsert = (
+            f"INSERT INTO multiplayer_rooms ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(room_code) DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in columns if column != "room_code")
+        )
+        event_columns = ("room_code",) + rooms.EVENT_COLUMNS
+        insert_event = (
+            f"INSERT OR IGNORE INTO room_events ({', '.join(event_columns)}) "
+            f"VALUES ({', '.join('?' * len(event_columns))})"
+        )
+        with db.transaction(self.path, immediate=True) as conn:
+            c = conn.cursor()
+            c.executemany(upsert, [[room[column] for column in columns] for room in batch["rooms"]])
+            c.executemany(
+                insert_event, [[code] + [event[column] for column in rooms.EVENT_COLUMNS] for code, event in batch["events"]]
+            )
+            c.executemany("DELETE FROM multiplayer_rooms WHERE room_code = ?", [(code,) for code in batch["deleted"]])
+            for winner, loser in batch["results"]:
+                users.record_multiplayer_result(conn, winner, loser)
+        if batch["results"]:
+            users.invalidate_stats(*(name for result in batch["results"] for name in result))
+
+    async def checkpoint(self):
+        batch = self.take_batch()
+        if not (batch["rooms"] or batch["events"] or batch["deleted"] or batch["results"]):
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.writer, self.save, batch)
+        except Exception as exc:
+            self.return_batch(batch)
+            self.stats["errors"] += 1
+            print(f"checkpoint failed, will retry: {exc}", file=sys.stderr)
+        else:
+            self.stats["checkpoints"] += 1
+            self.stats["rooms_saved"] += len(batch["rooms"])
+
+    def checkpoint_soon(self):
+        task = asyncio.get_running_loop().create_task(self.checkpoint())
+        self.saves.add(task)
+        task.add_done_callback(self.saves.discard)
+
+    def expire(self, idle_seconds=rooms.ROOM_IDLE_SECONDS, waiting_idle_seconds=rooms.WAITING_IDLE_SECONDS):
+        """Drop rooms idle past the same limits the SQLite janitor uses."""
+        now = time.time()
+        idle = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - idle_seconds))
+        waiting = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - waiting_idle_seconds))
+        expired = [
+            code
+            for code, room in self.rooms.items()
+            if room["last_action"] < idle or (room["game_state"] == "waiting" and room["last_action"] < waiting)
+        ]
+        for code in expired:
+            self.op_delete(code)
+        return len(expired)
+
+    async def checkpoint_forever(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_seconds)
+            self.expire()
+            await self.checkpoint()
+
+    # -- room changes --
+
+    def change(self, room, changes, events=()):
+        """Apply ``changes`` to a room, bump its version and push the diff to its subscribers."""
+        changes["last_action"] = timestamp()
+        changes["version"] = room["version"] + 1
+        room.update(changes)
+        code = room["room_code"]
+        self.dirty.add(code)
+        if events:
+            self.events[code].extend(events)
+            self.unsaved_events.extend((code, event) for event in events)
+        self.push(code, {"room": code, "version": room["version"], "changes": changes, "events": list(events)})
+        self.start_clock(room)
+
+    def start_clock(self, room):
+        """(Re)start a playing room's move clock; entries for older versions are skipped when due."""
+        if room["game_state"] == "playing":
+            heapq.heappush(self.deadlines, (time.monotonic() + self.turn_seconds, room["room_code"], room["version"]))
+
+    def sweep_timeouts(self, now=None):
+        """Play ``rooms.DEFAULT_MOVE`` for every seat whose clock ran out, both seats if nobody moved."""
+        now = time.monotonic() if now is None else now
+        resolved = 0
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, code, version = heapq.heappop(self.deadlines)
+            room = self.rooms.get(code)
+            if room is None or room["version"] != version or room["game_state"] != "playing":
+                continue
+            idle = not (room["player1_ready"] or room["player2_ready"])
+            changes = {}
+            for seat in ("player1", "player2"):
+                if not room[f"{seat}_ready"]:
+                    changes.update({f"{seat}_move": rooms.DEFAULT_MOVE, f"{seat}_ready": 1})
+            self.resolve(room, changes, idle)
+            resolved += 1
+        self.stats["timeouts"] += resolved
+        return resolved
+
+    async def timeouts_forever(self):
+        while True:
+            # deadlines only ever get pushed turn_seconds out, so an empty heap can wait that long
+            delay = self.deadlines[0][0] - time.monotonic() if self.deadlines else self.turn_seconds
+            await asyncio.sleep(max(0.0, delay))
+            self.sweep_timeouts()
+
+    def push(self, code, message):
+        subscribers = self.subscribers.get(code)
+        if subscribers:
+            broadcast(subscribers, json.dumps(message))
+            self.stats["pushes"] += len(subscribers)
+
+    def resolve(self, room, changes, idle=False):
+        """Resolve the turn ``changes`` completes and push both as one diff."""
+        room.update(changes)
+        result = resolve_pvp_turn(room, self.rng)
+        updates = dict(result["updates"], **rooms.idle_updates(room, result, idle))
+        code = room["room_code"]
+        seq = self.events[code][-1]["seq"] + 1 if self.events[code] else 1
+        self.change(room, dict(changes, **updates), [rooms.turn_event(seq, result)])
+        self.stats["turns"] += 1
+        if result["match_winner"]:
+            self.results.append((result["match_winner"], result["match_loser"]))
+            self.checkpoint_soon()
+        return result
+
+    # -- ops --
+
+    def op_create(self, user):
+        for _ in range(rooms.ALLOCATE_ATTEMPTS):
+            code = rooms.generate_room_code()
+            if code not in self.rooms and code not in self.deleted:
+                break
+        else:
+            raise GameServerError(f"Could not allocate a free room code in {rooms.ALLOCATE_ATTEMPTS} attempts")
+        self.rooms[code] = new_room(code, user, timestamp())
+        self.events[code] = []
+        self.dirty.add(code)
+        return code
+
+    def op_join(self, room, user):
+        room = self.rooms.get(room)
+        if room is None or room["player2"] is not None:
+            return False
+        self.change(room, {"player2": user, "game_state": "playing"})
+        return True
+
+    def op_move(self, room, user, move):
+        if move not in MOVES:
+            raise GameServerError(f"Unknown move {move!r}")
+        room = self.rooms.get(room)
+        if room is None or room["game_state"] != "playing":
+            return None
+        for seat in ("player1", "player2"):
+            if room[seat] == user and not room[f"{seat}_ready"]:
+                break
+        else:
+            return None
+        changes = {f"{seat}_move": move, f"{seat}_ready": 1}
+        other = "player2" if seat == "player1" else "player1"
+        if room[f"{other}_ready"]:
+            self.resolve(room, changes)
+            return {"player1_ready": True, "player2_ready": True, "both_ready": True, "version": room["version"]}
+        self.change(room, changes)
+        return {
+            "player1_ready": bool(room["player1_ready"]),
+            "player2_ready": bool(room["player2_ready"]),
+            "both_ready": False,
+            "version": room["version"],
+        }
+
+    def op_restart(self, room, user):
+        room = self.rooms.get(room)
+        if room is not None and room["player1"] == user:
+            self.change(room, dict(RESTART))
+
+    def op_delete(self, room, user):
+        code = room
+        room = self.rooms.get(code)
+        if room is None or room["player1"] != user:
+            return
+        del self.rooms[code]
+        self.events.pop(code, None)
+        self.dirty.discard(code)
+        self.deleted.add(code)
+        self.push(code, {"room": code, "deleted": True})
+        for connection in self.subscribers.pop(code, ()):
+            self.subscriptions[connection].discard(code)
+
+    def op_get(self, room):
+        room = self.rooms.get(room)
+        return dict(room) if room else None
+
+    def subscribe(self, connection, room):
+        code = room
+        room = self.rooms.get(code)
+        if room is None:
+            return None
+        self.subscribers.setdefault(code, set()).add(connection)
+        self.subscriptions.setdefault(connection, set()).add(code)
+        return {"room": dict(room), "events": self.events[code]}
+
+    def unsubscribe(self, connection, room):
+        self.subscribers.get(room, set()).discard(connection)
+        self.subscriptions.get(connection, set()).discard(room)
+
+    def dispatch(self, connection, request):
+        op = request.pop("op")
+        if op == "subscribe":
+            return self.subscribe(connection, **request)
+        if op == "unsubscribe":
+            return self.unsubscribe(connection, **request)
+        if op == "stats":
+            return dict(self.stats, rooms=len(self.rooms), connections=len(self.subscriptions))
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            raise GameServerError(f"Unknown op {op!r}")
+        return handler(**request)
+
+    async def handle(self, connection):
+        self.subscriptions.setdefault(connection, set())
+        try:
+            async for message in connection:
+                self.stats["requests"] += 1
+                request_id = None
+                try:
+                    request = json.loads(message)
+                    if not isinstance(request, dict):
+                        raise GameServerError("a request must be a JSON object")
+                    request_id = request.pop("id", None)
+                    reply = {"id": request_id, "ok": True, "result": self.dispatch(connection, request)}
+                except (GameServerError, ValueError, KeyError, TypeError, AttributeError) as exc:
+                    # a bad frame gets an error reply; the connection stays open
+                    self.stats["bad_requests"] += 1
+                    reply = {"id": request_id, "ok": False, "error": f"{type(exc).__name__}: {exc}"}
+                await connection.send(json.dumps(reply))
+        except ConnectionClosed:
+            pass
+        finally:
+            for code in self.subscriptions.pop(connection, ()):
+                self.subscribers.get(code, set()).discard(connection)
+
+    async def serve(self, host=HOST, port=PORT, ready=None):
+        """Serve until cancelled, then write a final checkpoint."""
+        if not is_loopback(host):
+            raise GameServerError(f"refusing to serve on {host!r}: requests are trusted, so only loopback addresses are allowed")
+        if self.columns is None:
+            self.load()
+        checkpoints = asyncio.get_running_loop().create_task(self.checkpoint_forever())
+        timeouts = asyncio.get_running_loop().create_task(self.timeouts_forever())
+        try:
+            async with serve(self.handle, host, port, compression=None) as server:
+                if ready is not None:
+                    ready(server)
+                await asyncio.Future()
+        finally:
+            checkpoints.cancel()
+            timeouts.cancel()
+            await asyncio.gather(*self.saves, return_exceptions=True)
+            await self.checkpoint()
+            self.writer.shutdown()
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class GameClient:
+    """Blocking client with the same room functions as the ``rooms`` module.
+
+    A reader thread applies pushes to a local copy of every room it is
+    subscribed to, so ``get_room_version`` and ``get_room_state`` are answered
+    from memory; only moves and other writes make a round trip.  One client is
+    shared by every session in the process, so sessions ``follow`` a room they
+    show and ``unsubscribe`` when they stop; the subscription is dropped when
+    the last of them leaves, or when nobody has read the room for
+    ``idle_seconds`` (closed tabs).
+    """
+
+    def __init__(self, url=None, timeout=REQUEST_TIMEOUT, idle_seconds=SUBSCRIPTION_IDLE_SECONDS):
+        self.url = url or SERVER_URL or f"ws://{HOST}:{PORT}"
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.used = {}
+        self.swept = time.monotonic()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.rooms = {}
+        self.events = {}
+        self.watchers = {}  # room code -> ids of the sessions showing it
+
+    def connect(self):
+        with self.lock:
+            if self.connection is None:
+                self.connection = connect(self.url, compression=None, open_timeout=self.timeout)
+                self.rooms.clear()
+                self.events.clear()
+                self.used.clear()
+                threading.Thread(target=self.read, args=(self.connection,), name="game-client", daemon=True).start()
+            return self.connection
+
+    def close(self):
+        with self.lock:
+            connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+    def read(self, connection):
+        try:
+            for message in connection:
+                data = json.loads(message)
+                if "id" not in data:
+                    self.apply(data)
+                    continue
+                waiter = self.pending.pop(data["id"], None)
+                if waiter is None:
+                    continue
+                if waiter["op"] == "subscribe" and data["ok"] and data["result"]:
+                    # cached here, before any later push on this connection is read
+                    self.store(data["result"])
+                waiter["reply"] = data
+                waiter["done"].set()
+        except ConnectionClosed:
+            pass
+        finally:
+            with self.lock:
+                if self.connection is connection:
+                    self.connection = None
+            for waiter in list(self.pending.values()):
+                waiter["done"].set()
+
+    def store(self, snapshot):
+        with self.lock:
+            code = snapshot["room"]["room_code"]
+            self.rooms[code] = snapshot["room"]
+            self.events[code] = list(snapshot["events"])
+
+    def apply(self, push):
+        code = push["room"]
+        with self.lock:
+            if push.get("deleted"):
+                self.rooms.pop(code, None)
+                self.events.pop(code, None)
+                return
+            room = self.rooms.get(code)
+            if room is not None:
+                room.update(push["changes"])
+                self.events[code].extend(push["events"])
+
+    def request(self, op, **args):
+        connection = self.connect()
+        request_id = next(self.ids)
+        waiter = self.pending[request_id] = {"op": op, "done": threading.Event(), "reply": None}
+        try:
+            connection.send(json.dumps(dict(args, id=request_id, op=op)))
+        except ConnectionClosed:
+            self.pending.pop(request_id, None)
+            raise GameServerError(f"{op}: connection to {self.url} lost") from None
+        if not waiter["done"].wait(self.timeout):
+            self.pending.pop(request_id, None)
+            raise GameServerError(f"{op}: no reply from {self.url} in {self.timeout}s")
+        reply = waiter["reply"]
+        if reply is None:
+            raise GameServerError(f"{op}: connection to {self.url} lost")
+        if not reply["ok"]:
+            raise GameServerError(reply["error"])
+        return reply["result"]
+
+    def subscribed(self, room_code):
+        now = time.monotonic()
+        idle = []
+        with self.lock:
+            subscribed = room_code in self.rooms
+            self.used[room_code] = now
+            if now - self.swept >= self.idle_seconds:
+                self.swept = now
+                idle = [code for code, used in self.used.items() if now - used >= self.idle_seconds]
+        for code in idle:
+            self.unsubscribe(code)
+        if not subscribed:
+            self.request("subscribe", room=room_code)
+        return self.rooms.get(room_code)
+
+    def follow(self, room_code, watcher):
+        """Count ``watcher`` (a session id) among the sessions showing ``room_code``."""
+        with self.lock:
+            self.watchers.setdefault(room_code, set()).add(watcher)
+
+    def unsubscribe(self, room_code, watcher=None):
+        """``watcher`` stops showing a room; pushes stop once no watcher is left.
+
+        With no ``watcher`` the subscription is dropped outright.  Reading the
+        room again subscribes again.
+        """
+        with self.lock:
+            watchers = self.watchers.get(room_code)
+            if watcher is not None and watchers:
+                watchers.discard(watcher)
+                if watchers:
+                    return
+            self.watchers.pop(room_code, None)
+            subscribed = self.rooms.pop(room_code, None) is not None
+            self.events.pop(room_code, None)
+            self.used.pop(room_code, None)
+        if subscribed:
+            self.request("unsubscribe", room=room_code)
+
+    # -- the rooms module interface --
+
+    def create_room(self, player_username):
+        return self.request("create", user=player_username)
+
+    def join_room(self, room_code, player_username):
+        return self.request("join", room=room_code, user=player_username)
+
+    def update_player_move(self, room_code, player_username, move):
+        return self.request("move", room=room_code, user=player_username, move=move)
+
+    def process_multiplayer_turn(self, room_code, version=None, rng=None):
+        """Nothing to do: the server resolves a turn as soon as its second move arrives."""
+        return None
+
+    def restart_match(self, room_code, player_username):
+        self.request("restart", room=room_code, user=player_username)
+
+    def delete_room(self, room_code, player_username):
+        self.request("delete", room=room_code, user=player_username)
+
+    def get_room_state(self, room_code):
+        room = self.subscribed(room_code)
+        with self.lock:
+            return dict(room) if room else None
+
+    def get_room_version(self, room_code):
+        room = self.subscribed(room_code)
+        return room["version"] if room else None
+
+    def get_room_events(self, room_code, after_seq=0):
+        self.subscribed(room_code)
+        with self.lock:
+            return [event for event in self.events.get(room_code, ()) if event["seq"] > after_seq]
+
+
+# -- loopback self test --
+
+
+class AsyncClient:
+    """Minimal asyncio client used by the self test: replies by id, pushes per room."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.ids = itertools.count(1)
+        self.replies = {}
+        self.turns = {}
+        self.reader = asyncio.get_running_loop().create_task(self.read())
+
+    async def read(self):
+        async for message in self.connection:
+            data = json.loads(message)
+            if "id" in data:
+                self.replies.pop(data["id"]).set_result(data)
+            elif data.get("events") and data["room"] in self.turns:
+                self.turns.pop(data["room"]).set_result((time.perf_counter(), data))
+
+    async def request(self, op, **args):
+        request_id = next(self.ids)
+        reply = self.replies[request_id] = asyncio.get_running_loop().create_future()
+        await self.connection.send(json.dumps(dict(args, id=request_id, op=op)))
+        reply = await reply
+        if not reply["ok"]:
+            raise GameServerError(reply["error"])
+        return reply["result"]
+
+
+async def play_match(client, host, guest, think, rng, latencies):
+    code = await client.request("create", user=host)
+    await client.request("join", room=code, user=guest)
+    await client.request("subscribe", room=code)
+    while True:
+        await asyncio.sleep(rng.uniform(0, 2 * think))
+        await client.request("move", room=code, user=host, move=rng.choice(("attack", "attack", "defend", "rest")))
+        turn = client.turns[code] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await client.request("move", room=code, user=guest, move=rng.choice(("attack", "attack", "defend", "rest")))
+        arrived, push = await turn
+        latencies.append(arrived - start)
+        if push["changes"].get("game_state") == "match_over":
+            return code, push["changes"]["winner"]
+
+
+async def timeout_check(path, turn_seconds=0.2):
+    """Only the host moves; the server's clock must play the guest's move for them."""
+    server = GameServer(path, rng=random.Random(0), turn_seconds=turn_seconds)
+    ready = asyncio.get_running_loop().create_future()
+    serving = asyncio.get_running_loop().create_task(server.serve(HOST, 0, ready.set_result))
+    port = (await ready).sockets[0].getsockname()[1]
+    async with async_connect(f"ws://{HOST}:{port}", compression=None) as connection:
+        client = AsyncClient(connection)
+        code = await client.request("create", user="clock_host")
+        await client.request("join", room=code, user="clock_guest")
+        await client.request("subscribe", room=code)
+        turn = client.turns[code] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await client.request("move", room=code, user="clock_host", move="attack")
+        arrived, push = await asyncio.wait_for(turn, turn_seconds * 10)
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+    event = push["events"][0]
+    return event["player2_move"] == rooms.DEFAULT_MOVE and arrived - start >= turn_seconds and server.stats["timeouts"] == 1
+
+
+async def run_selftest(room_count, connection_count, think, seed, path):
+    rng = random.Random(seed)
+    server = GameServer(path, checkpoint_seconds=1.0, rng=random.Random(seed))
+    server.load()
+    with db.transaction(path) as conn:
+        conn.cursor().executemany(
+            "INSERT INTO users (username) VALUES (?)",
+            [(f"{role}{i}",) for i in range(room_count) for role in ("host", "guest")],
+        )
+    ready = asyncio.get_running_loop().create_future()
+    serving = asyncio.get_running_loop().create_task(server.serve(HOST, 0, ready.set_result))
+    port = (await ready).sockets[0].getsockname()[1]
+    url = f"ws://{HOST}:{port}"
+
+    connections = [await async_connect(url, compression=None, max_queue=None) for _ in range(connection_count)]
+    clients = [AsyncClient(connection) for connection in connections]
+    latencies = []
+    start = time.perf_counter()
+    matches = await asyncio.gather(
+        *(
+            play_match(clients[i % connection_count], f"host{i}", f"guest{i}", think, random.Random(rng.random()), latencies)
+            for i in range(room_count)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    # the blocking client, from a thread, against the same server
+    def blocking_flow():
+        client = GameClient(url)
+        code = client.create_room("sync_host")
+        joined = client.join_room(code, "sync_guest")
+        client.update_player_move(code, "sync_host", "attack")
+        client.update_player_move(code, "sync_guest", "rest")
+        room = client.get_room_state(code)
+        events = client.get_room_events(code)
+        client.close()
+        return joined and room["version"] == 3 and len(events) == 1 and room["player2_hp"] < PVP_HEALTH
+
+    blocking_ok = await asyncio.to_thread(blocking_flow)
+    clock_ok = await timeout_check(path + ".clock")
+    for connection in connections:
+        await connection.close()
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+
+    conn = db.connect(path)
+    saved_turns = conn.execute("SELECT COUNT(*) FROM room_events").fetchone()[0]
+    saved_finished = conn.execute("SELECT COUNT(*) FROM multiplayer_rooms WHERE game_state = 'match_over'").fetchone()[0]
+    results = conn.execute("SELECT SUM(multiplayer_wins), SUM(multiplayer_losses) FROM users").fetchone()
+    mismatched = sum(
+        1
+        for code, winner in matches
+        if conn.execute("SELECT winner FROM multiplayer_rooms WHERE room_code = ?", (code,)).fetchone()[0] != winner
+    )
+    conn.commit()
+
+    latencies.sort()
+    return {
+        "rooms": room_count,
+        "connections": connection_count,
+        "turns": len(latencies),
+        "seconds": elapsed,
+        "turns_per_second": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "checkpoints": server.stats["checkpoints"],
+        "ok": (
+            blocking_ok
+            and clock_ok
+            and saved_turns == len(latencies) + 1
+            and saved_finished == room_count
+            and tuple(results) == (room_count, room_count)
+            and mismatched == 0
+        ),
+    }
+
+
+def selftest(room_count=2000, connection_count=50, think=1.0, seed=0):
+    scratch = tempfile.mkdtemp(prefix="lebronsim-game-server-")
+    try:
+        return asyncio.run(run_selftest(room_count, connection_count, think, seed, os.path.join(scratch, "selftest.db")))
+    finally:
+        db.close_all()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+async def run_server(server, host, port):
+    """``serve`` with SIGTERM treated like Ctrl-C, so a stopped server still checkpoints."""
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await server.serve(host, port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve PvP rooms from memory over WebSockets")
+    parser.add_argument("--host", default=HOST, help="loopback address to listen on")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default=None, help="database file (default: LEBRONSIM_DB or users.db)")
+    parser.add_argument("--checkpoint", type=float, default=CHECKPOINT_SECONDS, help="seconds between SQLite checkpoints")
+    parser.add_argument("--selftest", action="store_true", help="play matches over loopback against a scratch database")
+    parser.add_argument("--rooms", type=int, default=2000, help="concurrent matches in the self test")
+    parser.add_argument("--connections", type=int, default=50, help="client sockets in the self test")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between moves in the self test")
+    args = parser.parse_args(argv)
+    if not is_loopback(args.host):
+        parser.error(f"--host {args.host}: the server trusts its clients, so it only listens on loopback")
+
+    if args.selftest:
+        report = selftest(args.rooms, args.connections, args.think)
+        print(
+            f"{report['rooms']} matches over {report['connections']} sockets: {report['turns']} turns in "
+            f"{report['seconds']:.1f}s ({report['turns_per_second']:,.0f}/s), turn latency p50 "
+            f"{report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms, "
+            f"{report['checkpoints']} checkpoints"
+        )
+        print("state and checkpoints consistent" if report["ok"] else "MISMATCH between memory and SQLite")
+        return 0 if report["ok"] else 1
+
+    server = GameServer(args.db, args.checkpoint)
+    print(f"loaded {server.load()} rooms; serving on ws://{args.host}:{args.port}")
+    try:
+        asyncio.run(run_server(server, args.host, args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,495 +1,464 @@
-import random
 import streamlit as st
-import sqlite3
-import bcrypt
-import string
 from PIL import Image
-from datetime import datetime, timedelta
 import time
+import uuid
+from collections import deque
+from itertools import islice
+
+import auth
+import db
+import game_server
+import migrations
+import profiling
+import rooms
+import snapshots
+from users import (
+    add_xp,
+    authenticate_user,
+    get_user_stats,
+    register_user,
+    revoke_sessions,
+    session_token,
+    session_user,
+    stats_cache,
+    update_user_xp_fixed,
+)
+from engine import Battle
+from progression import MAX_LEVEL, TIE_XP, XP_THRESHOLDS, calculate_xp_reward, xp_required_for_level
 
+profiling.start_rerun(force=profiling.ENABLED and st.session_state.get("profile_session", False))
 
-def init_db():
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password BLOB,
-            xp INTEGER DEFAULT 0,
-            level INTEGER DEFAULT 1,
-            wins INTEGER DEFAULT 0,
-            losses INTEGER DEFAULT 0
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
 
+@st.cache_resource
+def run_migrations():
+    """Schema setup runs once per server process, not on every rerun."""
+    return migrations.migrate()
 
-def init_multiplayer_db():
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
 
-    # Rooms table
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS multiplayer_rooms (
-            room_code TEXT PRIMARY KEY,
-            player1 TEXT,
-            player2 TEXT,
-            player1_ready BOOLEAN DEFAULT 0,
-            player2_ready BOOLEAN DEFAULT 0,
-            player1_move TEXT,
-            player2_move TEXT,
-            player1_hp INTEGER DEFAULT 140,
-            player2_hp INTEGER DEFAULT 140,
-            player1_stamina INTEGER DEFAULT 100,
-            player2_stamina INTEGER DEFAULT 100,
-            player1_special INTEGER DEFAULT 0,
-            player2_special INTEGER DEFAULT 0,
-            current_round INTEGER DEFAULT 1,
-            current_turn INTEGER DEFAULT 1,  -- 1 = player1, 2 = player2
-            game_state TEXT DEFAULT 'waiting',  -- waiting, playing, finished
-            winner TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_action TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            player1_wins INTEGER DEFAULT 0,
-            player2_wins INTEGER DEFAULT 0,
-            match_round INTEGER DEFAULT 1  -- For best of 3
-        )
-        """
-    )
+@st.cache_resource
+def start_room_janitor():
+    """One background thread per server process expires abandoned rooms."""
+    if game_server.SERVER_URL:
+        return None  # the game server expires its own rooms
+    return rooms.start_janitor()
 
-    # Add multiplayer stats to users table
-    try:
-        c.execute("ALTER TABLE users ADD COLUMN multiplayer_wins INTEGER DEFAULT 0")
-        c.execute("ALTER TABLE users ADD COLUMN multiplayer_losses INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass  # Columns already exist
-
-    conn.commit()
-    conn.close()
-
-
-# Call the multiplayer DB init within the init_db process
-init_multiplayer_db()
 
+@st.cache_resource
+def start_turn_timer():
+    """One background thread per server process plays the default move for anyone who runs out of time."""
+    if game_server.SERVER_URL:
+        return None  # the game server runs its own turn clock
+    return rooms.start_turn_timer()
 
-def generate_room_code():
-    """Generate a 6-character room code"""
-    chars = string.ascii_uppercase + string.digits
-    return "".join(random.choice(chars) for _ in range(6))
 
+@st.cache_resource
+def room_store():
+    """Where PvP rooms live: the game server when LEBRONSIM_GAME_SERVER is set, otherwise SQLite."""
+    if game_server.SERVER_URL:
+        return game_server.GameClient(game_server.SERVER_URL)
+    return rooms
 
-def create_room(player_username):
-    """Create a new multiplayer room"""
-    room_code = generate_room_code()
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
 
-    # Clean up old rooms (older than 2 hours)
-    c.execute("DELETE FROM multiplayer_rooms WHERE created_at < datetime('now', '-2 hours')")
+@st.cache_resource
+def room_snapshots():
+    """Spectator copies of rooms, shared by every session in this process."""
+    return snapshots.RoomSnapshots(room_store())
 
-    try:
-        c.execute(
-            "INSERT INTO multiplayer_rooms (room_code, player1, game_state) VALUES (?, ?, 'waiting')",
-            (room_code, player_username),
-        )
-        conn.commit()
-        return room_code
-    except sqlite3.IntegrityError:
-        # If room code collision (very unlikely), try again
-        return create_room(player_username)
-    finally:
-        conn.close()
 
 def join_room(room_code, player_username):
     """Join an existing room as player 2"""
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-
-    c.execute(
-        "UPDATE multiplayer_rooms SET player2 = ?, game_state = 'playing' WHERE room_code = ? AND player2 IS NULL",
-        (player_username, room_code),
-    )
-    conn.commit()
-    success = c.rowcount > 0
-    conn.close()
-
-    if success:
+    if room_store().join_room(room_code, player_username):
         st.session_state.multiplayer_room_code = room_code
         st.session_state.multiplayer_role = "join"
         return True  # ✅ Just return success, no rerun
     return False
 
-def get_room_state(room_code):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
 
-    c.execute("SELECT * FROM multiplayer_rooms WHERE room_code = ?", (room_code,))
-    result = c.fetchone()
-    columns = [col[0] for col in c.description] if c.description else []
-    conn.close()
+def get_player_profile_pic(username):
+    """Get a user's profile picture from their stats"""
+    stats = get_user_stats(username)
+    return get_lebron_image_url(stats["level"])
 
-    if result and columns:
-        return dict(zip(columns, result))
-    return None
 
-def get_room_state(room_code):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
+MOVE_LOG = {
+    "attack": "🏀 {name} attacked for {damage}",
+    "defend": "🛡️ {name} defended",
+    "rest": "💤 {name} rested and recovered stamina",
+    "special": "⭐ {name} used a special move for {damage}",
+}
+BATTLE_LOG_TURNS = 10
+BATTLE_LOG_CAP = 300
+BATTLE_LOG_PAGE = 30
+
+
+def room_events(room):
+    """This session's copy of the room's turn log, extended with only the turns it has not seen."""
+    log = st.session_state.get("multiplayer_events")
+    if log is None or log["room_code"] != room["room_code"]:
+        log = st.session_state.multiplayer_events = {"room_code": room["room_code"], "version": None, "events": []}
+    if log["version"] != room["version"]:
+        last_seq = log["events"][-1]["seq"] if log["events"] else 0
+        log["events"].extend(room_store().get_room_events(room["room_code"], last_seq))
+        log["version"] = room["version"]
+    return log["events"]
+
+
+def describe_turn(room, event):
+    moves = [
+        MOVE_LOG[event[f"{seat}_move"]].format(name=room[seat], damage=event[f"{seat}_damage"])
+        for seat in ("player1", "player2")
+    ]
+    line = f"**R{event['match_round']} T{event['turn']}:** " + " · ".join(moves)
+    if event["round_winner"]:
+        line += f" — 🏆 {event['round_winner']} takes the round"
+    return line
 
-    c.execute("SELECT * FROM multiplayer_rooms WHERE room_code = ?", (room_code,))
-    result = c.fetchone()
-    columns = [col[0] for col in c.description] if c.description else []
-    conn.close()
 
-    if result and columns:
-        return dict(zip(columns, result))
-    return None
+@profiling.timed("ui.pvp_battle_log")
+def display_battle_log(room, events):
+    """Display the most recent turns of the multiplayer battle, newest first"""
+    st.markdown("### Battle Log")
+    if not events:
+        st.markdown("*No actions yet...*")
+        return
+    for event in reversed(events[-BATTLE_LOG_TURNS:]):
+        st.markdown(f"- {describe_turn(room, event)}")
 
-def update_player_move(room_code, player_username, move):
-    """Update a player's move in the room"""
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
 
-    room = get_room_state(room_code)
-    if not room:
-        conn.close()
-        return False
+def display_replay(room, events):
+    """Step through the last finished match using the turn log alone."""
+    ends = [i for i, event in enumerate(events) if event["match_winner"]]
+    if not ends:
+        return
+    first = ends[-2] + 1 if len(ends) > 1 else 0
+    states = rooms.replay(events)[first : ends[-1] + 1]
+    with st.expander("🎬 Match Replay"):
+        index = st.slider("Turn", 1, len(states), len(states), key="multiplayer_replay_turn") if len(states) > 1 else 1
+        state = states[index - 1]
+        st.markdown(describe_turn(room, state))
+        for seat in ("player1", "player2"):
+            st.markdown(
+                f"**{room[seat]}** ({state[f'{seat}_wins']} rounds): "
+                f"Health {state[f'{seat}_hp']}/140 · Stamina {state[f'{seat}_stamina']}/100 · "
+                f"Special {state[f'{seat}_special']}/100"
+            )
 
-    if room["player1"] == player_username:
-        c.execute(
-            "UPDATE multiplayer_rooms SET player1_move = ?, player1_ready = 1, last_action = CURRENT_TIMESTAMP WHERE room_code = ?",
-            (move, room_code),
-        )
-    elif room["player2"] == player_username:
-        c.execute(
-            "UPDATE multiplayer_rooms SET player2_move = ?, player2_ready = 1, last_action = CURRENT_TIMESTAMP WHERE room_code = ?",
-            (move, room_code),
-        )
-    else:
-        conn.close()
-        return False
 
-    conn.commit()
-    conn.close()
-    return True
+def submit_move(move):
+    """Submit this player's move and resolve the turn right away if it was the second one in."""
+    room_code = st.session_state.multiplayer_room_code
+    submitted = room_store().update_player_move(room_code, st.session_state.username, move)
+    if submitted and submitted["both_ready"]:
+        room_store().process_multiplayer_turn(room_code, version=submitted["version"])
+
+
+ROOM_POLL_SECONDS = 0.4
+
+
+def poll_room(room_code):
+    """The room as of its current version; re-reads the full row only when the version moved."""
+    follow(room_code)
+    version = room_store().get_room_version(room_code)
+    if version is None:
+        return None
+    room = st.session_state.get("multiplayer_room")
+    if room is None or room["room_code"] != room_code or room["version"] != version:
+        room = room_store().get_room_state(room_code)
+        st.session_state.multiplayer_room = room
+        st.session_state.multiplayer_pics = {}
+    return room
+
+
+def room_profile_pic(username):
+    """Profile picture for a seat, looked up once per room version."""
+    pics = st.session_state.setdefault("multiplayer_pics", {})
+    if username not in pics:
+        pics[username] = get_player_profile_pic(username)
+    return pics[username]
+
+
+def watcher_id():
+    """Identifies this session to the shared game server client."""
+    return st.session_state.setdefault("watcher_id", uuid.uuid4().hex)
+
+
+def follow(room_code):
+    """Count this session among ``room_code``'s viewers, so another session leaving keeps the pushes coming."""
+    store = room_store()
+    if isinstance(store, game_server.GameClient):
+        store.follow(room_code, watcher_id())
+
+
+def stop_following(room_code):
+    """Tell the game server client this session no longer shows ``room_code``; pushes stop when nobody does."""
+    store = room_store()
+    if room_code and isinstance(store, game_server.GameClient):
+        store.unsubscribe(room_code, watcher_id())
+
 
+def leave_room():
+    stop_following(st.session_state.multiplayer_room_code)
+    st.session_state.multiplayer_room_code = None
 
-def reset_round(room_code):
-    """Reset the room for a new round"""
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
 
-    c.execute(
-        """UPDATE multiplayer_rooms 
-           SET player1_move = NULL, player2_move = NULL,
-               player1_ready = 0, player2_ready = 0,
-               current_turn = 1,
-               last_action = CURRENT_TIMESTAMP
-           WHERE room_code = ?""",
-        (room_code,),
+@st.fragment(run_every=ROOM_POLL_SECONDS)
+@profiling.timed("ui.live_room")
+def live_room():
+    """Everything on the PvP screen that changes during a match, polled as its own fragment."""
+    # -- Retrieve the room info (a full read only when its version moved) --
+    room = poll_room(st.session_state.multiplayer_room_code)
+    if not room:
+        st.error("Room not found. It may have expired.")
+        leave_room()
+        st.rerun()
+
+    st.markdown(
+        f"<h1 class='game-title'>🏀 LeMultiplayer - Room {st.session_state.multiplayer_room_code}</h1>",
+        unsafe_allow_html=True,
+    )
+
+    # -- Show match progress --
+    st.markdown(f"**Match Round:** {room['match_round']}/3")
+    st.markdown(
+        f"**Score:** {room['player1']} {room['player1_wins']} - "
+        f"{room['player2_wins']} {room['player2'] if room['player2'] else 'Waiting...'}"
     )
-    conn.commit()
-    conn.close()
 
+    # -- Waiting screen --
+    if room["game_state"] == "waiting":
+        st.markdown("### Waiting for opponent to join...")
+        st.markdown(f"Share this room code: **{st.session_state.multiplayer_room_code}**")
 
-def process_multiplayer_turn(room_code):
-    """Process a completed turn in multiplayer"""
-    room = get_room_state(room_code)
-    if not room or room["game_state"] != "playing":
+        if st.button("Cancel", use_container_width=True):
+            # Clean up room if host cancels
+            if st.session_state.multiplayer_role == "host":
+                room_store().delete_room(st.session_state.multiplayer_room_code, st.session_state.username)
+            leave_room()
+            st.rerun()
         return
 
-    # Both players have made their moves
-    if room["player1_move"] and room["player2_move"]:
-        conn = sqlite3.connect("users.db")
-        c = conn.cursor()
-
-        p1_move = room["player1_move"]
-        p2_move = room["player2_move"]
-        p1_damage = 0
-        p2_damage = 0
-
-        # Player 1 move
-        if p1_move == "attack":
-            if room["player1_stamina"] >= 15:
-                p1_damage = random.randint(15, 30)
-                if random.random() < 0.2:
-                    p1_damage = int(p1_damage * 1.5)
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player1_stamina = player1_stamina - 15,
-                           player1_special = LEAST(player1_special + 10, 100)
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-        elif p1_move == "defend":
-            if room["player1_stamina"] >= 10:
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player1_stamina = player1_stamina - 10,
-                           player1_special = LEAST(player1_special + 15, 100)
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-        elif p1_move == "rest":
-            stamina_gain = random.randint(25, 40)
-            c.execute(
-                """UPDATE multiplayer_rooms 
-                   SET player1_stamina = LEAST(player1_stamina + ?, 100),
-                       player1_special = LEAST(player1_special + 5, 100)
-                   WHERE room_code = ?""",
-                (stamina_gain, room_code),
-            )
-        elif p1_move == "special":
-            if room["player1_special"] >= 100 and room["player1_stamina"] >= 25:
-                p1_damage = random.randint(40, 60)
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player1_special = 0,
-                           player1_stamina = GREATEST(player1_stamina - 25, 0)
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-
-        # Player 2 move
-        if p2_move == "attack":
-            if room["player2_stamina"] >= 15:
-                p2_damage = random.randint(15, 30)
-                if random.random() < 0.2:
-                    p2_damage = int(p2_damage * 1.5)
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player2_stamina = player2_stamina - 15,
-                           player2_special = LEAST(player2_special + 10, 100)
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-        elif p2_move == "defend":
-            if room["player2_stamina"] >= 10:
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player2_stamina = player2_stamina - 10,
-                           player2_special = LEAST(player2_special + 15, 100)
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-        elif p2_move == "rest":
-            stamina_gain = random.randint(25, 40)
-            c.execute(
-                """UPDATE multiplayer_rooms 
-                   SET player2_stamina = LEAST(player2_stamina + ?, 100),
-                       player2_special = LEAST(player2_special + 5, 100)
-                   WHERE room_code = ?""",
-                (stamina_gain, room_code),
-            )
-        elif p2_move == "special":
-            if room["player2_special"] >= 100 and room["player2_stamina"] >= 25:
-                p2_damage = random.randint(40, 60)
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player2_special = 0,
-                           player2_stamina = GREATEST(player2_stamina - 25, 0)
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-
-        # Defense adjustments
-        if p1_move == "defend" and room["player1_stamina"] >= 10:
-            p2_damage = int(p2_damage * 0.5)
-        if p2_move == "defend" and room["player2_stamina"] >= 10:
-            p1_damage = int(p1_damage * 0.5)
-
-        # Apply damage
-        c.execute(
-            """UPDATE multiplayer_rooms 
-               SET player1_hp = GREATEST(player1_hp - ?, 0),
-                   player2_hp = GREATEST(player2_hp - ?, 0),
-                   current_round = current_round + 1,
-                   player1_move = NULL,
-                   player2_move = NULL,
-                   player1_ready = 0,
-                   player2_ready = 0,
-                   current_turn = CASE WHEN current_turn = 1 THEN 2 ELSE 1 END,
-                   last_action = CURRENT_TIMESTAMP
-               WHERE room_code = ?""",
-            (p2_damage, p1_damage, room_code),
-        )
+    # -- Determine which side this player is on --
+    player = "player1" if room["player1"] == st.session_state.username else "player2"
+    opponent = "player2" if player == "player1" else "player1"
 
-        # Check for round winner
-        room = get_room_state(room_code)
-        if room["player1_hp"] <= 0 or room["player2_hp"] <= 0:
-            winner = None
-            if room["player1_hp"] <= 0 and room["player2_hp"] <= 0:
-                # Tie
-                pass
-            elif room["player1_hp"] <= 0:
-                winner = room["player2"]
-                c.execute(
-                    "UPDATE multiplayer_rooms SET game_state = 'finished', winner = ? WHERE room_code = ?",
-                    (winner, room_code),
-                )
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player2_wins = player2_wins + 1,
-                           match_round = match_round + 1
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-            else:
-                winner = room["player1"]
-                c.execute(
-                    "UPDATE multiplayer_rooms SET game_state = 'finished', winner = ? WHERE room_code = ?",
-                    (winner, room_code),
-                )
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player1_wins = player1_wins + 1,
-                           match_round = match_round + 1
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-
-            # Best of 3 check
-            room = get_room_state(room_code)
-            if room["player1_wins"] >= 2 or room["player2_wins"] >= 2:
-                final_winner = (
-                    room["player1"]
-                    if room["player1_wins"] >= 2
-                    else room["player2"]
-                )
-                c.execute(
-                    "UPDATE multiplayer_rooms SET game_state = 'match_over', winner = ? WHERE room_code = ?",
-                    (final_winner, room_code),
-                )
-
-                # Update user stats
-                if final_winner == room["player1"]:
-                    c.execute(
-                        "UPDATE users SET multiplayer_wins = multiplayer_wins + 1 WHERE username = ?",
-                        (room["player1"],),
+    # -- Display both players --
+    col1, col2 = st.columns(2)
+
+    # (Left column: current player)
+    with col1:
+        st.markdown(f"### You ({st.session_state.username})")
+        st.image(room_profile_pic(st.session_state.username), width=150)
+        st.markdown(f"**Health:** {room[f'{player}_hp']}/140")
+        st.progress(room[f"{player}_hp"] / 140)
+        st.markdown(f"**Stamina:** {room[f'{player}_stamina']}/100")
+        st.progress(room[f"{player}_stamina"] / 100)
+        st.markdown(f"**Special Meter:** {room[f'{player}_special']}/100")
+        st.progress(room[f"{player}_special"] / 100)
+
+        # -- IMPROVED MOVE SELECTION SECTION --
+        if room["game_state"] == "playing" and room["player2"]:
+            st.markdown("### Your Move")
+
+            if not room[f"{player}_ready"]:
+                colA, colB, colC, colD = st.columns(4)
+
+                with colA:
+                    attack_disabled = room[f"{player}_stamina"] < 15
+                    st.button(
+                        "🏀 Attack",
+                        disabled=attack_disabled,
+                        use_container_width=True,
+                        help="Basic attack (Cost: 15 Stamina, +10 Special Meter)",
+                        on_click=submit_move,
+                        args=("attack",),
                     )
-                    c.execute(
-                        "UPDATE users SET multiplayer_losses = multiplayer_losses + 1 WHERE username = ?",
-                        (room["player2"],),
+
+                with colB:
+                    defend_disabled = room[f"{player}_stamina"] < 10
+                    st.button(
+                        "🛡️ Defend",
+                        disabled=defend_disabled,
+                        use_container_width=True,
+                        help="Reduce incoming damage by 50% (Cost: 10 Stamina, +15 Special Meter)",
+                        on_click=submit_move,
+                        args=("defend",),
                     )
-                    # Award XP
-                    update_user_xp_fixed(room["player1"], 150, True)
-                    update_user_xp_fixed(room["player2"], 100, False)
-                else:
-                    c.execute(
-                        "UPDATE users SET multiplayer_wins = multiplayer_wins + 1 WHERE username = ?",
-                        (room["player2"],),
+
+                with colC:
+                    st.button(
+                        "💤 Rest",
+                        use_container_width=True,
+                        help="Recover 25-40 Stamina (+5 Special Meter)",
+                        on_click=submit_move,
+                        args=("rest",),
+                    )
+
+                with colD:
+                    special_disabled = (
+                        room[f"{player}_special"] < 100
+                        or room[f"{player}_stamina"] < 25
                     )
-                    c.execute(
-                        "UPDATE users SET multiplayer_losses = multiplayer_losses + 1 WHERE username = ?",
-                        (room["player1"],),
+                    st.button(
+                        "⭐ Special",
+                        disabled=special_disabled,
+                        use_container_width=True,
+                        help="Powerful attack (Requires: Full Special Meter, Costs: 25 Stamina)",
+                        on_click=submit_move,
+                        args=("special",),
                     )
-                    # Award XP
-                    update_user_xp_fixed(room["player2"], 150, True)
-                    update_user_xp_fixed(room["player1"], 100, False)
+
+            # New logic for move submission feedback
+            elif room[f"{player}_move"] is not None:
+                # Only show "Move submitted" if a move has been selected
+                st.success(f"🎯 {room[f'{player}_move'].capitalize()} move submitted! Waiting for opponent...")
             else:
-                # Reset for next round
-                c.execute(
-                    """UPDATE multiplayer_rooms 
-                       SET player1_hp = 140, player2_hp = 140,
-                           player1_stamina = 100, player2_stamina = 100,
-                           player1_special = 0, player2_special = 0,
-                           player1_move = NULL, player2_move = NULL,
-                           player1_ready = 0, player2_ready = 0,
-                           current_round = 1,
-                           current_turn = 1,
-                           game_state = 'playing',
-                           winner = NULL,
-                           last_action = CURRENT_TIMESTAMP
-                       WHERE room_code = ?""",
-                    (room_code,),
-                )
-
-        conn.commit()
-        conn.close()
+                st.success("Move submitted! Waiting for opponent...")
+                # Fallback for any unexpected states
+                st.info("Waiting for your move...")
 
+            # -- Countdown timer (display only: the turn timer plays "rest" for you when it runs out) --
+            time_elapsed = time.time() - rooms.parse_timestamp(room["last_action"])
+            time_left = max(0, rooms.TURN_SECONDS - time_elapsed)
 
-def get_player_profile_pic(username):
-    """Get a user's profile picture from their stats"""
-    stats = get_user_stats(username)
-    return get_lebron_image_url(stats["level"])
+            st.markdown(f"Time remaining: {int(time_left)} seconds")
+            st.progress(time_left / rooms.TURN_SECONDS)
 
+    # (Right column: opponent)
+    with col2:
+        opponent_username = room[opponent] if room[opponent] else "Waiting..."
+        st.markdown(f"### Opponent ({opponent_username})")
 
-def register_user(username, password):
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT INTO users (username, password, xp, level, wins, losses) VALUES (?, ?, 0, 1, 0, 0)",
-            (username, hashed_pw),
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+        if room[opponent]:
+            st.image(room_profile_pic(room[opponent]), width=150)
+            st.markdown(f"**Health:** {room[f'{opponent}_hp']}/140")
+            st.progress(room[f"{opponent}_hp"] / 140)
 
+            # Show partial or full special meter
+            st.markdown(
+                f"**Special Meter:** {'?' if not room[f'{opponent}_ready'] else room[f'{opponent}_special']}/100"
+            )
+            if room[f"{opponent}_ready"]:
+                st.progress(room[f"{opponent}_special"] / 100)
+            else:
+                st.progress(0)
 
-def authenticate_user(username, password):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT password FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result and bcrypt.checkpw(password.encode(), result[0]):
-        return True
-    return False
+            if room["game_state"] == "playing":
+                if room[f"{opponent}_ready"]:
+                    st.info("Opponent has submitted their move")
+                else:
+                    st.info("Waiting for opponent's move...")
+        else:
+            st.info("Waiting for opponent to join...")
 
+    events = room_events(room)
+    display_battle_log(room, events)
 
-def display_battle_log():
-    """Display the recent actions in the multiplayer battle"""
-    # Retrieve the current room state
-    room_code = st.session_state.multiplayer_room_code
-    room = get_room_state(room_code)
+    # -- If both are ready, process turn --
+    if room["game_state"] == "playing" and room["player1_ready"] and room["player2_ready"]:
+        # Normally the second submitter already did this; the next tick shows the result.
+        room_store().process_multiplayer_turn(st.session_state.multiplayer_room_code, version=room["version"])
 
-    if not room:
+    # -- Handle game over states -- (rest of the code remains the same)
+    if room["game_state"] in ("finished", "match_over"):
+        if room["game_state"] == "match_over":
+            if st.session_state.get("multiplayer_celebrated") != room["version"]:
+                st.session_state.multiplayer_celebrated = room["version"]
+                st.balloons()
+            if room["winner"] is None:
+                st.warning("⏱️ Match abandoned: nobody moved for several turns. No XP awarded.")
+            elif room["winner"] == st.session_state.username:
+                st.success(f"🏆 You won the match {room['player1_wins']}-{room['player2_wins']}!")
+                st.markdown("**XP Earned:** +150 XP (Match Win)")
+            else:
+                st.error(f"💀 You lost the match {room['player1_wins']}-{room['player2_wins']}.")
+                st.markdown("**XP Earned:** +100 XP (Match Loss)")
+
+            display_replay(room, events)
+
+            colA, colB = st.columns(2)
+            with colA:
+                if st.button("Return to Main Menu", use_container_width=True):
+                    leave_room()
+                    st.rerun()
+            with colB:
+                if st.button("Play Again", use_container_width=True):
+                    if st.session_state.multiplayer_role == "host":
+                        room_store().restart_match(st.session_state.multiplayer_room_code, st.session_state.username)
+                        st.rerun()
+                    else:
+                        st.info("Waiting for host to restart the match...")
+
+        else:
+            # Single round ended
+            if room["winner"] == st.session_state.username:
+                st.success(f"🎉 You won round {room['match_round']}!")
+            elif room["winner"]:
+                st.error(f"💀 You lost round {room['match_round']}.")
+            else:
+                st.info("🤝 Round ended in a tie!")
+
+            st.info("Next round starting soon...")
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def spectator_profile_pic(username):
+    """Seat pictures for spectators, shared across sessions like the room itself."""
+    return get_player_profile_pic(username)
+
+
+def stop_spectating():
+    stop_following(st.session_state.spectating_room)
+    st.session_state.spectating_room = None
+
+
+@st.fragment(run_every=ROOM_POLL_SECONDS)
+@profiling.timed("ui.spectate_room")
+def spectate_room():
+    """Read-only view of someone else's match, rendered from the shared snapshot."""
+    room_code = st.session_state.spectating_room
+    follow(room_code)
+    room, events = room_snapshots().get(room_code)
+    if room is None:
+        st.error("Room not found. The match may have ended and expired.")
+        st.button("Back to Lobby", use_container_width=True, on_click=stop_spectating)
         return
 
-    st.markdown("### Battle Log")
+    st.markdown(f"<h1 class='game-title'>👀 Watching Room {room_code}</h1>", unsafe_allow_html=True)
+    st.markdown(f"**Match Round:** {room['match_round']}/3")
+    st.markdown(
+        f"**Score:** {room['player1']} {room['player1_wins']} - "
+        f"{room['player2_wins']} {room['player2'] if room['player2'] else 'Waiting...'}"
+    )
 
-    # Create a log of what happened in the last turn
-    log_entries = []
-
-    # Player 1 move log
-    if room["player1_move"]:
-        if room["player1_move"] == "attack":
-            log_entries.append(f"🏀 {room['player1']} attacked!")
-        elif room["player1_move"] == "defend":
-            log_entries.append(f"🛡️ {room['player1']} defended!")
-        elif room["player1_move"] == "rest":
-            log_entries.append(f"💤 {room['player1']} rested and recovered stamina.")
-        elif room["player1_move"] == "special":
-            log_entries.append(f"⭐ {room['player1']} used a special move!")
-
-    # Player 2 move log
-    if room["player2_move"]:
-        if room["player2_move"] == "attack":
-            log_entries.append(f"🏀 {room['player2']} attacked!")
-        elif room["player2_move"] == "defend":
-            log_entries.append(f"🛡️ {room['player2']} defended!")
-        elif room["player2_move"] == "rest":
-            log_entries.append(f"💤 {room['player2']} rested and recovered stamina.")
-        elif room["player2_move"] == "special":
-            log_entries.append(f"⭐ {room['player2']} used a special move!")
-
-    # Display log entries
-    if log_entries:
-        for entry in log_entries:
-            st.markdown(f"- {entry}")
+    if room["game_state"] == "waiting":
+        st.info(f"{room['player1']} is waiting for an opponent...")
     else:
-        st.markdown("*No actions yet...*")
+        columns = st.columns(2)
+        for seat, column in zip(("player1", "player2"), columns):
+            with column:
+                st.markdown(f"### {room[seat]}")
+                st.image(spectator_profile_pic(room[seat]), width=150)
+                st.markdown(f"**Health:** {room[f'{seat}_hp']}/140")
+                st.progress(room[f"{seat}_hp"] / 140)
+                st.markdown(f"**Stamina:** {room[f'{seat}_stamina']}/100")
+                st.progress(room[f"{seat}_stamina"] / 100)
+                st.markdown(f"**Special Meter:** {room[f'{seat}_special']}/100")
+                st.progress(room[f"{seat}_special"] / 100)
+                if room["game_state"] == "playing":
+                    st.caption("✅ Move locked in" if room[f"{seat}_ready"] else "🤔 Choosing a move...")
+
+        if room["game_state"] == "match_over" and room["winner"]:
+            st.success(f"🏆 {room['winner']} won the match {room['player1_wins']}-{room['player2_wins']}!")
+        elif room["game_state"] == "match_over":
+            st.warning("⏱️ Match abandoned: nobody moved for several turns.")
 
+    display_battle_log(room, events)
+    if room["game_state"] == "match_over":
+        display_replay(room, events)
+    st.button("Stop Watching", use_container_width=True, on_click=stop_spectating)
 
+
+@profiling.timed("page.multiplayer_ui")
 def multiplayer_ui():
     """Display the multiplayer mode UI"""
     # -- Only allow access if logged in --
@@ -504,15 +473,20 @@ def multiplayer_ui():
         st.session_state.multiplayer_role = None
         st.session_state.multiplayer_last_update = 0
 
+    # -- Spectating someone else's match --
+    if not st.session_state.multiplayer_room_code and st.session_state.get("spectating_room"):
+        spectate_room()
+        return
+
     # -- Room creation/joining UI --
     if not st.session_state.multiplayer_room_code:
         st.markdown("<h1 class='game-title'>🏀 LeMultiplayer</h1>", unsafe_allow_html=True)
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
 
         with col1:
             st.markdown("### Create Room")
             if st.button("Create New Room", use_container_width=True):
-                room_code = create_room(st.session_state.username)
+                room_code = room_store().create_room(st.session_state.username)
                 st.session_state.multiplayer_room_code = room_code
                 st.session_state.multiplayer_role = "host"
                 st.rerun()
@@ -526,371 +500,15 @@ def multiplayer_ui():
                 else:
                     st.error("Could not join room. It may not exist or is full.")
 
-
-    else:
-        # -- Retrieve the room info --
-        room = get_room_state(st.session_state.multiplayer_room_code)
-        if not room:
-            st.error("Room not found. It may have expired.")
-            st.session_state.multiplayer_room_code = None
-            st.rerun()
-
-        st.markdown(
-            f"<h1 class='game-title'>🏀 LeMultiplayer - Room {st.session_state.multiplayer_room_code}</h1>",
-            unsafe_allow_html=True,
-        )
-
-        # -- Show match progress --
-        st.markdown(f"**Match Round:** {room['match_round']}/3")
-        st.markdown(
-            f"**Score:** {room['player1']} {room['player1_wins']} - "
-            f"{room['player2_wins']} {room['player2'] if room['player2'] else 'Waiting...'}"
-        )
-
-        # -- Waiting screen --
-        if room["game_state"] == "waiting":
-            st.markdown("### Waiting for opponent to join...")
-            st.markdown(f"Share this room code: **{st.session_state.multiplayer_room_code}**")
-
-            if st.button("Cancel", use_container_width=True):
-                # Clean up room if host cancels
-                if st.session_state.multiplayer_role == "host":
-                    conn = sqlite3.connect("users.db")
-                    c = conn.cursor()
-                    c.execute(
-                        "DELETE FROM multiplayer_rooms WHERE room_code = ?",
-                        (st.session_state.multiplayer_room_code,),
-                    )
-                    conn.commit()
-                    conn.close()
-                st.session_state.multiplayer_room_code = None
+        with col3:
+            st.markdown("### Watch a Match")
+            watch_code = st.text_input("Room Code to Watch", max_chars=6, key="spectate_room_code").upper()
+            if st.button("Watch", use_container_width=True, disabled=not watch_code):
+                st.session_state.spectating_room = watch_code
                 st.rerun()
-            return
-
-        # -- Determine which side this player is on --
-        player = "player1" if room["player1"] == st.session_state.username else "player2"
-        opponent = "player2" if player == "player1" else "player1"
 
-        # -- Display both players --
-        col1, col2 = st.columns(2)
-
-        # (Left column: current player)
-        with col1:
-            st.markdown(f"### You ({st.session_state.username})")
-            st.image(get_player_profile_pic(st.session_state.username), width=150)
-            st.markdown(f"**Health:** {room[f'{player}_hp']}/140")
-            st.progress(room[f"{player}_hp"] / 140)
-            st.markdown(f"**Stamina:** {room[f'{player}_stamina']}/100")
-            st.progress(room[f"{player}_stamina"] / 100)
-            st.markdown(f"**Special Meter:** {room[f'{player}_special']}/100")
-            st.progress(room[f"{player}_special"] / 100)
-
-            # -- IMPROVED MOVE SELECTION SECTION --
-            if room["game_state"] == "playing" and room["player2"]:
-                st.markdown("### Your Move")
-
-                if not room[f"{player}_ready"]:
-                    colA, colB, colC, colD = st.columns(4)
-
-                    with colA:
-                        attack_disabled = room[f"{player}_stamina"] < 15
-                        if st.button(
-                            "🏀 Attack",
-                            disabled=attack_disabled,
-                            use_container_width=True,
-                            help="Basic attack (Cost: 15 Stamina, +10 Special Meter)",
-                        ):
-                            update_player_move(
-                                st.session_state.multiplayer_room_code,
-                                st.session_state.username,
-                                "attack",
-                            )
-                            st.rerun()
-
-                    with colB:
-                        defend_disabled = room[f"{player}_stamina"] < 10
-                        if st.button(
-                            "🛡️ Defend",
-                            disabled=defend_disabled,
-                            use_container_width=True,
-                            help="Reduce incoming damage by 50% (Cost: 10 Stamina, +15 Special Meter)",
-                        ):
-                            update_player_move(
-                                st.session_state.multiplayer_room_code,
-                                st.session_state.username,
-                                "defend",
-                            )
-                            st.rerun()
-
-                    with colC:
-                        if st.button(
-                            "💤 Rest",
-                            use_container_width=True,
-                            help="Recover 25-40 Stamina (+5 Special Meter)",
-                        ):
-                            update_player_move(
-                                st.session_state.multiplayer_room_code,
-                                st.session_state.username,
-                                "rest",
-                            )
-                            st.rerun()
-
-                    with colD:
-                        special_disabled = (
-                            room[f"{player}_special"] < 100
-                            or room[f"{player}_stamina"] < 25
-                        )
-                        if st.button(
-                            "⭐ Special",
-                            disabled=special_disabled,
-                            use_container_width=True,
-                            help="Powerful attack (Requires: Full Special Meter, Costs: 25 Stamina)",
-                        ):
-                            update_player_move(
-                                st.session_state.multiplayer_room_code,
-                                st.session_state.username,
-                                "special",
-                            )
-                            st.rerun()
-
-                # New logic for move submission feedback
-                elif room[f"{player}_move"] is not None:
-                    # Only show "Move submitted" if a move has been selected
-                    st.success(f"🎯 {room[f'{player}_move'].capitalize()} move submitted! Waiting for opponent...")
-                else:
-                    st.success("Move submitted! Waiting for opponent...")
-                    # Fallback for any unexpected states
-                    st.info("Waiting for your move...")
-
-                # -- Countdown timer logic --
-                last_action = datetime.strptime(room["last_action"], "%Y-%m-%d %H:%M:%S")
-                time_elapsed = (datetime.now() - last_action).total_seconds()
-                time_left = max(0, 10 - time_elapsed)
-
-                st.markdown(f"Time remaining: {int(time_left)} seconds")
-                st.progress(time_left / 10)
-
-                if time_left <= 0:
-                    # Time's up - auto-submit a rest
-                    update_player_move(
-                        st.session_state.multiplayer_room_code,
-                        st.session_state.username,
-                        "rest",
-                    )
-                    st.rerun()
-
-        # (Right column: opponent)
-        with col2:
-            opponent_username = room[opponent] if room[opponent] else "Waiting..."
-            st.markdown(f"### Opponent ({opponent_username})")
-
-            if room[opponent]:
-                st.image(get_player_profile_pic(room[opponent]), width=150)
-                st.markdown(f"**Health:** {room[f'{opponent}_hp']}/140")
-                st.progress(room[f"{opponent}_hp"] / 140)
-
-                # Show partial or full special meter
-                st.markdown(
-                    f"**Special Meter:** {'?' if not room[f'{opponent}_ready'] else room[f'{opponent}_special']}/100"
-                )
-                if room[f"{opponent}_ready"]:
-                    st.progress(room[f"{opponent}_special"] / 100)
-                else:
-                    st.progress(0)
-
-                if room["game_state"] == "playing":
-                    if room[f"{opponent}_ready"]:
-                        st.info("Opponent has submitted their move")
-                    else:
-                        st.info("Waiting for opponent's move...")
-            else:
-                st.info("Waiting for opponent to join...")
-
-        # -- ADDED BATTLE LOG --
-        def display_battle_log():
-            """Display the recent actions in the multiplayer battle"""
-            room_code = st.session_state.multiplayer_room_code
-            room = get_room_state(room_code)
-
-            if not room:
-                return
-
-            st.markdown("### Battle Log")
-
-            log_entries = []
-
-            if room["player1_move"]:
-                if room["player1_move"] == "attack":
-                    log_entries.append(f"🏀 {room['player1']} attacked!")
-                elif room["player1_move"] == "defend":
-                    log_entries.append(f"🛡️ {room['player1']} defended!")
-                elif room["player1_move"] == "rest":
-                    log_entries.append(f"💤 {room['player1']} rested and recovered stamina.")
-                elif room["player1_move"] == "special":
-                    log_entries.append(f"⭐ {room['player1']} used a special move!")
-
-            if room["player2_move"]:
-                if room["player2_move"] == "attack":
-                    log_entries.append(f"🏀 {room['player2']} attacked!")
-                elif room["player2_move"] == "defend":
-                    log_entries.append(f"🛡️ {room['player2']} defended!")
-                elif room["player2_move"] == "rest":
-                    log_entries.append(f"💤 {room['player2']} rested and recovered stamina.")
-                elif room["player2_move"] == "special":
-                    log_entries.append(f"⭐ {room['player2']} used a special move!")
-
-            if log_entries:
-                for entry in log_entries:
-                    st.markdown(f"- {entry}")
-            else:
-                st.markdown("*No actions yet...*")
-
-        # Call the battle log function
-        display_battle_log()
-
-        # -- If both are ready, process turn --
-        if room["game_state"] == "playing" and room["player1_ready"] and room["player2_ready"]:
-            process_multiplayer_turn(st.session_state.multiplayer_room_code)
-            time.sleep(1)
-            st.rerun()
-
-        # -- Handle game over states -- (rest of the code remains the same)
-        if room["game_state"] in ("finished", "match_over"):
-            if room["game_state"] == "match_over":
-                st.balloons()
-                if room["winner"] == st.session_state.username:
-                    st.success(f"🏆 You won the match {room['player1_wins']}-{room['player2_wins']}!")
-                else:
-                    st.error(f"💀 You lost the match {room['player1_wins']}-{room['player2_wins']}.")
-
-                if room["winner"] == st.session_state.username:
-                    st.markdown("**XP Earned:** +150 XP (Match Win)")
-                else:
-                    st.markdown("**XP Earned:** +100 XP (Match Loss)")
-
-                colA, colB = st.columns(2)
-                with colA:
-                    if st.button("Return to Main Menu", use_container_width=True):
-                        st.session_state.multiplayer_room_code = None
-                        st.rerun()
-                with colB:
-                    if st.button("Play Again", use_container_width=True):
-                        if st.session_state.multiplayer_role == "host":
-                            conn = sqlite3.connect("users.db")
-                            c = conn.cursor()
-                            c.execute(
-                                """UPDATE multiplayer_rooms 
-                                   SET player1_hp = 140, player2_hp = 140,
-                                       player1_stamina = 100, player2_stamina = 100,
-                                       player1_special = 0, player2_special = 0,
-                                       player1_move = NULL, player2_move = NULL,
-                                       player1_ready = 0, player2_ready = 0,
-                                       current_round = 1,
-                                       current_turn = 1,
-                                       game_state = 'playing',
-                                       winner = NULL,
-                                       player1_wins = 0,
-                                       player2_wins = 0,
-                                       match_round = 1,
-                                       last_action = CURRENT_TIMESTAMP
-                                   WHERE room_code = ?""",
-                                (st.session_state.multiplayer_room_code,),
-                            )
-                            conn.commit()
-                            conn.close()
-                            st.rerun()
-                        else:
-                            st.info("Waiting for host to restart the match...")
-
-            else:
-                # Single round ended
-                if room["winner"] == st.session_state.username:
-                    st.success(f"🎉 You won round {room['match_round']}!")
-                elif room["winner"]:
-                    st.error(f"💀 You lost round {room['match_round']}.")
-                else:
-                    st.info("🤝 Round ended in a tie!")
-
-                st.info("Next round starting soon...")
-                time.sleep(2)
-                st.rerun()
-
-        # -- Auto-refresh every 2 seconds so we see state changes --
-        time.sleep(2)
-        st.rerun()
-
-
-def get_user_stats(username):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT xp, level, wins, losses FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result:
-        return {
-            "xp": result[0],
-            "level": result[1],
-            "wins": result[2],
-            "losses": result[3],
-        }
-    return {"xp": 0, "level": 1, "wins": 0, "losses": 0}
-
-
-def update_user_xp_fixed(username, xp_earned, won=False):
-    """Update user XP, wins, and losses with better error handling"""
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-
-    # Check if user exists
-    c.execute("SELECT COUNT(*) FROM users WHERE username = ?", (username,))
-    user_exists = c.fetchone()[0] > 0
-
-    if not user_exists:
-        c.execute(
-            "INSERT INTO users (username, xp, level, wins, losses) VALUES (?, ?, ?, ?, ?)",
-            (username, xp_earned, 1, 1 if won else 0, 0 if won else 1),
-        )
-        conn.commit()
-        conn.close()
-        return False
-
-    c.execute("SELECT xp, level, wins, losses FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-
-    if result is None:
-        c.execute(
-            "INSERT INTO users (username, xp, level, wins, losses) VALUES (?, ?, ?, ?, ?)",
-            (username, xp_earned, 1, 1 if won else 0, 0 if won else 1),
-        )
-        conn.commit()
-        conn.close()
-        return False
-
-    current_xp, current_level, wins, losses = result
-
-    if won:
-        wins += 1
     else:
-        losses += 1
-
-    new_xp = current_xp + xp_earned
-
-    new_level = current_level
-    while new_level < 60 and new_xp >= xp_required_for_level(new_level + 1):
-        new_level += 1
-
-    c.execute(
-        """
-        UPDATE users 
-        SET xp = ?, level = ?, wins = ?, losses = ? 
-        WHERE username = ?
-        """,
-        (new_xp, new_level, wins, losses, username),
-    )
-    conn.commit()
-    conn.close()
-
-    return new_level > current_level
+        live_room()
 
 
 st.set_page_config(
@@ -900,262 +518,7 @@ st.set_page_config(
 )
 
 
-class Player:
-    def __init__(self, name, health, stamina, special_meter=0):
-        self.name = name
-        self.max_health = health
-        self.health = health
-        self.max_stamina = 100
-        self.stamina = stamina
-        self.special_meter = special_meter
-        self.is_defending = False
-        self.buffs = []
-        self.debuffs = []
-
-    def attack(self):
-        if self.stamina < 15:
-            return (0, f"{self.name} is too tired to attack!")
-        self.stamina -= 15
-        self.special_meter += 10
-        if self.special_meter > 100:
-            self.special_meter = 100
-        base_damage = random.randint(15, 30)
-        critical = random.random() < 0.2
-        if critical:
-            base_damage = int(base_damage * 1.5)
-            return (base_damage, f"{self.name} lands a CRITICAL hit for {base_damage} damage!")
-        return (base_damage, f"{self.name} attacks for {base_damage} damage!")
-
-    def special_attack(self):
-        if self.special_meter < 100:
-            return (0, f"{self.name} doesn't have enough energy for a special attack!")
-        self.special_meter = 0
-        self.stamina -= 25
-        if self.stamina < 0:
-            self.stamina = 0
-        damage = random.randint(40, 60)
-        return (damage, f"{self.name} unleashes a SPECIAL ATTACK for {damage} massive damage!")
-
-    def defend(self):
-        self.stamina -= 10
-        if self.stamina < 0:
-            self.stamina = 0
-        self.is_defending = True
-        self.special_meter += 15
-        if self.special_meter > 100:
-            self.special_meter = 100
-        return f"{self.name} takes a defensive stance, ready to reduce and heal from incoming damage!"
-
-    def rest(self):
-        gained = random.randint(25, 40)
-        self.stamina += gained
-        if self.stamina > self.max_stamina:
-            self.stamina = self.max_stamina
-        self.special_meter += 5
-        if self.special_meter > 100:
-            self.special_meter = 100
-        return f"{self.name} rests and recovers {gained} stamina."
-
-    def take_damage(self, damage):
-        if self.is_defending:
-            damage = int(damage * 0.5)
-            result = f"{self.name} blocks and reduces damage to {damage}!"
-            self.is_defending = False
-        else:
-            result = f"{self.name} takes {damage} damage!"
-        self.health -= damage
-        if self.health < 0:
-            self.health = 0
-        return result
-
-    def is_alive(self):
-        return self.health > 0
-
-    def reset_turn(self):
-        self.is_defending = False
-
-
-class LeBron(Player):
-    def __init__(self, difficulty):
-        health = 100 if difficulty == "Easy" else 160 if difficulty == "Medium" else 180
-        super().__init__("LeBron James", health, 100)
-        self.difficulty = difficulty
-        self.special_move_name = "Signature Slam Dunk"
-        self.abilities = {
-            "POSTERIZER": "Quick attack that has a chance to lower opponent's stamina",
-            "BLOCKED BY JAMES": "Strong defensive move that also recovers stamina",
-            "ALLEY-OOP TO DAVIS": "Tactical move that increases special meter gain",
-            f"{self.special_move_name}": "Devastating special attack that deals massive damage",
-        }
-        self.move_patterns = self.set_move_patterns()
-        self.consecutive_attacks = 0
-        self.consecutive_defends = 0
-        self.player_last_hp = 140
-        self.player_pattern_memory = []
-        self.turn_count = 0
-        self.player_last_stamina = 100
-
-    def set_move_patterns(self):
-        if self.difficulty == "Easy":
-            return {"attack": 0.4, "defend": 0.3, "rest": 0.25, "special": 0.05}
-        elif self.difficulty == "Medium":
-            return {"attack": 0.45, "defend": 0.25, "rest": 0.2, "special": 0.1}
-        else:
-            return {"attack": 0.5, "defend": 0.2, "rest": 0.15, "special": 0.15}
-
-    def analyze_player_pattern(self, player):
-        if self.difficulty == "Easy":
-            return
-
-        damage_taken = self.player_last_hp - player.health
-        self.player_last_hp = player.health
-        player_move = None
-
-        if damage_taken > 0:
-            if damage_taken > 35:
-                player_move = "special"
-            else:
-                player_move = "attack"
-        elif player.stamina > self.player_last_stamina:
-            player_move = "rest"
-        elif player.is_defending:
-            player_move = "defend"
-
-        self.player_last_stamina = player.stamina
-
-        if player_move:
-            self.player_pattern_memory.append(player_move)
-            if len(self.player_pattern_memory) > 3:
-                self.player_pattern_memory.pop(0)
-
-    def predict_player_action(self):
-        if len(self.player_pattern_memory) < 2 or self.difficulty == "Easy":
-            return None
-
-        if self.difficulty == "Hard":
-            if self.player_pattern_memory[-1] == "rest":
-                return "attack"
-            if self.player_pattern_memory.count("attack") >= 2:
-                return "special"
-            if "special" in self.player_pattern_memory:
-                return "rest"
-        return None
-
-    def choose_action(self, player=None):
-        self.turn_count += 1
-        if player:
-            self.analyze_player_pattern(player)
-
-        weights = {
-            "attack": self.move_patterns["attack"],
-            "defend": self.move_patterns["defend"],
-            "rest": self.move_patterns["rest"],
-            "special": 0 if self.special_meter < 100 else self.move_patterns["special"],
-        }
-
-        if self.stamina <= 30:
-            rest_urgency = (30 - self.stamina) / 30
-            weights["rest"] *= 1 + 2 * rest_urgency
-            if self.stamina < 15:
-                return "rest"
-        else:
-            weights["rest"] *= 0.2
-
-        if self.difficulty in ["Hard", "Medium"]:
-            if self.health < self.max_health * 0.3:
-                weights["defend"] *= 2.0
-
-            predicted_move = self.predict_player_action()
-            if predicted_move == "special" and player and player.special_meter >= 75:
-                weights["defend"] *= 3.0
-
-            if self.special_meter >= 100 and player and player.health < player.max_health * 0.4:
-                return "special"
-
-            if self.consecutive_attacks >= 2:
-                weights["attack"] *= 0.5
-
-            if self.consecutive_defends >= 2:
-                weights["defend"] *= 0.3
-
-            if self.special_meter >= 100:
-                special_threshold = 0.8 if self.difficulty == "Hard" else 0.6
-                if random.random() < special_threshold:
-                    return "special"
-
-            if player and player.is_defending:
-                weights["attack"] *= 0.4
-                weights["rest"] *= 1.5
-
-        if self.difficulty == "Hard":
-            if 15 < self.stamina < 40:
-                weights["rest"] *= 1.5
-            if player and player.health < player.max_health * 0.3:
-                weights["attack"] *= 1.5
-            if self.turn_count < 5 and self.health > self.max_health * 0.8:
-                weights["defend"] *= 1.3
-
-        if self.stamina > 50:
-            weights["attack"] *= 1.3
-
-        actions = list(weights.keys())
-        weights_list = list(weights.values())
-        chosen_action = random.choices(actions, weights=weights_list)[0]
-
-        if chosen_action == "rest" and self.stamina > 30:
-            weights["rest"] = 0.1
-            actions = list(weights.keys())
-            weights_list = list(weights.values())
-            chosen_action = random.choices(actions, weights=weights_list)[0]
-
-        if chosen_action == "attack":
-            self.consecutive_attacks += 1
-            self.consecutive_defends = 0
-        elif chosen_action == "defend":
-            self.consecutive_defends += 1
-            self.consecutive_attacks = 0
-        else:
-            self.consecutive_attacks = 0
-            self.consecutive_defends = 0
-
-        return chosen_action
-
-    def attack(self):
-        damage, msg = super().attack()
-        poster_chance = 0.2 if self.difficulty == "Easy" else 0.35 if self.difficulty == "Medium" else 0.5
-        if random.random() < poster_chance:
-            return (damage, "LeBron POSTERS YOU for " + str(damage) + " damage and reduces your stamina!")
-        return (damage, msg)
-
-    def special_attack(self):
-        damage, _ = super().special_attack()
-        if self.difficulty == "Medium":
-            damage = int(damage * 1.1)
-        elif self.difficulty == "Hard":
-            damage = int(damage * 1.2)
-        return (damage, f"LeBron unleashes his {self.special_move_name} for {damage} MASSIVE damage!")
-
-    def take_damage(self, damage):
-        if self.is_defending:
-            reduction = 0.5
-            reduced_damage = int(damage * (1 - reduction))
-            heal_percent = 0.5
-            heal_amount = int(reduced_damage * heal_percent)
-            self.health += heal_amount
-            if self.health > self.max_health:
-                self.health = self.max_health
-            self.health -= reduced_damage
-            if self.health < 0:
-                self.health = 0
-            self.is_defending = False
-            return f"{self.name} blocks and reduces damage to {reduced_damage}, then heals {heal_amount} health!"
-        else:
-            self.health -= damage
-            if self.health < 0:
-                self.health = 0
-            return f"{self.name} takes {damage} damage!"
-
-
+@profiling.timed("ui.character_card")
 def display_character_card(character, is_player=True):
     card_class = "player-card" if is_player else "lebron-card"
     col1, col2 = st.columns([1, 2])
@@ -1191,15 +554,23 @@ def display_character_card(character, is_player=True):
             st.markdown("🛡️ **Defending**")
 
 
+@profiling.timed("engine.start_battle")
+def start_battle(difficulty):
+    battle = Battle(difficulty)
+    st.session_state.battle = battle
+    st.session_state.player = battle.player
+    st.session_state.lebron = battle.lebron
+    st.session_state.turn = battle.turn
+    st.session_state.round = battle.round
+
+
 def initialize_session_state():
     if "game_started" not in st.session_state:
         st.session_state.game_started = False
     if "difficulty" not in st.session_state:
         st.session_state.difficulty = "Medium"
-    if "player" not in st.session_state or st.session_state.get("restart_game", False):
-        st.session_state.player = Player("You", 140, 100)
-    if "lebron" not in st.session_state or st.session_state.get("restart_game", False):
-        st.session_state.lebron = LeBron(st.session_state.difficulty)
+    if "battle" not in st.session_state or st.session_state.get("restart_game", False):
+        start_battle(st.session_state.difficulty)
     if st.session_state.get("restart_game", False):
         st.session_state.restart_game = False
     if "turn" not in st.session_state:
@@ -1207,7 +578,7 @@ def initialize_session_state():
     if "round" not in st.session_state:
         st.session_state.round = 1
     if "log" not in st.session_state:
-        st.session_state.log = []
+        reset_battle_log()
     if "current_player_action" not in st.session_state:
         st.session_state.current_player_action = None
     if "action_taken" not in st.session_state:
@@ -1218,170 +589,63 @@ def initialize_session_state():
         st.session_state.tutorial_shown = False
 
 
+def reset_battle_log():
+    """Start an empty battle log; only the newest ``BATTLE_LOG_CAP`` entries are ever kept."""
+    st.session_state.log = deque(maxlen=BATTLE_LOG_CAP)
+    st.session_state.log_pages = 1
+
+
 def add_log_entry(message, entry_type="system"):
     timestamp = time.strftime("%H:%M:%S")
-    st.session_state.log.append({"message": message, "type": entry_type, "timestamp": timestamp})
+    # rendered once here, so drawing the log is a join of at most a few pages of strings
+    html = f"<div class='log-entry {entry_type}-log'><small>{timestamp}</small> {message}</div>"
+    st.session_state.log.append({"message": message, "type": entry_type, "timestamp": timestamp, "html": html})
+
+
+def show_older_log():
+    st.session_state.log_pages = st.session_state.get("log_pages", 1) + 1
 
 
+@profiling.timed("ui.battle_log")
 def single_display_battle_log():
+    """The newest log entries as one HTML block, a page at a time back to ``BATTLE_LOG_CAP``."""
     st.markdown("### 📜 Battle Log")
-    with st.container():
-        for entry in reversed(st.session_state.log):
-            if isinstance(entry, dict) and "type" in entry and "message" in entry:
-                entry_class = f"log-entry {entry['type']}-log"
-                st.markdown(
-                    f"<div class='{entry_class}'><small>{entry['timestamp']}</small> {entry['message']}</div>",
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.markdown(
-                    f"<div class='log-entry system-log'><small>Unknown time</small> {entry}</div>",
-                    unsafe_allow_html=True,
-                )
+    log = st.session_state.log
+    shown = min(len(log), st.session_state.get("log_pages", 1) * BATTLE_LOG_PAGE)
+    st.markdown("\n".join(entry["html"] for entry in islice(reversed(log), shown)), unsafe_allow_html=True)
+    if shown < len(log):
+        st.button(f"Load older ({len(log) - shown} more)", key="battle_log_older", on_click=show_older_log)
+    elif len(log) == log.maxlen:
+        st.caption(f"Only the last {BATTLE_LOG_CAP} entries are kept.")
+
 
+def log_events(events):
+    for event in events:
+        add_log_entry(event["message"], event["type"])
 
+
+@profiling.timed("engine.lebron_turn")
 def lebron_turn():
-    lebron = st.session_state.lebron
-    player = st.session_state.player
-    action = lebron.choose_action()
-    st.session_state.animation_state = f"lebron_{action}"
-
-    if action == "attack":
-        dmg, msg = lebron.attack()
-        add_log_entry(msg, "lebron")
-        if dmg > 0:
-            result = player.take_damage(dmg)
-            add_log_entry(result, "player")
-
-    elif action == "defend":
-        result = lebron.defend()
-        add_log_entry(result, "lebron")
-
-    elif action == "rest":
-        result = lebron.rest()
-        add_log_entry(result, "lebron")
-
-    elif action == "special":
-        dmg, msg = lebron.special_attack()
-        add_log_entry(msg, "lebron")
-        if dmg > 0:
-            result = player.take_damage(dmg)
-            add_log_entry(result, "player")
-
-    st.session_state.turn += 1
+    battle = st.session_state.battle
+    log_events(battle.lebron_turn())
+    st.session_state.animation_state = battle.animation_state
+    st.session_state.turn = battle.turn
+    st.session_state.round = battle.round
     st.session_state.action_taken = False
-
-    if st.session_state.turn % 2 == 0:
-        player.reset_turn()
-        lebron.reset_turn()
-        st.session_state.round += 1
-        add_log_entry(f"Round {st.session_state.round} begins!", "system")
     return True
 
 
+@profiling.timed("engine.process_round")
 def process_round():
-    player = st.session_state.player
-    lebron = st.session_state.lebron
-    player_action = st.session_state.current_player_action
-
-    if not hasattr(lebron, "player_last_stamina"):
-        lebron.player_last_stamina = player.stamina
-
-    lebron_action = lebron.choose_action(player)
-    player_damage = 0
-    lebron_damage = 0
-
-    add_log_entry(f"Round {st.session_state.round} begins - both fighters prepare their moves!", "system")
-
-    if player_action == "defend":
-        result = player.defend()
-        add_log_entry(result, "player")
-        st.session_state.animation_state = "player_defend"
-
-    if lebron_action == "defend":
-        result = lebron.defend()
-        add_log_entry(result, "lebron")
-        st.session_state.animation_state = "lebron_defend"
-
-    if player_action == "attack":
-        player_damage, msg = player.attack()
-        add_log_entry(msg, "player")
-        st.session_state.animation_state = "player_attack"
-    elif player_action == "special":
-        player_damage, msg = player.special_attack()
-        add_log_entry(msg, "player")
-        st.session_state.animation_state = "player_special"
-    elif player_action == "rest":
-        result = player.rest()
-        add_log_entry(result, "player")
-        st.session_state.animation_state = "player_rest"
-
-    if lebron_action == "attack":
-        lebron_damage, msg = lebron.attack()
-        add_log_entry(msg, "lebron")
-    elif lebron_action == "special":
-        lebron_damage, msg = lebron.special_attack()
-        add_log_entry(msg, "lebron")
-    elif lebron_action == "rest":
-        result = lebron.rest()
-        add_log_entry(result, "lebron")
-
-    if player_damage > 0:
-        result = lebron.take_damage(player_damage)
-        add_log_entry(result, "lebron")
-    if lebron_damage > 0:
-        result = player.take_damage(lebron_damage)
-        add_log_entry(result, "player")
-
-    player.reset_turn()
-    lebron.reset_turn()
-    st.session_state.round += 1
+    battle = st.session_state.battle
+    log_events(battle.play_round(st.session_state.current_player_action))
+    st.session_state.animation_state = battle.animation_state
+    st.session_state.round = battle.round
     st.session_state.action_taken = False
 
     return True
 
 
-def xp_required_for_level(level):
-    if level <= 1:
-        return 0
-    elif level <= 10:
-        return (level - 1) * 100
-    elif level <= 20:
-        base_xp = 900  # XP for level 10
-        return base_xp + (level - 10) * 200
-    elif level <= 30:
-        base_xp = 900 + 10 * 200
-        return base_xp + (level - 20) * 300
-    elif level <= 40:
-        base_xp = 900 + 10 * 200 + 10 * 300
-        return base_xp + (level - 30) * 400
-    elif level <= 49:
-        base_xp = 900 + 10 * 200 + 10 * 300 + 10 * 400
-        return base_xp + (level - 40) * 500
-    else:
-        base_xp = 900 + 10 * 200 + 10 * 300 + 10 * 400 + 9 * 500
-        if level == 50:
-            return base_xp + 500
-        else:
-            multiplier = 1.5 ** (level - 50)
-            return int(base_xp + 500 + (level - 50) * 200 * multiplier)
-
-
-def calculate_xp_reward(player_health, lebron_health, difficulty, won):
-    base_xp = 25
-    diff_multiplier = 1.0
-    if difficulty == "Medium":
-        diff_multiplier = 1.5
-    elif difficulty == "Hard":
-        diff_multiplier = 2.0
-    victory_bonus = 50 if won else 0
-    margin_bonus = 0
-    if won:
-        margin_bonus = int((player_health / 140) * 30)
-    total_xp = int((base_xp + victory_bonus + margin_bonus) * diff_multiplier)
-    return max(10, total_xp)
-
-
 def get_level_progress(current_xp, current_level):
     current_level_xp = xp_required_for_level(current_level)
     next_level_xp = xp_required_for_level(current_level + 1)
@@ -1413,7 +677,6 @@ def end_battle_with_xp(player, lebron, won):
     difficulty = st.session_state.difficulty
     username = st.session_state.username
     xp_earned = calculate_xp_reward(player.health, lebron.health, difficulty, won)
-    current_stats = get_user_stats(username)
     leveled_up = update_user_xp_fixed(username, xp_earned, won)
     updated_stats = get_user_stats(username)
 
@@ -1430,6 +693,7 @@ def end_battle_with_xp(player, lebron, won):
     return updated_stats
 
 
+@profiling.timed("ui.lepass_css")
 def add_lepass_css():
     st.markdown(
         """
@@ -1467,6 +731,7 @@ def add_lepass_css():
     )
 
 
+@profiling.timed("ui.game")
 def display_game():
     st.markdown("<h1 class='game-title'>🏀 LeBron Boss Battle</h1>", unsafe_allow_html=True)
     player = st.session_state.player
@@ -1536,24 +801,11 @@ def display_game():
         if st.session_state.player.health == 0 and st.session_state.lebron.health == 0:
             st.markdown("## 🤝 TIE! 🤝")
             st.markdown("### It's a draw! You and LeBron both fell at the same time.")
-            tie_xp = 70
+            tie_xp = TIE_XP
             if not hasattr(st.session_state, "username"):
                 st.session_state.username = "Guest"
             username = st.session_state.username
-
-            conn = sqlite3.connect("users.db")
-            c = conn.cursor()
-            c.execute("SELECT xp, level FROM users WHERE username = ?", (username,))
-            result = c.fetchone()
-            if result:
-                current_xp, current_level = result
-                new_xp = current_xp + tie_xp
-                new_level = current_level
-                while new_level < 60 and new_xp >= xp_required_for_level(new_level + 1):
-                    new_level += 1
-                c.execute("UPDATE users SET xp = ?, level = ? WHERE username = ?", (new_xp, new_level, username))
-                conn.commit()
-            conn.close()
+            add_xp(username, tie_xp)
 
             st.markdown(f"**TIE XP:** +{tie_xp} (No W/L changes)")
             updated_stats = get_user_stats(username)
@@ -1566,7 +818,7 @@ def display_game():
             with colA:
                 if st.button("Play Again", use_container_width=True):
                     st.session_state.game_started = False
-                    st.session_state.log = []
+                    reset_battle_log()
                     st.session_state.restart_game = True
                     st.session_state.round = 1
                     st.rerun()
@@ -1613,7 +865,7 @@ def display_game():
         with colA:
             if st.button("Play Again", use_container_width=True):
                 st.session_state.game_started = False
-                st.session_state.log = []
+                reset_battle_log()
                 st.session_state.restart_game = True
                 st.session_state.round = 1
                 st.rerun()
@@ -1624,9 +876,10 @@ def display_game():
 
         st.markdown("</div>", unsafe_allow_html=True)
 
-    display_battle_log()
+    single_display_battle_log()
 
 
+@profiling.timed("ui.difficulty_selection")
 def display_difficulty_selection():
     st.markdown("<h1 class='game-title'>LeBron Boss Battle</h1>", unsafe_allow_html=True)
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -1641,6 +894,7 @@ def display_difficulty_selection():
         "Easy": "LeBron has 100 HP and uses basic moves mostly at random.",
         "Medium": "LeBron has 160 HP and plays more strategically.",
         "Hard": "LeBron has 180 HP and uses advanced tactics and powerful combos.",
+        "Nightmare": "LeBron has 180 HP and searches ahead for the best counter to every move.",
     }
     selected_difficulty = st.select_slider("Select difficulty:", options=list(difficulty_options.keys()), value=st.session_state.difficulty)
     st.info(difficulty_options[selected_difficulty])
@@ -1661,11 +915,8 @@ def display_difficulty_selection():
         st.session_state.tutorial_shown = True
 
     if st.button("Start Game", use_container_width=True):
-        st.session_state.player = Player("You", 140, 100)
-        st.session_state.lebron = LeBron(st.session_state.difficulty)
-        st.session_state.turn = 0
-        st.session_state.round = 1
-        st.session_state.log = []
+        start_battle(st.session_state.difficulty)
+        reset_battle_log()
         st.session_state.action_taken = False
         st.session_state.game_started = True
         st.session_state.xp_already_awarded = False
@@ -1674,6 +925,7 @@ def display_difficulty_selection():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@profiling.timed("page.login_ui")
 def login_ui():
     st.markdown("<h1 class='auth-title'>Welcome Back</h1>", unsafe_allow_html=True)
     st.markdown("<p class='auth-subtitle'>Sign in to continue your battle</p>", unsafe_allow_html=True)
@@ -1688,13 +940,19 @@ def login_ui():
     colA, colB, colC = st.columns([1, 3, 1])
     with colB:
         if st.button("Sign In", use_container_width=True):
-            if authenticate_user(username, password):
+            try:
+                signed_in = authenticate_user(username, password)
+            except auth.AuthBusy:
+                st.error("Lots of players are signing in right now, try again in a moment.")
+                signed_in = None
+            if signed_in:
                 st.session_state.logged_in = True
                 st.session_state.username = username
+                set_session_cookie(session_token(username))
                 st.success(f"Welcome, {username}!")
                 st.session_state.page = "LePlay"
                 st.rerun()
-            else:
+            elif signed_in is not None:
                 st.error("Incorrect username or password")
 
     st.markdown("<div class='auth-footer'>", unsafe_allow_html=True)
@@ -1715,6 +973,7 @@ def login_ui():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@profiling.timed("page.lepass_ui")
 def lepass_ui():
     """Display the LePASS progression UI with gallery of unlocked LeBron images"""
     if not st.session_state.get("logged_in", False):
@@ -1816,7 +1075,7 @@ def lepass_ui():
         st.image(teaser_image, caption=f"Level {teaser_level} Preview", width=150)
 
     st.markdown("<h3 class='lepass-section-header'>How to Earn XP</h3>", unsafe_allow_html=True)
-    cA, cB, cC = st.columns(3)
+    cA, cB, cC, cD = st.columns(4)
     with cA:
         st.markdown("#### Easy Difficulty")
         st.markdown("- Win: 75-100 XP")
@@ -1829,11 +1088,15 @@ def lepass_ui():
         st.markdown("#### Hard Difficulty")
         st.markdown("- Win: 150-200 XP")
         st.markdown("- Loss: 50-100 XP")
+    with cD:
+        st.markdown("#### Nightmare Difficulty")
+        st.markdown("- Win: 187-250 XP")
+        st.markdown("- Loss: 62-125 XP")
     st.info("💡 **TIP:** Higher health at the end of battle = more XP!")
 
     st.markdown("<h3 class='lepass-section-header'>Level Progression</h3>", unsafe_allow_html=True)
-    levels = list(range(1, 61))
-    xp_requirements = [xp_required_for_level(lvl) for lvl in levels]
+    levels = list(range(1, MAX_LEVEL + 1))
+    xp_requirements = XP_THRESHOLDS
 
     st.vega_lite_chart(
         {
@@ -1875,6 +1138,7 @@ def lepass_ui():
         st.rerun()
 
 
+@profiling.timed("page.lecareer_ui")
 def lecareer_ui():
     if not st.session_state.get("logged_in", False):
         st.error("You must be logged in to view LeCareer!")
@@ -1904,6 +1168,7 @@ def lecareer_ui():
     st.markdown("<!-- Omitted for brevity -->", unsafe_allow_html=True)
 
 
+@profiling.timed("page.register_ui")
 def register_ui():
     st.markdown("<h1 class='auth-title'>Create Account</h1>", unsafe_allow_html=True)
     st.markdown("<p class='auth-subtitle'>Join the battle against LeBron</p>", unsafe_allow_html=True)
@@ -1919,12 +1184,17 @@ def register_ui():
     cA, cB, cC = st.columns([1, 3, 1])
     with cB:
         if st.button("Create Account", use_container_width=True):
-            if register_user(username, password):
-                st.success("Account created successfully!")
-                st.session_state.page = "Login"
-                st.rerun()
+            try:
+                created = register_user(username, password)
+            except auth.AuthBusy:
+                st.error("Lots of players are signing up right now, try again in a moment.")
             else:
-                st.error("Username already exists.")
+                if created:
+                    st.success("Account created successfully!")
+                    st.session_state.page = "Login"
+                    st.rerun()
+                else:
+                    st.error("Username already exists.")
 
     st.markdown("<div class='auth-footer'>", unsafe_allow_html=True)
     st.markdown("Already have an account? Sign in!", unsafe_allow_html=True)
@@ -1944,6 +1214,7 @@ def register_ui():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@profiling.timed("page.logout_ui")
 def logout_ui():
     st.markdown("<h1 class='auth-title'>Log Out</h1>", unsafe_allow_html=True)
     st.markdown("<p class='auth-subtitle'>Are you sure you want to leave?</p>", unsafe_allow_html=True)
@@ -1960,15 +1231,18 @@ def logout_ui():
             st.rerun()
     with colB:
         if st.button("Confirm LeLogout", use_container_width=True):
+            revoke_sessions(st.session_state.username)
             for key in list(st.session_state.keys()):
                 if key != "page":
                     del st.session_state[key]
+            set_session_cookie(None)
             st.success("Logged out successfully!")
             st.session_state.page = "Login"
             st.rerun()
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@profiling.timed("page.play_ui")
 def play_ui():
     if not st.session_state.get("logged_in", False):
         st.error("You must be logged in to play!")
@@ -1981,188 +1255,287 @@ def play_ui():
         display_game()
 
 
-st.markdown(
-    """
- <style>
-     [data-testid="stAppViewContainer"] {
-         background-image: url("https://i.imgur.com/v5gUNvA.png");
-         background-size: 90%;
-         background-position: 300% ;
-         background-repeat: no-repeat;
-         background-attachment: local;
-     }
-
-     [data-testid="stAppViewContainer"]::after {
-         content: "";
-         position: absolute;
-         top: 0;
-         left: 0;
-         width: 100%;
-         height: 100%;
-         background-color: rgba(255, 255, 255, 0.7);
-         z-index: -1;
-         pointer-events: none;
-     }
-
-     .game-title {
-         font-size: 3rem;
-         font-weight: 800;
-         background: linear-gradient(45deg, #4880EC, #019CAD);
-         -webkit-background-clip: text;
-         -webkit-text-fill-color: transparent;
-         text-align: center;
-         margin-bottom: 30px;
-     }
-     .player-card, .lebron-card {
-         background-color: white;
-         border-radius: 15px;
-         padding: 20px;
-         box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-         margin-bottom: 20px;
-     }
-     .custom-avatar-container {
-         border-radius: 15px;
-         overflow: hidden;
-         box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-         margin-bottom: 10px;
-     }
-     .stat-label {
-         font-weight: bold;
-         margin-bottom: 5px;
-     }
-     .move-info {
-         font-size: 0.9rem;
-         color: #666;
-         margin-top: 4px;
-     }
-     .log-entry {
-         padding: 8px 12px;
-         margin: 8px 0;
-         border-radius: 8px;
-     }
-     .player-log {
-         background-color: #e6f7ff;
-         border-left: 4px solid #4880EC;
-     }
-     .lebron-log {
-         background-color: #fff1f0;
-         border-left: 4px solid #FF416C;
-     }
-     .system-log {
-         background-color: #f6ffed;
-         border-left: 4px solid #52c41a;
-     }
-     .auth-container {
-         max-width: 450px;
-         margin: 0 auto;
-         padding: 30px;
-         background: white;
-         border-radius: 12px;
-         box-shadow: 0 6px 20px rgba(0,0,0,0.1);
-     }
-     .auth-header {
-         text-align: center;
-         margin-bottom: 25px;
-     }
-     .auth-title {
-         font-size: 2.2rem;
-         font-weight: 700;
-         background: linear-gradient(45deg, #4880EC, #019CAD);
-         -webkit-background-clip: text;
-         -webkit-text-fill-color: #A70EC9;
-         margin-bottom: 5px;
-     }
-     .auth-subtitle {
-         color: #666;
-         font-size: 1.1rem;
-     }
-     .auth-input {
-         margin-bottom: 20px;
-     }
-     .auth-button {
-         width: 100%;
-         background: linear-gradient(45deg, #4880EC, #019CAD);
-         color: white;
-         border: none;
-         padding: 12px;
-         border-radius: 6px;
-         font-weight: 600;
-         cursor: pointer;
-         transition: all 0.3s ease;
-     }
-     .auth-button:hover {
-         transform: translateY(-2px);
-         box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-     }
-     .auth-footer {
-         text-align: center;
-         margin-top: 20px;
-         font-size: 0.9rem;
-         color: #666;
-     }
-     .auth-link {
-         color: #4880EC;
-         text-decoration: none;
-         font-weight: 600;
-     }
-     .auth-logo {
-         text-align: center;
-         margin-bottom: 20px;
-     }
-     .sidebar-header {
-         display: flex;
-         align-items: center;
-         padding: 10px 0;
-         margin-bottom: 20px;
-     }
-     .sidebar-logo {
-         width: 1500px;
-         height: 80px;
-         border-radius: 50%;
-         margin-right: 20px;
-         object-fit: cover;
-     }
-     .sidebar-title {
-         font-weight: 1600;
-         color: #eeff40;
-     }
-     [data-testid="stSidebar"] {
-         background-image: url('https://pbs.twimg.com/media/E_sz6efVIAIXSmP.jpg');
-         background-size: cover;
-         background-position: 90%;
-         background-repeat: no-repeat;
-         position: relative;
-     }
-     [data-testid="stSidebar"]::before {
-         content: "";
-         position: absolute;
-         top: 0;
-         left: 0;
-         width: 100%;
-         height: 100%;
-         background-color: rgba(0, 0, 0, 0.6);
-         z-index: 0;
-     }
-     [data-testid="stSidebar"] > div {
-         position: relative;
-         z-index: 1;
-     }
-     [data-testid="stSidebar"] .stRadio label,
-     [data-testid="stSidebar"] p,
-     [data-testid="stSidebar"] div {
-         color: white !important;
-         font-weight: 500;
-         text-shadow: 1px 1px 3px rgba(0, 0, 0, 0.8);
-     }
- </style>
- """,
-    unsafe_allow_html=True,
-)
+with profiling.phase("ui.css"):
+    st.markdown(
+        """
+     <style>
+         [data-testid="stAppViewContainer"] {
+             background-image: url("https://i.imgur.com/v5gUNvA.png");
+             background-size: 90%;
+             background-position: 300% ;
+             background-repeat: no-repeat;
+             background-attachment: local;
+         }
+
+         [data-testid="stAppViewContainer"]::after {
+             content: "";
+             position: absolute;
+             top: 0;
+             left: 0;
+             width: 100%;
+             height: 100%;
+             background-color: rgba(255, 255, 255, 0.7);
+             z-index: -1;
+             pointer-events: none;
+         }
+
+         .game-title {
+             font-size: 3rem;
+             font-weight: 800;
+             background: linear-gradient(45deg, #4880EC, #019CAD);
+             -webkit-background-clip: text;
+             -webkit-text-fill-color: transparent;
+             text-align: center;
+             margin-bottom: 30px;
+         }
+         .player-card, .lebron-card {
+             background-color: white;
+             border-radius: 15px;
+             padding: 20px;
+             box-shadow: 0 4px 12px rgba(0,0,0,0.1);
+             margin-bottom: 20px;
+         }
+         .custom-avatar-container {
+             border-radius: 15px;
+             overflow: hidden;
+             box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+             margin-bottom: 10px;
+         }
+         .stat-label {
+             font-weight: bold;
+             margin-bottom: 5px;
+         }
+         .move-info {
+             font-size: 0.9rem;
+             color: #666;
+             margin-top: 4px;
+         }
+         .log-entry {
+             padding: 8px 12px;
+             margin: 8px 0;
+             border-radius: 8px;
+         }
+         .player-log {
+             background-color: #e6f7ff;
+             border-left: 4px solid #4880EC;
+         }
+         .lebron-log {
+             background-color: #fff1f0;
+             border-left: 4px solid #FF416C;
+         }
+         .system-log {
+             background-color: #f6ffed;
+             border-left: 4px solid #52c41a;
+         }
+         .auth-container {
+             max-width: 450px;
+             margin: 0 auto;
+             padding: 30px;
+             background: white;
+             border-radius: 12px;
+             box-shadow: 0 6px 20px rgba(0,0,0,0.1);
+         }
+         .auth-header {
+             text-align: center;
+             margin-bottom: 25px;
+         }
+         .auth-title {
+             font-size: 2.2rem;
+             font-weight: 700;
+             background: linear-gradient(45deg, #4880EC, #019CAD);
+             -webkit-background-clip: text;
+             -webkit-text-fill-color: #A70EC9;
+             margin-bottom: 5px;
+         }
+         .auth-subtitle {
+             color: #666;
+             font-size: 1.1rem;
+         }
+         .auth-input {
+             margin-bottom: 20px;
+         }
+         .auth-button {
+             width: 100%;
+             background: linear-gradient(45deg, #4880EC, #019CAD);
+             color: white;
+             border: none;
+             padding: 12px;
+             border-radius: 6px;
+             font-weight: 600;
+             cursor: pointer;
+             transition: all 0.3s ease;
+         }
+         .auth-button:hover {
+             transform: translateY(-2px);
+             box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+         }
+         .auth-footer {
+             text-align: center;
+             margin-top: 20px;
+             font-size: 0.9rem;
+             color: #666;
+         }
+         .auth-link {
+             color: #4880EC;
+             text-decoration: none;
+             font-weight: 600;
+         }
+         .auth-logo {
+             text-align: center;
+             margin-bottom: 20px;
+         }
+         .sidebar-header {
+             display: flex;
+             align-items: center;
+             padding: 10px 0;
+             margin-bottom: 20px;
+         }
+         .sidebar-logo {
+             width: 1500px;
+             height: 80px;
+             border-radius: 50%;
+             margin-right: 20px;
+             object-fit: cover;
+         }
+         .sidebar-title {
+             font-weight: 1600;
+             color: #eeff40;
+         }
+         [data-testid="stSidebar"] {
+             background-image: url('https://pbs.twimg.com/media/E_sz6efVIAIXSmP.jpg');
+             background-size: cover;
+             background-position: 90%;
+             background-repeat: no-repeat;
+             position: relative;
+         }
+         [data-testid="stSidebar"]::before {
+             content: "";
+             position: absolute;
+             top: 0;
+             left: 0;
+             width: 100%;
+             height: 100%;
+             background-color: rgba(0, 0, 0, 0.6);
+             z-index: 0;
+         }
+         [data-testid="stSidebar"] > div {
+             position: relative;
+             z-index: 1;
+         }
+         [data-testid="stSidebar"] .stRadio label,
+         [data-testid="stSidebar"] p,
+         [data-testid="stSidebar"] div {
+             color: white !important;
+             font-weight: 500;
+             text-shadow: 1px 1px 3px rgba(0, 0, 0, 0.8);
+         }
+     </style>
+     """,
+        unsafe_allow_html=True,
+    )
+
+
+def display_profile_panel(record):
+    with st.sidebar.expander("Profiler"):
+        st.checkbox("Profile every rerun of this session", key="profile_session")
+        if record is None:
+            st.caption("This rerun was not sampled.")
+            return
+        st.caption(f"Rerun took {record['total_ms']:.1f} ms; trace appended to {profiling.TRACE_PATH}")
+        st.table(
+            [
+                {"phase": "· " * row["depth"] + row["phase"], "calls": row["calls"], "ms": round(row["ms"], 2)}
+                for row in profiling.summarize(record["phases"])
+            ]
+        )
+        st.caption("SQLite connections")
+        st.table(
+            [
+                {
+                    "thread": row["thread"],
+                    "statements": row["statements"],
+                    "ms": round(row["seconds"] * 1000, 1),
+                    "commits": row["commits"],
+                    "busy errors": row["busy_errors"],
+                    "lock wait ms": round(row["lock_wait_seconds"] * 1000, 1),
+                    "adopted": row["adoptions"],
+                }
+                for row in db.stats()
+            ]
+        )
+        st.caption("Spectator snapshots (shared by every session)")
+        st.table([room_snapshots().stats])
+        st.caption("User stats cache (shared by every session)")
+        st.table([{key: round(value, 3) if key == "hit_rate" else value for key, value in stats_cache.stats().items()}])
+        st.caption("Password hashing pool")
+        stats = auth.pool().stats()
+        st.table(
+            [
+                {
+                    "workers": stats["workers"],
+                    "pending": stats["pending"],
+                    "queue depth": stats["queue_depth"],
+                    "peak pending": stats["peak_pending"],
+                    "completed": stats["completed"],
+                    "rejected": stats["rejected"],
+                    "mean queue ms": round(stats["mean_queue_ms"], 1),
+                    "mean hash ms": round(stats["mean_work_ms"], 1),
+                }
+            ]
+        )
+
+
+SESSION_COOKIE = "lebronsim_session"
+
+
+def set_session_cookie(token):
+    """Queue a session cookie for the browser (None clears it); ``write_session_cookie`` sends it."""
+    st.session_state.session_cookie = token
+
+
+def write_session_cookie():
+    """Send a queued cookie change, on the rerun after the one that queued it so ``st.rerun`` cannot drop it."""
+    if "session_cookie" not in st.session_state:
+        return
+    token = st.session_state.pop("session_cookie")
+    max_age = auth.TOKEN_SECONDS if token else 0
+    st.html(
+        f"""<script>
+        document.cookie = "{SESSION_COOKIE}={token or ''}; Path=/; Max-Age={max_age}; SameSite=Strict"
+            + (location.protocol === "https:" ? "; Secure" : "");
+        </script>""",
+        unsafe_allow_javascript=True,
+    )
+
+
+def restore_session():
+    """Sign a returning browser back in from its session cookie; no bcrypt, one users lookup."""
+    if st.session_state.get("logged_in", False) or st.session_state.get("session_checked", False):
+        return
+    st.session_state.session_checked = True
+    if "session" in st.query_params:
+        del st.query_params["session"]  # tokens used to travel in the URL
+    token = st.context.cookies.get(SESSION_COOKIE)
+    if not token:
+        return
+    username = session_user(token)
+    if username is None:
+        set_session_cookie(None)
+        return
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    if st.session_state.get("page") in (None, "Login", "Register"):
+        st.session_state.page = "LePlay"
 
 
 def main():
-    init_db()
-    init_multiplayer_db()
+    db.rollback_stale()
+    with profiling.phase("db.migrations"):
+        run_migrations()
+    start_room_janitor()
+    start_turn_timer()
+    restore_session()
+    write_session_cookie()
 
     if "page" not in st.session_state:
         st.session_state.page = "Login" if not st.session_state.get("logged_in", False) else "LePlay"
@@ -2205,4 +1578,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        profile = profiling.finish_rerun(st.session_state.get("page"))
+    if profiling.ENABLED:
+        display_profile_panel(profile)
@@ -0,0 +1,348 @@
+"""Load generator for the SQLite PvP path.
+
+Simulated players play real best-of-3 matches through the ``rooms`` functions
+the app uses (``create_room``, ``join_room``, ``update_player_move`` and
+``process_multiplayer_turn``) against a scratch database.  Every player is a
+thread; players are paired into matches and spread over worker processes, so
+the database sees contention between connections in different processes as
+well as threads.  Players poll their room the way the PvP screen does, think
+for an exponentially distributed time before each move, and now and then take
+longer than the move clock, in which case the parent process's
+``rooms.TurnTimer`` plays for them, as it would in the app.
+
+Players are named ``loadgen_p...`` and only their rooms are cleaned up between
+steps.  ``--db`` refuses a file holding anyone else's users or rooms unless
+``--allow-foreign`` is given, so it cannot be pointed at a live ``users.db`` by
+mistake; the check reads the file before anything migrates or writes to it.
+
+    python -m loadgen --players 50 100 200 400 --processes 2 --seconds 30
+
+Each ``--players`` value is one step, reported on its own line:
+
+* rooms/s, matches/s and turns/s (turns the timer resolved are counted too),
+* turn latency: from the second move being sent to the resolved turn being
+  written, as the second player's client sees it,
+* "database is locked" retries (after the busy timeout ran out) and failures,
+* write-lock wait: time spent in ``BEGIN IMMEDIATE``, from ``db.stats()``.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pathlib
+import queue
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import migrations
+import rooms
+from bench import percentile
+
+THINK_SECONDS = 2.0
+POLL_SECONDS = 0.4
+RETRIES = 5
+RETRY_BACKOFF = 0.05
+RAMP_SECONDS = 5.0
+SLO_MS = 250.0
+PLAYER_PREFIX = "loadgen_p"
+OWN = "LIKE '" + PLAYER_PREFIX.replace("_", "\\_") + "%' ESCAPE '\\'"  # SQL test for "created by loadgen"
+
+LATENCIES = ("turn", "move", "process", "create", "join", "delete", "poll")
+COUNTERS = ("rooms", "matches", "turns", "late_moves", "retries", "failures")
+
+
+def new_metrics():
+    metrics = {f"{name}_latency": [] for name in LATENCIES}
+    metrics.update({name: 0 for name in COUNTERS})
+    return metrics
+
+
+class Player:
+    """One simulated client; ``call`` times every database op and retries lock errors."""
+
+    def __init__(self, name, options, stop, rng):
+        self.name = name
+        self.options = options
+        self.metrics = new_metrics()
+        self.stop = stop
+        self.rng = rng
+
+    def call(self, op, func, *args, **kwargs):
+        for attempt in range(RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except sqlite3.OperationalError as exc:
+                if "locked" not in str(exc) and "busy" not in str(exc):
+                    raise
+                self.metrics["retries"] += 1
+                db.rollback_stale()
+                time.sleep(RETRY_BACKOFF * 2**attempt * self.rng.random())
+                continue
+            self.metrics[f"{op}_latency"].append(time.perf_counter() - start)
+            return result
+        self.metrics["failures"] += 1
+        return None
+
+    def think(self):
+        """Exponential think time, capped a little past the move clock so some turns time out."""
+        delay = min(self.rng.expovariate(1 / self.options["think"]), self.options["turn_seconds"] * 1.5)
+        return not self.stop.wait(delay)
+
+    def poll(self, room_code, room):
+        """Sleep one poll interval, then return the room (re-read only if its version moved)."""
+        if self.stop.wait(self.options["poll"]):
+            return None
+        version = self.call("poll", rooms.get_room_version, room_code)
+        if version is None:
+            return None
+        if room is None or version != room["version"]:
+            room = self.call("poll", rooms.get_room_state, room_code)
+        return room
+
+    def play_match(self, room_code, seat):
+        """Play until the match is over, the room disappears or the run stops."""
+        room = None
+        while True:
+            room = self.poll(room_code, room)
+            if room is None:
+                return False
+            if room["game_state"] == "match_over":
+                return True
+            if room["game_state"] != "playing" or room[f"{seat}_ready"]:
+                continue
+            if not self.think():
+                return False
+            move = "attack" if room[f"{seat}_stamina"] >= 15 and self.rng.random() < 0.6 else self.rng.choice(
+                ("defend", "rest")
+            )
+            start = time.perf_counter()
+            submitted = self.call("move", rooms.update_player_move, room_code, self.name, move)
+            if submitted is None:
+                self.metrics["late_moves"] += 1  # the turn clock got there first, or the match ended
+                continue
+            if submitted["both_ready"]:
+                result = self.call("process", rooms.process_multiplayer_turn, room_code, version=submitted["version"])
+                if result is not None:
+                    self.metrics["turn_latency"].append(time.perf_counter() - start)
+                    self.metrics["turns"] += 1
+
+    def host(self, codes):
+        self.stop.wait(self.rng.uniform(0, self.options["ramp"]))  # players trickle in rather than arrive at once
+        while not self.stop.is_set():
+            room_code = self.call("create", rooms.create_room, self.name)
+            if room_code is None:
+                continue
+            self.metrics["rooms"] += 1
+            codes.put(room_code)
+            if self.play_match(room_code, "player1"):
+                self.metrics["matches"] += 1
+            self.call("delete", rooms.delete_room, room_code, self.name)
+
+    def guest(self, codes):
+        while not self.stop.is_set():
+            try:
+                room_code = codes.get(timeout=self.options["poll"])
+            except queue.Empty:
+                continue
+            if self.call("join", rooms.join_room, room_code, self.name):
+                self.play_match(room_code, "player2")
+
+
+def worker(index, pairs, options):
+    """One process: ``pairs`` host/guest thread pairs until ``options["seconds"]`` pass."""
+    db.DB_PATH = options["db"]
+    db.BUSY_TIMEOUT = options["busy_timeout"]
+    stop = threading.Event()
+    players = []
+    threads = []
+    for pair in range(pairs):
+        codes = queue.Queue()
+        for role in ("host", "guest"):
+            player = Player(
+                f"{PLAYER_PREFIX}{index}_{pair}_{role}", options, stop, random.Random(f"{options['seed']}-{index}-{pair}-{role}")
+            )
+            players.append(player)
+            threads.append(threading.Thread(target=getattr(player, role), args=(codes,), daemon=True))
+    for thread in threads:
+        thread.start()
+    stop.wait(options["seconds"])
+    stop.set()
+    for thread in threads:
+        thread.join(options["turn_seconds"] + 5)
+    metrics = merge(player.metrics for player in players)
+    connections = db.stats()
+    metrics["busy_errors"] = sum(row["busy_errors"] for row in connections)
+    metrics["lock_waits"] = sum(row["lock_waits"] for row in connections)
+    metrics["lock_wait_seconds"] = sum(row["lock_wait_seconds"] for row in connections)
+    metrics["lock_wait_max"] = max((row["lock_wait_max"] for row in connections), default=0.0)
+    db.close_all()
+    return metrics
+
+
+def merge(results):
+    merged = new_metrics()
+    merged.update(busy_errors=0, lock_waits=0, lock_wait_seconds=0.0, lock_wait_max=0.0)
+    for metrics in results:
+        for key, value in metrics.items():
+            if isinstance(value, list):
+                merged[key].extend(value)
+            elif key == "lock_wait_max":
+                merged[key] = max(merged[key], value)
+            else:
+                merged[key] += value
+    return merged
+
+
+def latency_ms(samples, fraction):
+    return percentile(sorted(samples), fraction) * 1000 if samples else 0.0
+
+
+def run_step(players, options):
+    """Run one load level in fresh worker processes; returns the summary row."""
+    processes = min(options["processes"], max(1, players // 2))
+    matches = players // 2
+    pairs = [matches // processes + (1 if i < matches % processes else 0) for i in range(processes)]
+    with db.transaction(options["db"]) as conn:
+        # leftovers from the previous step; never anyone else's rooms
+        conn.execute(f"DELETE FROM multiplayer_rooms WHERE player1 {OWN}")
+    timer = rooms.start_turn_timer(options["turn_seconds"])
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes) as pool:
+        results = pool.starmap(worker, [(i, count, options) for i, count in enumerate(pairs)])
+    elapsed = time.perf_counter() - start
+    timer.stop()
+    metrics = merge(results)
+
+    turns = metrics["turns"] + timer.resolved
+    row = {
+        "players": players,
+        "matches": matches,
+        "processes": processes,
+        "seconds": elapsed,
+        "rooms_per_sec": metrics["rooms"] / elapsed,
+        "matches_per_sec": metrics["matches"] / elapsed,
+        "turns_per_sec": turns / elapsed,
+        "timer_turns": timer.resolved,
+        "turn_p50_ms": latency_ms(metrics["turn_latency"], 0.50),
+        "turn_p90_ms": latency_ms(metrics["turn_latency"], 0.90),
+        "turn_p99_ms": latency_ms(metrics["turn_latency"], 0.99),
+        "turn_max_ms": latency_ms(metrics["turn_latency"], 1.0),
+        "move_p99_ms": latency_ms(metrics["move_latency"], 0.99),
+        "poll_p99_ms": latency_ms(metrics["poll_latency"], 0.99),
+        "late_moves": metrics["late_moves"],
+        "locked_retries": metrics["retries"],
+        "busy_errors": metrics["busy_errors"],
+        "failures": metrics["failures"],
+        "lock_waits": metrics["lock_waits"],
+        "lock_wait_total_s": metrics["lock_wait_seconds"],
+        "lock_wait_mean_ms": metrics["lock_wait_seconds"] / metrics["lock_waits"] * 1000 if metrics["lock_waits"] else 0.0,
+        "lock_wait_max_ms": metrics["lock_wait_max"] * 1000,
+    }
+    row["ok"] = row["failures"] == 0 and row["turn_p99_ms"] <= options["slo_ms"]
+    return row
+
+
+def foreign_data(path):
+    """How many users and rooms in ``path`` this tool did not create, read without changing the file."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0, 0
+    conn = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        users = rooms_count = 0
+        if "users" in tables:
+            users = conn.execute(f"SELECT COUNT(*) FROM users WHERE username NOT {OWN}").fetchone()[0]
+        if "multiplayer_rooms" in tables:
+            rooms_count = conn.execute(f"SELECT COUNT(*) FROM multiplayer_rooms WHERE player1 NOT {OWN}").fetchone()[0]
+        return users, rooms_count
+    finally:
+        conn.close()
+
+
+def report(rows, slo_ms):
+    print(
+        f"{'players':>7} {'rooms/s':>8} {'match/s':>8} {'turns/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+        f"{'max ms':>8} {'retries':>7} {'fail':>5} {'lock wait mean/max ms':>22}  p99<={slo_ms:g}ms"
+    )
+    for row in rows:
+        print(
+            f"{row['players']:>7} {row['rooms_per_sec']:>8.2f} {row['matches_per_sec']:>8.2f} {row['turns_per_sec']:>8.1f} "
+            f"{row['turn_p50_ms']:>8.1f} {row['turn_p90_ms']:>8.1f} {row['turn_p99_ms']:>8.1f} {row['turn_max_ms']:>8.1f} "
+            f"{row['locked_retries']:>7} {row['failures']:>5} "
+            f"{row['lock_wait_mean_ms']:>10.2f} /{row['lock_wait_max_ms']:>10.1f}  {'yes' if row['ok'] else 'NO'}"
+        )
+    supported = [row["matches"] for row in rows if row["ok"]]
+    if supported:
+        print(f"largest step within the SLO: {max(supported)} concurrent matches")
+    else:
+        print("no step stayed within the SLO")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent PvP matches against a scratch SQLite database")
+    parser.add_argument("--players", type=int, nargs="+", default=[50, 100, 200], help="players per step (2 per match)")
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=30.0, help="length of each step")
+    parser.add_argument("--think", type=float, default=THINK_SECONDS, help="mean think time before a move")
+    parser.add_argument("--ramp", type=float, default=RAMP_SECONDS, help="spread match starts over this many seconds")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="room poll interval, as in the PvP screen")
+    parser.add_argument("--turn-seconds", type=float, default=rooms.TURN_SECONDS, help="move clock")
+    parser.add_argument("--busy-timeout", type=float, default=db.BUSY_TIMEOUT, help="SQLite busy timeout per connection")
+    parser.add_argument("--slo-ms", type=float, default=SLO_MS, help="p99 turn latency a step must stay under")
+    parser.add_argument("--db", default=None,
+                        help="scratch database file to reuse (default: a throwaway one); refused if it has other users or rooms")
+    parser.add_argument("--allow-foreign", action="store_true",
+                        help="run against a --db that has other users or rooms; they are left as they are")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="also write the rows to this file")
+    args = parser.parse_args(argv)
+
+    scratch = None if args.db else tempfile.mkdtemp(prefix="lebronsim-loadgen-")
+    path = args.db or os.path.join(scratch, "loadgen.db")
+    db.DB_PATH = path
+    db.BUSY_TIMEOUT = args.busy_timeout
+    options = {
+        "db": path,
+        "processes": args.processes,
+        "seconds": args.seconds,
+        "think": args.think,
+        "ramp": args.ramp,
+        "poll": args.poll,
+        "turn_seconds": args.turn_seconds,
+        "busy_timeout": args.busy_timeout,
+        "slo_ms": args.slo_ms,
+        "seed": args.seed,
+    }
+    try:
+        users, rooms_count = foreign_data(path)
+        if (users or rooms_count) and not args.allow_foreign:
+            print(f"{path} has {users} users and {rooms_count} rooms that are not from loadgen; "
+                  "point --db at a scratch file, or pass --allow-foreign to run alongside them", file=sys.stderr)
+            return 2
+        migrations.migrate(path)
+        rows = []
+        for players in args.players:
+            rows.append(run_step(players, options))
+            print(f"  {players} players done", file=sys.stderr)
+        report(rows, args.slo_ms)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(rows, f, indent=2)
+    finally:
+        db.close_all()
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Versioned schema migrations for users.db.
+
+``migrate`` applies every migration newer than the version recorded in the
+``schema_version`` table, inside one ``BEGIN IMMEDIATE`` transaction, so two
+processes starting together cannot both apply the same step.  Databases
+created by the old import-time DDL have no ``schema_version`` table; every
+step below is written to be a no-op on them, so they simply get stamped.
+
+Add new steps to the end of ``MIGRATIONS`` and never edit a released one.
+"""
+
+import db
+
+
+def create_users(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password BLOB,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            wins INTEGER DEFAULT 0,
+            losses INTEGER DEFAULT 0
+        )
+        """
+    )
+
+
+def create_multiplayer_rooms(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS multiplayer_rooms (
+            room_code TEXT PRIMARY KEY,
+            player1 TEXT,
+            player2 TEXT,
+            player1_ready BOOLEAN DEFAULT 0,
+            player2_ready BOOLEAN DEFAULT 0,
+            player1_move TEXT,
+            player2_move TEXT,
+            player1_hp INTEGER DEFAULT 140,
+            player2_hp INTEGER DEFAULT 140,
+            player1_stamina INTEGER DEFAULT 100,
+            player2_stamina INTEGER DEFAULT 100,
+            player1_special INTEGER DEFAULT 0,
+            player2_special INTEGER DEFAULT 0,
+            current_round INTEGER DEFAULT 1,
+            current_turn INTEGER DEFAULT 1,  -- 1 = player1, 2 = player2
+            game_state TEXT DEFAULT 'waiting',  -- waiting, playing, finished
+            winner TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_action TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            player1_wins INTEGER DEFAULT 0,
+            player2_wins INTEGER DEFAULT 0,
+            match_round INTEGER DEFAULT 1  -- For best of 3
+        )
+        """
+    )
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_column(conn, table, column, definition):
+    if column not in columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def add_multiplayer_stats(conn):
+    add_column(conn, "users", "multiplayer_wins", "INTEGER DEFAULT 0")
+    add_column(conn, "users", "multiplayer_losses", "INTEGER DEFAULT 0")
+
+
+def add_room_version(conn):
+    add_column(conn, "multiplayer_rooms", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_room_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rooms_last_action ON multiplayer_rooms (last_action)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rooms_state_last_action ON multiplayer_rooms (game_state, last_action)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rooms_created_at ON multiplayer_rooms (created_at)")
+
+
+def create_room_events(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS room_events (
+            room_code TEXT NOT NULL,
+            seq INTEGER NOT NULL,  -- 1, 2, 3... per room
+            match_round INTEGER NOT NULL,
+            turn INTEGER NOT NULL,
+            player1_move TEXT NOT NULL,
+            player2_move TEXT NOT NULL,
+            player1_damage INTEGER NOT NULL,
+            player2_damage INTEGER NOT NULL,
+            player1_hp INTEGER NOT NULL,
+            player2_hp INTEGER NOT NULL,
+            player1_stamina INTEGER NOT NULL,
+            player2_stamina INTEGER NOT NULL,
+            player1_special INTEGER NOT NULL,
+            player2_special INTEGER NOT NULL,
+            round_winner TEXT,
+            match_winner TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (room_code, seq)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS room_events_cleanup AFTER DELETE ON multiplayer_rooms
+        BEGIN
+            DELETE FROM room_events WHERE room_code = OLD.room_code;
+        END
+        """
+    )
+
+
+def add_token_generation(conn):
+    # bumped to revoke every session token issued to the user so far
+    add_column(conn, "users", "token_generation", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_idle_turns(conn):
+    # consecutive turns the move clock played for both seats
+    add_column(conn, "multiplayer_rooms", "idle_turns", "INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = [
+    (1, "create users", create_users),
+    (2, "create multiplayer_rooms", create_multiplayer_rooms),
+    (3, "add multiplayer wins/losses to users", add_multiplayer_stats),
+    (4, "add multiplayer_rooms.version", add_room_version),
+    (5, "index multiplayer_rooms by activity, state and age", add_room_indexes),
+    (6, "create room_events", create_room_events),
+    (7, "add users.token_generation", add_token_generation),
+    (8, "add multiplayer_rooms.idle_turns", add_idle_turns),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(path=None):
+    """Bring the database up to ``LATEST``; returns the versions before and after."""
+    conn = db.connect(path)
+    if conn.in_transaction:
+        conn.rollback()
+    with db.transaction(path, immediate=True):
+        start = current_version(conn)
+        applied = []
+        for version, description, step in MIGRATIONS:
+            if version > start:
+                step(conn)
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+                applied.append(description)
+    return {"from": start, "to": max(start, LATEST), "applied": applied}
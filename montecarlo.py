@@ -0,0 +1,207 @@
+"""Parallel Monte Carlo win-rate estimates against each LeBron difficulty.
+
+Battles are split into chunks and spread over a ``ProcessPoolExecutor``; each
+chunk runs the vectorized ``batch_sim`` engine with its own independent RNG
+stream spawned from one ``SeedSequence``.  Sampling stops early once every
+outcome's confidence interval is narrower than ``ci_width``.
+
+    python montecarlo.py --difficulty Hard --policy greedy -n 5000000 --ci-width 0.002
+"""
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import batch_sim
+from progression import TIE_XP, calculate_xp_reward
+
+Z_SCORES = {0.9: 1.6449, 0.95: 1.96, 0.99: 2.5758}
+
+
+def make_policy(policy, script=None):
+    if policy == "scripted":
+        if not script:
+            raise ValueError("The scripted policy needs a script, e.g. ['attack', 'defend', 'rest']")
+        return batch_sim.scripted_policy(script)
+    if policy not in batch_sim.POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+    return batch_sim.POLICIES[policy]
+
+
+def xp_by_outcome(difficulty):
+    """XP for each (outcome, remaining player health) pair, as a lookup array."""
+    health = range(batch_sim.PLAYER_MAX_HEALTH + 1)
+    table = np.zeros((len(batch_sim.OUTCOMES), len(health)), dtype=np.int64)
+    table[batch_sim.WIN] = [calculate_xp_reward(hp, 0, difficulty, True) for hp in health]
+    table[batch_sim.LOSS] = [calculate_xp_reward(hp, 0, difficulty, False) for hp in health]
+    table[batch_sim.TIE] = TIE_XP
+    return table
+
+
+def run_chunk(difficulty, policy, script, battles, seed, max_rounds):
+    """Worker entry point; returns sums so only a few numbers cross the process boundary."""
+    rng = np.random.default_rng(seed)
+    results = batch_sim.simulate_batch(
+        difficulty, battles, make_policy(policy, script), rng=rng, max_rounds=max_rounds
+    )
+    outcome = results["outcome"]
+    finished = outcome != batch_sim.UNFINISHED
+    xp = xp_by_outcome(difficulty)[outcome[finished], results["player_health"][finished]]
+    return {
+        "counts": np.bincount(outcome, minlength=len(batch_sim.OUTCOMES)),
+        "rounds": int(results["rounds"].sum()),
+        "xp": int(xp.sum()),
+    }
+
+
+def wilson_interval(successes, total, z):
+    if total == 0:
+        return (0.0, 1.0)
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+
+def summarize(difficulty, policy, counts, rounds, xp, confidence, elapsed, stopped_early):
+    z = Z_SCORES[confidence]
+    total = int(counts.sum())
+    finished = total - int(counts[batch_sim.UNFINISHED])
+    summary = {
+        "difficulty": difficulty,
+        "policy": policy,
+        "battles": total,
+        "confidence": confidence,
+        "avg_rounds": rounds / total if total else 0.0,
+        "avg_xp": xp / finished if finished else 0.0,
+        "elapsed": elapsed,
+        "stopped_early": stopped_early,
+    }
+    for code, name in enumerate(batch_sim.OUTCOMES):
+        low, high = wilson_interval(int(counts[code]), total, z)
+        summary[name] = {"rate": counts[code] / total if total else 0.0, "low": low, "high": high}
+    return summary
+
+
+def widest_interval(summary):
+    return max(summary[name]["high"] - summary[name]["low"] for name in ("win", "loss", "tie"))
+
+
+def simulate(
+    difficulty,
+    policy="random",
+    n=1_000_000,
+    script=None,
+    workers=None,
+    seed=None,
+    ci_width=None,
+    confidence=0.95,
+    chunk_size=100_000,
+    max_rounds=500,
+):
+    """Estimate win/loss/tie rates, average rounds and average XP for ``n`` battles.
+
+    ``policy`` is "random", "greedy" or "scripted" (with ``script`` a list of
+    action names).  With ``ci_width`` set, sampling stops as soon as every
+    outcome's interval is narrower than that, possibly well before ``n``.
+    """
+    if difficulty not in batch_sim.LEBRON_HEALTH:
+        raise ValueError(f"Unknown difficulty: {difficulty}")
+    if confidence not in Z_SCORES:
+        raise ValueError(f"confidence must be one of {sorted(Z_SCORES)}")
+    make_policy(policy, script)
+
+    workers = workers or os.cpu_count() or 1
+    root = np.random.SeedSequence(seed)
+    sizes = [chunk_size] * (n // chunk_size)
+    if n % chunk_size:
+        sizes.append(n % chunk_size)
+
+    counts = np.zeros(len(batch_sim.OUTCOMES), dtype=np.int64)
+    rounds = 0
+    xp = 0
+    stopped_early = False
+    start = time.perf_counter()
+
+    def absorb(part):
+        nonlocal counts, rounds, xp
+        counts = counts + part["counts"]
+        rounds += part["rounds"]
+        xp += part["xp"]
+
+    def converged():
+        if ci_width is None:
+            return False
+        partial = summarize(difficulty, policy, counts, rounds, xp, confidence, 0, False)
+        return widest_interval(partial) < ci_width
+
+    args = [(difficulty, policy, script, size, child, max_rounds)
+            for size, child in zip(sizes, root.spawn(len(sizes)))]
+
+    if workers == 1:
+        for chunk in args:
+            absorb(run_chunk(*chunk))
+            if converged():
+                stopped_early = len(args) > 1
+                break
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            queue = iter(args)
+            pending = set()
+            for chunk in queue:
+                pending.add(pool.submit(run_chunk, *chunk))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    absorb(future.result())
+                if converged():
+                    stopped_early = bool(pending) or next(queue, None) is not None
+                    for future in pending:
+                        future.cancel()
+                    break
+                for chunk in queue:
+                    pending.add(pool.submit(run_chunk, *chunk))
+                    if len(pending) >= workers * 2:
+                        break
+
+    elapsed = time.perf_counter() - start
+    return summarize(difficulty, policy, counts, rounds, xp, confidence, elapsed, stopped_early)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo win rates against LeBron")
+    parser.add_argument("--difficulty", default="Medium", choices=list(batch_sim.LEBRON_HEALTH))
+    parser.add_argument("--policy", default="random", choices=["random", "greedy", "scripted"])
+    parser.add_argument("--script", default=None, help="comma separated moves for --policy scripted")
+    parser.add_argument("-n", "--battles", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ci-width", type=float, default=None)
+    parser.add_argument("--confidence", type=float, default=0.95, choices=sorted(Z_SCORES))
+    parser.add_argument("--chunk", type=int, default=100_000)
+    args = parser.parse_args()
+
+    script = args.script.split(",") if args.script else None
+    result = simulate(
+        args.difficulty, args.policy, args.battles, script=script, workers=args.workers,
+        seed=args.seed, ci_width=args.ci_width, confidence=args.confidence, chunk_size=args.chunk,
+    )
+
+    print(f"{result['battles']:,} {args.difficulty} battles ({args.policy}) in {result['elapsed']:.2f}s"
+          + (" - stopped early" if result["stopped_early"] else ""))
+    for name in ("win", "loss", "tie"):
+        stats = result[name]
+        print(f"  {name:>4}: {stats['rate']:.4f}  [{stats['low']:.4f}, {stats['high']:.4f}]")
+    print(f"  avg rounds: {result['avg_rounds']:.2f}")
+    print(f"  avg xp:     {result['avg_xp']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
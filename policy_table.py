@@ -0,0 +1,374 @@
+"""Compiled lookup table for ``LeBron.choose_action``.
+
+``LeBron.reference_decide`` rebuilds a weights dict and runs a chain of
+difficulty dependent multipliers on every call.  Everything it reads collapses
+into a small discrete key (a stamina band plus ten flags), so the whole
+decision is compiled once per difficulty into cumulative probabilities over
+six outcomes and a decision becomes one table lookup plus one uniform draw.
+
+``python policy_table.py --verify`` checks every key of every difficulty
+against the reference implementation by enumerating all of its random
+branches with exact fractions, then fuzzes concrete game states to confirm
+that the key captures every input the reference depends on.
+"""
+
+import argparse
+import copy
+import random
+from bisect import bisect_right
+from fractions import Fraction
+from functools import lru_cache
+
+MOVE_PATTERNS = {
+    "Easy": (0.4, 0.3, 0.25, 0.05),
+    "Medium": (0.45, 0.25, 0.2, 0.1),
+    "Hard": (0.5, 0.2, 0.15, 0.15),
+}
+
+# (action, whether the streak counters update), in table column order
+OUTCOMES = (
+    ("attack", True),
+    ("defend", True),
+    ("rest", True),
+    ("special", True),
+    ("special", False),
+    ("rest", False),
+)
+ATTACK, DEFEND, REST, SPECIAL, EARLY_SPECIAL, FORCED_REST = range(len(OUTCOMES))
+
+STAMINA_BANDS = 20
+FLAGS = (
+    "meter_full",
+    "lebron_low",
+    "lebron_fresh",
+    "opening",
+    "player_low",
+    "player_critical",
+    "player_defending",
+    "predicts_special",
+    "attack_streak",
+    "defend_streak",
+)
+KEYS = STAMINA_BANDS << len(FLAGS)
+
+
+def stamina_band(stamina):
+    """0 below 15, one band per point from 15 to 30, then 31-39, 40-50 and 51+."""
+    if stamina < 15:
+        return 0
+    if stamina <= 30:
+        return stamina - 14
+    if stamina < 40:
+        return 17
+    if stamina <= 50:
+        return 18
+    return 19
+
+
+# A stamina value inside each band, used to evaluate the weight formulas
+BAND_STAMINA = [10] + list(range(15, 31)) + [35, 45, 75]
+
+
+def state_key(lebron, player=None):
+    """Everything ``reference_decide`` reads, packed into one integer."""
+    smart = lebron.difficulty in ("Hard", "Medium")
+    flags = (
+        lebron.special_meter >= 100,
+        lebron.health < lebron.max_health * 0.3,
+        lebron.health > lebron.max_health * 0.8,
+        lebron.turn_count < 5,
+        bool(player) and player.health < player.max_health * 0.4,
+        bool(player) and player.health < player.max_health * 0.3,
+        bool(player) and player.is_defending,
+        smart
+        and bool(player)
+        and player.special_meter >= 75
+        and lebron.predict_player_action() == "special",
+        lebron.consecutive_attacks >= 2,
+        lebron.consecutive_defends >= 2,
+    )
+    key = stamina_band(lebron.stamina)
+    for flag in flags:
+        key = (key << 1) | flag
+    return key
+
+
+def unpack(key):
+    flags = {}
+    for name in reversed(FLAGS):
+        flags[name] = bool(key & 1)
+        key >>= 1
+    return key, flags
+
+
+def distribution(difficulty, key):
+    """Probability of each outcome in ``OUTCOMES`` for one key."""
+    band, flags = unpack(key)
+    probabilities = [0.0] * len(OUTCOMES)
+    if band == 0:
+        probabilities[FORCED_REST] = 1.0
+        return probabilities
+
+    stamina = BAND_STAMINA[band]
+    smart = difficulty in ("Hard", "Medium")
+    hard = difficulty == "Hard"
+    attack, defend, rest, special = MOVE_PATTERNS.get(difficulty, MOVE_PATTERNS["Hard"])
+    if not flags["meter_full"]:
+        special = 0
+
+    # Same multipliers in the same order as reference_decide, so the floats match
+    if stamina <= 30:
+        rest *= 1 + 2 * ((30 - stamina) / 30)
+    else:
+        rest *= 0.2
+
+    early = 0.0
+    if smart:
+        if flags["lebron_low"]:
+            defend *= 2.0
+        if flags["predicts_special"]:
+            defend *= 3.0
+        if flags["meter_full"] and flags["player_low"]:
+            probabilities[EARLY_SPECIAL] = 1.0
+            return probabilities
+        if flags["attack_streak"]:
+            attack *= 0.5
+        if flags["defend_streak"]:
+            defend *= 0.3
+        if flags["meter_full"]:
+            early = 0.8 if hard else 0.6
+        if flags["player_defending"]:
+            attack *= 0.4
+            rest *= 1.5
+
+    if hard:
+        if 15 < stamina < 40:
+            rest *= 1.5
+        if flags["player_critical"]:
+            attack *= 1.5
+        if flags["opening"] and flags["lebron_fresh"]:
+            defend *= 1.3
+
+    if stamina > 50:
+        attack *= 1.3
+
+    weights = [attack, defend, rest, special]
+    first = [w / sum(weights) for w in weights]
+    final = list(first)
+    if stamina > 30:
+        weights[REST] = 0.1
+        second = [w / sum(weights) for w in weights]
+        final = [p + first[REST] * q for p, q in zip(first, second)]
+        final[REST] = first[REST] * second[REST]
+
+    for outcome in (ATTACK, DEFEND, REST, SPECIAL):
+        probabilities[outcome] = (1 - early) * final[outcome]
+    probabilities[EARLY_SPECIAL] = early
+    return probabilities
+
+
+def cumulative(probabilities):
+    """Cumulative row whose last reachable entry is exactly 1.0."""
+    row = []
+    total = 0.0
+    for p in probabilities:
+        total += p
+        row.append(total)
+    last = max(i for i, p in enumerate(probabilities) if p > 0)
+    for i in range(last, len(row)):
+        row[i] = 1.0
+    return tuple(row)
+
+
+@lru_cache(maxsize=None)
+def compile_table(difficulty):
+    """Cumulative outcome probabilities for every key of ``difficulty``."""
+    return tuple(cumulative(distribution(difficulty, key)) for key in range(KEYS))
+
+
+def decide(lebron, player, rng):
+    """One lookup and one uniform draw; returns (action, update streak counters)."""
+    row = compile_table(lebron.difficulty)[state_key(lebron, player)]
+    return OUTCOMES[bisect_right(row, rng.random())]
+
+
+class _Draw:
+    """Stands in for ``random()``; branches on the threshold it is compared to."""
+
+    def __init__(self, probe):
+        self.probe = probe
+
+    def __lt__(self, threshold):
+        threshold = Fraction(threshold)
+        return self.probe.branch([threshold, 1 - threshold]) == 0
+
+
+class _Probe:
+    """RNG that follows a fixed path of branch choices and records their odds."""
+
+    def __init__(self, path):
+        self.path = path
+        self.trace = []
+
+    def branch(self, probabilities):
+        depth = len(self.trace)
+        choice = self.path[depth] if depth < len(self.path) else 0
+        self.trace.append((choice, probabilities))
+        return choice
+
+    def random(self):
+        return _Draw(self)
+
+    def choices(self, population, weights):
+        total = sum(Fraction(w) for w in weights)
+        return [population[self.branch([Fraction(w) / total for w in weights])]]
+
+
+def reference_distribution(lebron, player):
+    """Exact distribution of (action, attack streak, defend streak) after
+    ``lebron.reference_decide(player)``, by walking every random branch."""
+    outcomes = {}
+    stack = [()]
+    while stack:
+        path = stack.pop()
+        probe = _Probe(path)
+        clone = copy.copy(lebron)
+        clone.rng = probe
+        action = clone.reference_decide(player)
+        probability = Fraction(1)
+        for depth, (choice, probabilities) in enumerate(probe.trace):
+            probability *= probabilities[choice]
+            if depth >= len(path):
+                taken = tuple(c for c, _ in probe.trace[:depth])
+                stack.extend(taken + (alt,) for alt in range(1, len(probabilities)) if probabilities[alt])
+        if probability:
+            result = (action, clone.consecutive_attacks, clone.consecutive_defends)
+            outcomes[result] = outcomes.get(result, 0) + probability
+    return outcomes
+
+
+def table_distribution(lebron, player):
+    """Same shape as ``reference_distribution`` but read from the compiled table."""
+    row = compile_table(lebron.difficulty)[state_key(lebron, player)]
+    outcomes = {}
+    previous = 0.0
+    for (action, streak), edge in zip(OUTCOMES, row):
+        probability = edge - previous
+        previous = edge
+        if probability <= 0:
+            continue
+        clone = copy.copy(lebron)
+        if streak:
+            clone.update_streaks(action)
+        result = (action, clone.consecutive_attacks, clone.consecutive_defends)
+        outcomes[result] = outcomes.get(result, 0) + probability
+    return outcomes
+
+
+def max_difference(reference, table):
+    return max(abs(float(reference.get(k, 0)) - table.get(k, 0)) for k in set(reference) | set(table))
+
+
+def representative(difficulty, key):
+    """A concrete (LeBron, player) pair for ``key``, or None if it cannot occur."""
+    from engine import LeBron, Player
+
+    band, flags = unpack(key)
+    if flags["lebron_low"] and flags["lebron_fresh"]:
+        return None
+    if flags["player_critical"] and not flags["player_low"]:
+        return None
+    if flags["predicts_special"] and difficulty != "Hard":
+        return None
+    if flags["attack_streak"] and flags["defend_streak"]:
+        return None
+
+    lebron = LeBron(difficulty)
+    lebron.stamina = BAND_STAMINA[band]
+    lebron.special_meter = 100 if flags["meter_full"] else 50
+    if flags["lebron_low"]:
+        lebron.health = int(lebron.max_health * 0.3) - 1
+    elif not flags["lebron_fresh"]:
+        lebron.health = int(lebron.max_health * 0.5)
+    lebron.turn_count = 1 if flags["opening"] else 10
+    lebron.consecutive_attacks = 2 if flags["attack_streak"] else 1
+    lebron.consecutive_defends = 2 if flags["defend_streak"] else 0
+    if flags["attack_streak"]:
+        lebron.consecutive_defends = 0
+
+    player = Player("You", 140, 100)
+    player.health = 30 if flags["player_critical"] else 50 if flags["player_low"] else 120
+    player.is_defending = flags["player_defending"]
+    if flags["predicts_special"]:
+        lebron.player_pattern_memory = ["attack", "attack", "defend"]
+        player.special_meter = 80
+    return lebron, player
+
+
+def random_state(difficulty, rng):
+    from engine import LeBron, Player
+
+    lebron = LeBron(difficulty)
+    lebron.stamina = rng.randint(0, 100)
+    lebron.special_meter = rng.choice([rng.randint(0, 100), 100])
+    lebron.health = rng.randint(1, lebron.max_health)
+    lebron.turn_count = rng.randint(1, 8)
+    lebron.consecutive_attacks = rng.randint(0, 3)
+    lebron.consecutive_defends = 0 if lebron.consecutive_attacks else rng.randint(0, 3)
+    lebron.player_pattern_memory = [
+        rng.choice(["attack", "defend", "rest", "special"]) for _ in range(rng.randint(0, 3))
+    ]
+    if rng.random() < 0.1:
+        return lebron, None
+    player = Player("You", 140, rng.randint(0, 100), special_meter=rng.randint(0, 100))
+    player.health = rng.randint(1, 140)
+    player.is_defending = rng.random() < 0.3
+    return lebron, player
+
+
+def verify(difficulties=("Easy", "Medium", "Hard"), samples=20000, seed=0, tolerance=1e-12):
+    """Compare the compiled table against ``LeBron.reference_decide``.
+
+    Every reachable key is checked with exact branch enumeration, then
+    ``samples`` random concrete states per difficulty confirm the key function.
+    Returns a report dict; ``ok`` is False on any mismatch.
+    """
+    rng = random.Random(seed)
+    report = {"keys": 0, "states": 0, "worst": 0.0, "mismatches": []}
+    for difficulty in difficulties:
+        checks = [representative(difficulty, key) for key in range(KEYS)]
+        checks = [pair for pair in checks if pair is not None]
+        report["keys"] += len(checks)
+        checks += [random_state(difficulty, rng) for _ in range(samples)]
+        report["states"] += samples
+        for lebron, player in checks:
+            difference = max_difference(
+                reference_distribution(lebron, player), table_distribution(lebron, player)
+            )
+            report["worst"] = max(report["worst"], difference)
+            if difference > tolerance:
+                report["mismatches"].append((difficulty, state_key(lebron, player), difference))
+    report["ok"] = not report["mismatches"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile and verify LeBron's decision table")
+    parser.add_argument("--verify", action="store_true")
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+
+    for difficulty in MOVE_PATTERNS:
+        compile_table(difficulty)
+    print(f"compiled {len(MOVE_PATTERNS)} tables x {KEYS} keys")
+    if args.verify:
+        report = verify(samples=args.samples)
+        print(f"verified {report['keys']} keys and {report['states']} random states, "
+              f"worst difference {report['worst']:.2e}")
+        for difficulty, key, difference in report["mismatches"][:20]:
+            print(f"  MISMATCH {difficulty} key {key}: {difference:.2e}")
+        raise SystemExit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Opt-in timing of the phases of a Streamlit rerun.
+
+Profiling is off unless ``LEBRONSIM_PROFILE`` is set.  Its value is the share of
+reruns to sample (``1`` for every rerun, ``0.02`` in production); a session can
+also force sampling from the debug panel.  Sampled reruns record every
+``phase`` they pass through and are appended as one JSON line to
+``LEBRONSIM_PROFILE_TRACE``.  Unsampled reruns pay for one attribute lookup
+per phase.
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+ENABLED = "LEBRONSIM_PROFILE" in os.environ
+SAMPLE_RATE = float(os.environ.get("LEBRONSIM_PROFILE") or 0)
+TRACE_PATH = os.environ.get("LEBRONSIM_PROFILE_TRACE", "profile_trace.jsonl")
+
+_local = threading.local()
+_trace_lock = threading.Lock()
+
+
+def start_rerun(force=False):
+    """Begin a rerun; it is sampled when ``force`` is set or by ``SAMPLE_RATE``."""
+    if ENABLED and (force or random.random() < SAMPLE_RATE):
+        _local.rerun = {"start": time.perf_counter(), "phases": [], "depth": 0}
+    else:
+        _local.rerun = None
+
+
+def active():
+    return getattr(_local, "rerun", None) is not None
+
+
+@contextmanager
+def phase(name):
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        yield
+        return
+    entry = {"name": name, "depth": rerun["depth"], "start_ms": 0.0, "ms": 0.0}
+    rerun["phases"].append(entry)
+    rerun["depth"] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        rerun["depth"] -= 1
+        entry["start_ms"] = (start - rerun["start"]) * 1000
+        entry["ms"] = (end - start) * 1000
+
+
+def timed(name):
+    """Decorator form of ``phase``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "rerun", None) is None:
+                return func(*args, **kwargs)
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summarize(phases):
+    """Total time and call count per phase name, in first-seen order."""
+    totals = {}
+    for entry in phases:
+        row = totals.setdefault(entry["name"], {"phase": entry["name"], "depth": entry["depth"], "calls": 0, "ms": 0.0})
+        row["calls"] += 1
+        row["ms"] += entry["ms"]
+    return list(totals.values())
+
+
+def finish_rerun(page=None, trace_path=None):
+    """End the rerun; returns its record (also appended to the trace) or None if unsampled."""
+    rerun = getattr(_local, "rerun", None)
+    _local.rerun = None
+    if rerun is None:
+        return None
+    record = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "page": page,
+        "total_ms": (time.perf_counter() - rerun["start"]) * 1000,
+        "phases": rerun["phases"],
+    }
+    with _trace_lock, open(trace_path or TRACE_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
@@ -0,0 +1,75 @@
+"""XP rewards and level progression shared by the UI and headless tools."""
+
+from bisect import bisect_right
+
+import numpy as np
+
+TIE_XP = 70
+MAX_LEVEL = 60
+
+
+def calculate_xp_reward(player_health, lebron_health, difficulty, won):
+    base_xp = 25
+    diff_multiplier = 1.0
+    if difficulty == "Medium":
+        diff_multiplier = 1.5
+    elif difficulty == "Hard":
+        diff_multiplier = 2.0
+    elif difficulty == "Nightmare":
+        diff_multiplier = 2.5
+    victory_bonus = 50 if won else 0
+    margin_bonus = 0
+    if won:
+        margin_bonus = int((player_health / 140) * 30)
+    total_xp = int((base_xp + victory_bonus + margin_bonus) * diff_multiplier)
+    return max(10, total_xp)
+
+
+def level_formula(level):
+    if level <= 1:
+        return 0
+    elif level <= 10:
+        return (level - 1) * 100
+    elif level <= 20:
+        base_xp = 900  # XP for level 10
+        return base_xp + (level - 10) * 200
+    elif level <= 30:
+        base_xp = 900 + 10 * 200
+        return base_xp + (level - 20) * 300
+    elif level <= 40:
+        base_xp = 900 + 10 * 200 + 10 * 300
+        return base_xp + (level - 30) * 400
+    elif level <= 49:
+        base_xp = 900 + 10 * 200 + 10 * 300 + 10 * 400
+        return base_xp + (level - 40) * 500
+    else:
+        base_xp = 900 + 10 * 200 + 10 * 300 + 10 * 400 + 9 * 500
+        if level == 50:
+            return base_xp + 500
+        else:
+            multiplier = 1.5 ** (level - 50)
+            return int(base_xp + 500 + (level - 50) * 200 * multiplier)
+
+
+# Cumulative XP needed to reach each level, built once.  XP_REQUIRED runs one
+# level past MAX_LEVEL so progress bars at the cap still have a next threshold.
+XP_REQUIRED = tuple(level_formula(level) for level in range(MAX_LEVEL + 2))
+XP_THRESHOLDS = XP_REQUIRED[1:MAX_LEVEL + 1]
+_XP_THRESHOLD_ARRAY = np.array(XP_THRESHOLDS, dtype=np.int64)
+
+
+def xp_required_for_level(level):
+    if 0 <= level < len(XP_REQUIRED):
+        return XP_REQUIRED[level]
+    return level_formula(level)
+
+
+def level_for_xp(xp):
+    """Highest level (1 to MAX_LEVEL) whose threshold ``xp`` has reached."""
+    return max(1, bisect_right(XP_THRESHOLDS, xp))
+
+
+def levels_for_xp(xp):
+    """Vectorized ``level_for_xp`` over an array of XP totals."""
+    levels = np.searchsorted(_XP_THRESHOLD_ARRAY, np.asarray(xp), side="right")
+    return np.maximum(levels, 1)
@@ -0,0 +1,474 @@
+"""Multiplayer room persistence.
+
+Every write to a room bumps its ``version`` column, so readers can tell a room
+changed with a single integer comparison.  Turns are resolved by
+``engine.resolve_pvp_turn`` from one snapshot and written back in one
+``BEGIN IMMEDIATE`` transaction, guarded by that version, together with one
+``room_events`` row describing the turn.  The events are append-only, so a
+client can fetch just the turns after the last ``seq`` it saw and a finished
+match can be replayed turn by turn.
+
+The move clock is enforced here rather than in the browser: ``TurnTimer``
+plays ``DEFAULT_MOVE`` for whoever has not moved ``TURN_SECONDS`` after the
+room's last action, both seats if need be, so a match keeps going when its
+players go quiet.  ``MAX_IDLE_TURNS`` such turns in a row end the match with
+no winner.
+"""
+
+import calendar
+import heapq
+import random
+import string
+import threading
+import time
+
+import db
+import profiling
+import users
+from engine import resolve_pvp_turn
+
+ALLOCATE_ATTEMPTS = 10
+ROOM_IDLE_SECONDS = 2 * 60 * 60
+WAITING_IDLE_SECONDS = 30 * 60
+JANITOR_INTERVAL = 60
+JANITOR_BATCH = 500
+TURN_SECONDS = 10
+DEFAULT_MOVE = "rest"
+MAX_IDLE_TURNS = 3
+TIMER_REFILL_SECONDS = 1.0
+TIMER_BATCH = 500
+
+
+def parse_timestamp(value):
+    """Epoch seconds for a ``CURRENT_TIMESTAMP`` value (which SQLite writes in UTC)."""
+    return calendar.timegm(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+
+def generate_room_code():
+    """Generate a 6-character room code"""
+    chars = string.ascii_uppercase + string.digits
+    return "".join(random.choice(chars) for _ in range(6))
+
+
+def fetch_room(conn, room_code):
+    c = conn.execute("SELECT * FROM multiplayer_rooms WHERE room_code = ?", (room_code,))
+    result = c.fetchone()
+    if result is None:
+        return None
+    return dict(zip([col[0] for col in c.description], result))
+
+
+@profiling.timed("db.get_room_state")
+def get_room_state(room_code):
+    return fetch_room(db.connect(), room_code)
+
+
+@profiling.timed("db.get_room_version")
+def get_room_version(room_code):
+    """Just the room's version (None if it is gone): a primary key lookup for cheap polling."""
+    row = db.connect().execute("SELECT version FROM multiplayer_rooms WHERE room_code = ?", (room_code,)).fetchone()
+    return row[0] if row else None
+
+
+@profiling.timed("db.create_room")
+def create_room(player_username, attempts=ALLOCATE_ATTEMPTS):
+    """Create a new multiplayer room under a fresh code.
+
+    Codes are drawn at random and inserted with ``OR IGNORE``, so a collision
+    costs one more draw; after ``attempts`` collisions in a row it gives up
+    rather than recursing forever.
+    """
+    for _ in range(attempts):
+        room_code = generate_room_code()
+        with db.transaction() as conn:
+            c = conn.execute(
+                "INSERT OR IGNORE INTO multiplayer_rooms (room_code, player1, game_state) VALUES (?, ?, 'waiting')",
+                (room_code, player_username),
+            )
+        if c.rowcount:
+            return room_code
+    raise RuntimeError(f"Could not allocate a free room code in {attempts} attempts")
+
+
+@profiling.timed("db.join_room")
+def join_room(room_code, player_username):
+    """Take the empty player 2 seat; False if the room is missing or full."""
+    with db.transaction() as conn:
+        c = conn.execute(
+            """UPDATE multiplayer_rooms
+               SET player2 = ?, game_state = 'playing', last_action = CURRENT_TIMESTAMP, version = version + 1
+               WHERE room_code = ? AND player2 IS NULL""",
+            (player_username, room_code),
+        )
+        return c.rowcount > 0
+
+
+@profiling.timed("db.update_player_move")
+def update_player_move(room_code, player_username, move):
+    """Submit a move in one round trip.
+
+    The seat is picked by matching the username, and a seat that already
+    submitted this turn is rejected.  Returns the readiness of both seats and
+    the new room version, or None when the move was not accepted.
+    """
+    with db.transaction() as conn:
+        row = conn.execute(
+            """UPDATE multiplayer_rooms
+               SET player1_move = CASE WHEN player1 = :user AND player1_ready = 0 THEN :move ELSE player1_move END,
+                   player1_ready = CASE WHEN player1 = :user THEN 1 ELSE player1_ready END,
+                   player2_move = CASE WHEN player2 = :user AND player2_ready = 0 THEN :move ELSE player2_move END,
+                   player2_ready = CASE WHEN player2 = :user THEN 1 ELSE player2_ready END,
+                   last_action = CURRENT_TIMESTAMP,
+                   version = version + 1
+               WHERE room_code = :code AND game_state = 'playing'
+                 AND ((player1 = :user AND player1_ready = 0) OR (player2 = :user AND player2_ready = 0))
+               RETURNING player1_ready, player2_ready, version""",
+            {"user": player_username, "move": move, "code": room_code},
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        "player1_ready": bool(row[0]),
+        "player2_ready": bool(row[1]),
+        "both_ready": bool(row[0] and row[1]),
+        "version": row[2],
+    }
+
+
+@profiling.timed("db.reset_round")
+def reset_round(room_code):
+    """Reset the room for a new round"""
+    with db.transaction() as conn:
+        conn.execute(
+            """UPDATE multiplayer_rooms
+               SET player1_move = NULL, player2_move = NULL,
+                   player1_ready = 0, player2_ready = 0,
+                   current_turn = 1,
+                   last_action = CURRENT_TIMESTAMP,
+                   version = version + 1
+               WHERE room_code = ?""",
+            (room_code,),
+        )
+
+
+@profiling.timed("db.restart_match")
+def restart_match(room_code, player_username):
+    """Start a fresh best-of-3 in the same room; only its host may."""
+    with db.transaction() as conn:
+        conn.execute(
+            """UPDATE multiplayer_rooms
+               SET player1_hp = 140, player2_hp = 140,
+                   player1_stamina = 100, player2_stamina = 100,
+                   player1_special = 0, player2_special = 0,
+                   player1_move = NULL, player2_move = NULL,
+                   player1_ready = 0, player2_ready = 0,
+                   current_round = 1,
+                   current_turn = 1,
+                   game_state = 'playing',
+                   winner = NULL,
+                   player1_wins = 0,
+                   player2_wins = 0,
+                   match_round = 1,
+                   idle_turns = 0,
+                   last_action = CURRENT_TIMESTAMP,
+                   version = version + 1
+               WHERE room_code = ? AND player1 = ?""",
+            (room_code, player_username),
+        )
+
+
+@profiling.timed("db.delete_room")
+def delete_room(room_code, player_username):
+    """Delete a room; only its host may."""
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM multiplayer_rooms WHERE room_code = ? AND player1 = ?", (room_code, player_username))
+
+
+def idle_updates(room, result, idle):
+    """Extra updates counting turns the clock played for both seats (``idle``).
+
+    The ``MAX_IDLE_TURNS``-th in a row ends the match with no winner.
+    """
+    idle_turns = room["idle_turns"] + 1 if idle else 0
+    updates = {"idle_turns": idle_turns}
+    if idle_turns >= MAX_IDLE_TURNS and not result["match_winner"]:
+        updates.update(game_state="match_over", winner=None)
+    return updates
+
+
+def apply_turn(conn, room, rng, idle=False):
+    """Resolve ``room``'s turn and write it, its event and any match result in the caller's transaction.
+
+    ``idle`` means neither player moved and the clock played both seats.
+    Returns the turn result, or None when the row's version no longer matches
+    the snapshot.
+    """
+    result = resolve_pvp_turn(room, rng)
+    updates = result["updates"]
+    updates.update(idle_updates(room, result, idle))
+    assignments = ", ".join(f"{column} = ?" for column in updates)
+    c = conn.execute(
+        f"""UPDATE multiplayer_rooms
+            SET {assignments}, last_action = CURRENT_TIMESTAMP, version = version + 1
+            WHERE room_code = ? AND version = ?""",
+        (*updates.values(), room["room_code"], room["version"]),
+    )
+    if c.rowcount == 0:
+        return None
+
+    result["seq"] = append_event(conn, room["room_code"], result)
+    if result["match_winner"]:
+        users.record_multiplayer_result(conn, result["match_winner"], result["match_loser"])
+    result["version"] = room["version"] + 1
+    return result
+
+
+@profiling.timed("db.process_multiplayer_turn")
+def process_multiplayer_turn(room_code, version=None, rng=random):
+    """Resolve the pending turn once; returns the turn result, or None if there was nothing to do.
+
+    Any number of clients may call this for the same turn: the first one in
+    resolves it and the rest find the moves already cleared (or, when they
+    pass the ``version`` they last saw, a newer version) and do nothing.
+    """
+    with db.transaction(immediate=True) as conn:
+        room = fetch_room(conn, room_code)
+        if not room or room["game_state"] != "playing":
+            return None
+        if version is not None and room["version"] != version:
+            return None
+        if not (room["player1_move"] and room["player2_move"]):
+            return None
+        result = apply_turn(conn, room, rng)
+    if result and result["match_winner"]:
+        users.invalidate_stats(result["match_winner"], result["match_loser"])
+    return result
+
+
+@profiling.timed("db.sweep_turn_timeouts")
+def sweep_turn_timeouts(room_codes, turn_seconds=TURN_SECONDS, rng=random, now=None):
+    """Resolve every listed room whose turn clock ran out, in one transaction.
+
+    A seat that has not moved plays ``DEFAULT_MOVE``, including both seats
+    when nobody has; ``idle_updates`` ends a match after ``MAX_IDLE_TURNS`` of
+    those in a row.  Returns the codes resolved.
+    """
+    resolved = []
+    finished = []
+    if not room_codes:
+        return resolved
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime((now or time.time()) - turn_seconds))
+    with db.transaction(immediate=True) as conn:
+        c = conn.execute(
+            f"""SELECT * FROM multiplayer_rooms
+                WHERE room_code IN ({', '.join('?' * len(room_codes))})
+                  AND game_state = 'playing' AND last_action <= ?""",
+            (*room_codes, cutoff),
+        )
+        columns = [col[0] for col in c.description]
+        for row in c.fetchall():
+            room = dict(zip(columns, row))
+            idle = not (room["player1_ready"] or room["player2_ready"])
+            room["player1_move"] = room["player1_move"] or DEFAULT_MOVE
+            room["player2_move"] = room["player2_move"] or DEFAULT_MOVE
+            result = apply_turn(conn, room, rng, idle)
+            if result:
+                resolved.append(room["room_code"])
+                if result["match_winner"]:
+                    finished += [result["match_winner"], result["match_loser"]]
+    if finished:
+        users.invalidate_stats(*finished)
+    return resolved
+
+
+EVENT_COLUMNS = (
+    "seq", "match_round", "turn",
+    "player1_move", "player2_move", "player1_damage", "player2_damage",
+    "player1_hp", "player2_hp", "player1_stamina", "player2_stamina",
+    "player1_special", "player2_special", "round_winner", "match_winner",
+)
+
+
+def append_event(conn, room_code, result):
+    """Record a resolved turn in the caller's transaction; returns its ``seq``."""
+    turn = result["turn"]
+    c = conn.execute(
+        """INSERT INTO room_events
+           SELECT :code, COALESCE(MAX(seq), 0) + 1, :match_round, :round,
+                  :player1_move, :player2_move, :player1_damage, :player2_damage,
+                  :player1_hp, :player2_hp, :player1_stamina, :player2_stamina,
+                  :player1_special, :player2_special, :round_winner, :match_winner, CURRENT_TIMESTAMP
+           FROM room_events WHERE room_code = :code
+           RETURNING seq""",
+        dict(turn, code=room_code, round_winner=result["round_winner"], match_winner=result["match_winner"]),
+    )
+    return c.fetchone()[0]
+
+
+def turn_event(seq, result):
+    """The ``room_events`` row for a resolved turn, keyed by ``EVENT_COLUMNS``."""
+    turn = result["turn"]
+    event = dict(
+        turn, seq=seq, turn=turn["round"], round_winner=result["round_winner"], match_winner=result["match_winner"]
+    )
+    return {column: event[column] for column in EVENT_COLUMNS}
+
+
+@profiling.timed("db.get_room_events")
+def get_room_events(room_code, after_seq=0):
+    """Turns of a room with ``seq`` greater than ``after_seq``, oldest first."""
+    c = db.connect().execute(
+        f"SELECT {', '.join(EVENT_COLUMNS)} FROM room_events WHERE room_code = ? AND seq > ? ORDER BY seq",
+        (room_code, after_seq),
+    )
+    return [dict(zip(EVENT_COLUMNS, row)) for row in c.fetchall()]
+
+
+def replay(events):
+    """Fold turn events into the board after each one: a list of dicts, one per event.
+
+    Each event already carries the post-turn hp, stamina and meter, so only the
+    round wins have to be carried forward; they reset after a match is won.
+    """
+    wins = {"player1": 0, "player2": 0}
+    states = []
+    for event in events:
+        round_winner = event["round_winner"]
+        if round_winner is not None:
+            # the winner is stored by name; the seat is the one left standing
+            wins["player1" if event["player2_hp"] <= 0 else "player2"] += 1
+        state = dict(event, player1_wins=wins["player1"], player2_wins=wins["player2"])
+        states.append(state)
+        if event["match_winner"] is not None:
+            wins = {"player1": 0, "player2": 0}
+    return states
+
+
+def expire_rooms(idle_seconds=ROOM_IDLE_SECONDS, waiting_idle_seconds=WAITING_IDLE_SECONDS, batch_size=JANITOR_BATCH):
+    """Delete rooms with no activity for ``idle_seconds`` (``waiting_idle_seconds`` if nobody joined).
+
+    Works in batches of ``batch_size``, each its own short transaction, so the
+    write lock is never held for long; returns the number of rooms removed.
+    """
+    removed = 0
+    for sql, seconds in (
+        ("SELECT rowid FROM multiplayer_rooms WHERE game_state = 'waiting' AND last_action < datetime('now', ?) LIMIT ?",
+         waiting_idle_seconds),
+        ("SELECT rowid FROM multiplayer_rooms WHERE last_action < datetime('now', ?) LIMIT ?", idle_seconds),
+    ):
+        while True:
+            with db.transaction() as conn:
+                c = conn.execute(
+                    f"DELETE FROM multiplayer_rooms WHERE rowid IN ({sql})", (f"-{int(seconds)} seconds", batch_size)
+                )
+            removed += c.rowcount
+            if c.rowcount < batch_size:
+                break
+    return removed
+
+
+class Janitor(threading.Thread):
+    """Daemon thread that runs ``expire_rooms`` every ``interval`` seconds."""
+
+    def __init__(self, interval=JANITOR_INTERVAL, **expire_options):
+        super().__init__(name="room-janitor", daemon=True)
+        self.interval = interval
+        self.expire_options = expire_options
+        self.stopped = threading.Event()
+        self.runs = 0
+        self.removed = 0
+        self.last_error = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.removed += expire_rooms(**self.expire_options)
+                self.last_error = None
+            except Exception as exc:  # keep sweeping; a locked database is retried next tick
+                self.last_error = exc
+            self.runs += 1
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_janitor(interval=JANITOR_INTERVAL, **expire_options):
+    janitor = Janitor(interval, **expire_options)
+    janitor.start()
+    return janitor
+
+
+class TurnTimer(threading.Thread):
+    """Daemon thread that enforces the move clock for every room in the database.
+
+    Each playing room's deadline is its ``last_action`` plus ``turn_seconds``,
+    kept in a min-heap.  Every ``refill_seconds`` (or sooner, when the next
+    deadline is nearer) it reads only the rooms that changed since its last
+    look, then hands all due rooms to one ``sweep_turn_timeouts`` call.  A
+    heap entry whose room has moved on since it was pushed is skipped.
+    """
+
+    def __init__(self, turn_seconds=TURN_SECONDS, refill_seconds=TIMER_REFILL_SECONDS, rng=random):
+        super().__init__(name="turn-timer", daemon=True)
+        self.turn_seconds = turn_seconds
+        self.refill_seconds = refill_seconds
+        self.rng = rng
+        self.heap = []
+        self.deadlines = {}
+        self.watermark = ""
+        self.stopped = threading.Event()
+        self.runs = 0
+        self.resolved = 0
+        self.last_error = None
+
+    def refill(self):
+        rows = db.connect().execute(
+            "SELECT room_code, last_action FROM multiplayer_rooms WHERE game_state = 'playing' AND last_action >= ?",
+            (self.watermark,),
+        ).fetchall()
+        for room_code, last_action in rows:
+            deadline = parse_timestamp(last_action) + self.turn_seconds
+            if self.deadlines.get(room_code) != deadline:
+                self.deadlines[room_code] = deadline
+                heapq.heappush(self.heap, (deadline, room_code))
+            self.watermark = max(self.watermark, last_action)
+
+    def due(self, now):
+        room_codes = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, room_code = heapq.heappop(self.heap)
+            if self.deadlines.get(room_code) == deadline:
+                del self.deadlines[room_code]
+                room_codes.append(room_code)
+        return room_codes
+
+    def tick(self):
+        self.refill()
+        now = time.time()
+        room_codes = self.due(now)
+        for start in range(0, len(room_codes), TIMER_BATCH):
+            batch = room_codes[start : start + TIMER_BATCH]
+            self.resolved += len(sweep_turn_timeouts(batch, self.turn_seconds, self.rng, now))
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.tick()
+                self.last_error = None
+            except Exception as exc:  # a locked database is retried next tick
+                self.last_error = exc
+            self.runs += 1
+            wait = self.refill_seconds
+            if self.heap:
+                wait = min(wait, max(0.0, self.heap[0][0] - time.time()))
+            self.stopped.wait(wait)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_turn_timer(turn_seconds=TURN_SECONDS, **options):
+    timer = TurnTimer(turn_seconds, **options)
+    timer.start()
+    return timer
@@ -0,0 +1,108 @@
+"""Shared, read-only room snapshots for spectators.
+
+One ``RoomSnapshots`` lives per process and every spectating session reads
+from it.  A room is checked at most once per ``tick``: the first caller after
+the tick reads the room's version (a primary key lookup) and, only if it
+moved, the row and the turns it has not seen yet.  Callers that arrive while
+that refresh is running wait for it instead of starting their own, so a match
+with 500 viewers costs the database what a match with one viewer does.
+"""
+
+import threading
+import time
+
+import rooms
+
+SNAPSHOT_TICK = 0.4
+SNAPSHOT_IDLE_SECONDS = 60
+
+
+class RoomSnapshots:
+    """Per-room snapshots keyed on the room version; what ``get`` returns is shared, so never mutate it."""
+
+    def __init__(self, store=rooms, tick=SNAPSHOT_TICK, idle_seconds=SNAPSHOT_IDLE_SECONDS):
+        self.store = store
+        self.tick = tick
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.last_evicted = time.monotonic()
+        self.stats = {"gets": 0, "hits": 0, "waits": 0, "version_reads": 0, "fetches": 0, "evictions": 0}
+
+    def entry(self, room_code, now):
+        """``(entry, fresh)``: the room's entry and whether it was checked within the last tick."""
+        with self.lock:
+            self.stats["gets"] += 1
+            if now - self.last_evicted >= self.idle_seconds:
+                self.evict(now)
+            entry = self.entries.get(room_code)
+            if entry is None:
+                entry = self.entries[room_code] = {
+                    "lock": threading.Lock(),
+                    "room": None,
+                    "events": [],
+                    "checked": float("-inf"),
+                }
+            entry["used"] = now
+            fresh = now - entry["checked"] < self.tick
+            if fresh:
+                self.stats["hits"] += 1
+            return entry, fresh
+
+    def count(self, name):
+        # session threads share these counters, so every update goes under the lock
+        with self.lock:
+            self.stats[name] += 1
+
+    def evict(self, now):
+        """Forget rooms nobody has asked about for ``idle_seconds`` (caller holds ``self.lock``)."""
+        idle = [code for code, entry in self.entries.items() if now - entry["used"] >= self.idle_seconds]
+        for code in idle:
+            del self.entries[code]
+        self.stats["evictions"] += len(idle)
+        self.last_evicted = now
+
+    def refresh(self, room_code, entry):
+        """Bring ``entry`` up to the room's current version (caller holds ``entry["lock"]``)."""
+        version = self.store.get_room_version(room_code)
+        self.count("version_reads")
+        room = entry["room"]
+        if version is None:
+            entry["room"], entry["events"] = None, []
+        elif room is None or room["version"] != version:
+            fresh = self.store.get_room_state(room_code)
+            if fresh is not None:
+                events = entry["events"]
+                if room is None or fresh["version"] < room["version"] or fresh["created_at"] != room["created_at"]:
+                    events = []  # first look, or the code now belongs to a new room
+                if events:
+                    # re-read the last turn we hold too: if the log no longer has it, the code was reused
+                    new = self.store.get_room_events(room_code, events[-1]["seq"] - 1)
+                    if new and new[0] == events[-1]:
+                        new = new[1:]
+                    else:
+                        events, new = [], self.store.get_room_events(room_code, 0)
+                else:
+                    new = self.store.get_room_events(room_code, 0)
+                # a new list, so sessions still rendering the old one are unaffected
+                entry["events"] = events + new
+            entry["room"] = fresh
+            self.count("fetches")
+        entry["checked"] = time.monotonic()
+
+    def get(self, room_code):
+        """``(room, events)`` no older than one tick; ``room`` is None when the room is gone."""
+        now = time.monotonic()
+        entry, fresh = self.entry(room_code, now)
+        if fresh:
+            return entry["room"], entry["events"]
+        if not entry["lock"].acquire(blocking=False):
+            # someone else is refreshing this room; their result will do
+            self.count("waits")
+            entry["lock"].acquire()
+        try:
+            if time.monotonic() - entry["checked"] >= self.tick:
+                self.refresh(room_code, entry)
+            return entry["room"], entry["events"]
+        finally:
+            entry["lock"].release()
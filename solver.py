@@ -0,0 +1,383 @@
+"""Dynamic-programming solver for the Player vs LeBron battle.
+
+Computes win probabilities and the optimal player policy against each
+difficulty's move distribution by value iteration over NumPy state tensors
+instead of sampling.
+
+The full integer state (both health pools, both stamina bars, both meters and
+LeBron's streak/pattern memory) is far too large to enumerate, so the solver
+works on a lattice that keeps every rule threshold intact:
+
+* stamina and special meter move in steps of 5; meters are always multiples
+  of 5 anyway, rest gains (25-40) are rounded to the nearest 5 with their
+  exact probability mass
+* health is kept on a grid of ``hp_step``; damage, block and heal are applied
+  exactly and the resulting health is rounded back onto the grid (a living
+  fighter never rounds down to 0)
+* LeBron's move distribution is ``LeBron.choose_action`` with its streak
+  counters, pattern memory and opening-turn bonus at rest
+
+Rounds only ever lower health, so the (player hp, LeBron hp) layers are solved
+from the lowest up and value iteration is only needed inside a layer.  Results
+are cached in ``.solver_cache`` under a hash of the rules, so later runs load
+them instantly.
+
+    python solver.py --difficulty Hard --check 200000
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+
+import numpy as np
+
+import batch_sim
+import engine
+import policy_table
+
+ATTACK, DEFEND, REST, SPECIAL = batch_sim.ATTACK, batch_sim.DEFEND, batch_sim.REST, batch_sim.SPECIAL
+ACTIONS = batch_sim.ACTIONS
+
+SOLVER_VERSION = 1
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".solver_cache")
+
+UNIT = 5
+LEVELS = 100 // UNIT + 1
+RESOURCES = LEVELS * LEVELS
+REST_GAINS = ((5, 3 / 16), (6, 5 / 16), (7, 5 / 16), (8, 3 / 16))
+
+
+def rules_hash(difficulty, hp_step):
+    """Hash of everything the solution depends on, including the engine and LeBron policy source."""
+    rules = {
+        "version": SOLVER_VERSION,
+        "difficulty": difficulty,
+        "hp_step": hp_step,
+        "lebron_health": batch_sim.LEBRON_HEALTH[difficulty],
+        "move_patterns": batch_sim.MOVE_PATTERNS[difficulty],
+        "special_threshold": batch_sim.SPECIAL_THRESHOLD.get(difficulty),
+        "special_multiplier": batch_sim.SPECIAL_MULTIPLIER[difficulty],
+        "engine": inspect.getsource(engine.Player) + inspect.getsource(engine.LeBron),
+        "policy_table": inspect.getsource(policy_table),
+    }
+    blob = json.dumps(rules, sort_keys=True).encode()
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+def resource_index(stamina_level, meter_level):
+    return stamina_level * LEVELS + meter_level
+
+
+def resource_moves():
+    """Per action, a list of (probability, next resource index) over the lattice."""
+    stamina, meter = np.divmod(np.arange(RESOURCES), LEVELS)
+    top = LEVELS - 1
+    moves = {
+        ATTACK: [(1.0, resource_index(np.maximum(stamina - 3, 0), np.minimum(meter + 2, top)))],
+        DEFEND: [(1.0, resource_index(np.maximum(stamina - 2, 0), np.minimum(meter + 3, top)))],
+        SPECIAL: [(1.0, resource_index(np.maximum(stamina - 5, 0), np.zeros_like(meter)))],
+        REST: [
+            (p, resource_index(np.minimum(stamina + gain, top), np.minimum(meter + 1, top)))
+            for gain, p in REST_GAINS
+        ],
+    }
+    valid = np.empty((RESOURCES, 4), dtype=bool)
+    valid[:, ATTACK] = stamina >= 3
+    valid[:, DEFEND] = stamina >= 2
+    valid[:, REST] = True
+    valid[:, SPECIAL] = (meter == top) & (stamina >= 5)
+    return moves, valid
+
+
+def damage_pmf(action, multiplier=None):
+    """Exact damage distribution of an attack or special as {damage: probability}."""
+    pmf = {}
+    if action == ATTACK:
+        for base in range(15, 31):
+            pmf[base] = pmf.get(base, 0) + 0.8 / 16
+            crit = int(base * 1.5)
+            pmf[crit] = pmf.get(crit, 0) + 0.2 / 16
+    elif action == SPECIAL:
+        for base in range(40, 61):
+            damage = int(base * multiplier) if multiplier else base
+            pmf[damage] = pmf.get(damage, 0) + 1 / 21
+    else:
+        pmf[0] = 1.0
+    return pmf
+
+
+def to_level(health, hp_step):
+    if health <= 0:
+        return 0
+    return max(1, int(health / hp_step + 0.5))
+
+
+def health_moves(max_health, hp_step, pmf, defending, heals):
+    """For each health level, {next level: probability} after taking a hit."""
+    levels = to_level(max_health, hp_step)
+    table = []
+    for level in range(levels + 1):
+        health = min(level * hp_step, max_health)
+        outcome = {}
+        for damage, p in pmf.items():
+            if damage <= 0:
+                after = health
+            elif defending and heals:
+                reduced = int(damage * 0.5)
+                after = max(0, min(health + int(reduced * 0.5), max_health) - reduced)
+            elif defending:
+                after = max(0, health - int(damage * 0.5))
+            else:
+                after = max(0, health - damage)
+            nxt = to_level(after, hp_step)
+            outcome[nxt] = outcome.get(nxt, 0) + p
+        table.append(outcome)
+    return table
+
+
+def lebron_distribution(difficulty, lebron_low, player_health):
+    """LeBron's move probabilities for every LeBron resource index.
+
+    Mirrors ``LeBron.choose_action(player)`` at the start of a round (player
+    not defending) with streak counters and pattern memory at rest.
+    """
+    stamina, meter = np.divmod(np.arange(RESOURCES), LEVELS)
+    stamina = stamina * UNIT
+    full = meter == LEVELS - 1
+    smart = difficulty in ("Medium", "Hard")
+
+    weights = np.empty((RESOURCES, 4))
+    weights[:] = batch_sim.MOVE_PATTERNS[difficulty]
+    weights[~full, SPECIAL] = 0
+    tired = stamina <= 30
+    weights[tired, REST] *= 1 + 2 * ((30 - stamina[tired]) / 30)
+    weights[~tired, REST] *= 0.2
+    if smart and lebron_low:
+        weights[:, DEFEND] *= 2.0
+    if difficulty == "Hard":
+        weights[(stamina > 15) & (stamina < 40), REST] *= 1.5
+        if player_health < batch_sim.PLAYER_MAX_HEALTH * 0.3:
+            weights[:, ATTACK] *= 1.5
+    weights[stamina > 50, ATTACK] *= 1.3
+
+    first = weights / weights.sum(axis=1, keepdims=True)
+    rerolled = weights.copy()
+    rerolled[:, REST] = 0.1
+    second = rerolled / rerolled.sum(axis=1, keepdims=True)
+    reroll = stamina > 30
+    dist = first.copy()
+    dist[reroll, REST] = 0
+    dist[reroll] += first[reroll, REST, None] * second[reroll]
+
+    special = np.zeros(4)
+    special[SPECIAL] = 1.0
+    if smart:
+        eager = batch_sim.SPECIAL_THRESHOLD[difficulty]
+        dist[full] = eager * special + (1 - eager) * dist[full]
+        if player_health < batch_sim.PLAYER_MAX_HEALTH * 0.4:
+            dist[full] = special
+    rest = np.zeros(4)
+    rest[REST] = 1.0
+    dist[stamina < 15] = rest
+    return dist
+
+
+class Solution:
+    """Win probabilities and the optimal player move for every lattice state.
+
+    Arrays are indexed ``[player hp level, LeBron hp level, player resources,
+    LeBron resources]`` where resources are ``stamina // 5 * 21 + meter // 5``.
+    """
+
+    def __init__(self, difficulty, hp_step, value, policy, key):
+        self.difficulty = difficulty
+        self.hp_step = hp_step
+        self.value = value
+        self.policy = policy
+        self.key = key
+
+    @staticmethod
+    def path(difficulty, key, cache_dir=CACHE_DIR):
+        return os.path.join(cache_dir, f"{difficulty.lower()}-{key}.npz")
+
+    def save(self, cache_dir=CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        path = self.path(self.difficulty, self.key, cache_dir)
+        np.savez_compressed(
+            path,
+            value=self.value,
+            policy=self.policy,
+            meta=np.array(json.dumps({"difficulty": self.difficulty, "hp_step": self.hp_step, "key": self.key})),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(meta["difficulty"], meta["hp_step"], data["value"], data["policy"], meta["key"])
+
+    def _index(self, player_hp, player_stamina, player_special, lebron_hp, lebron_stamina, lebron_special):
+        step = self.hp_step
+
+        def level(health):
+            health = np.asarray(health)
+            return np.where(health <= 0, 0, np.maximum(1, (health / step + 0.5).astype(np.int64)))
+
+        def resources(stamina, special):
+            stamina = (np.asarray(stamina) / UNIT + 0.5).astype(np.int64)
+            return np.minimum(stamina, LEVELS - 1) * LEVELS + np.asarray(special) // UNIT
+
+        return (
+            level(player_hp),
+            level(lebron_hp),
+            resources(player_stamina, player_special),
+            resources(lebron_stamina, lebron_special),
+        )
+
+    def win_probability(self, player_hp=140, player_stamina=100, player_special=0,
+                        lebron_hp=None, lebron_stamina=100, lebron_special=0):
+        if lebron_hp is None:
+            lebron_hp = batch_sim.LEBRON_HEALTH[self.difficulty]
+        index = self._index(player_hp, player_stamina, player_special, lebron_hp, lebron_stamina, lebron_special)
+        return float(self.value[index])
+
+    def best_action(self, player, lebron):
+        """Optimal move name for ``engine.Player``/``engine.LeBron`` instances."""
+        index = self._index(player.health, player.stamina, player.special_meter,
+                            lebron.health, lebron.stamina, lebron.special_meter)
+        return ACTIONS[int(self.policy[index])]
+
+    def batch_policy(self):
+        """The optimal policy as a ``batch_sim`` player policy."""
+
+        def policy(batch, rng):
+            index = self._index(batch.p_health, batch.p_stamina, batch.p_special,
+                                batch.l_health, batch.l_stamina, batch.l_special)
+            return self.policy[index].astype(np.int64)
+
+        return policy
+
+
+def _solve(difficulty, hp_step, tol, verbose):
+    max_lebron = batch_sim.LEBRON_HEALTH[difficulty]
+    max_player = batch_sim.PLAYER_MAX_HEALTH
+    p_levels = to_level(max_player, hp_step) + 1
+    l_levels = to_level(max_lebron, hp_step) + 1
+
+    moves, valid = resource_moves()
+    multiplier = batch_sim.SPECIAL_MULTIPLIER[difficulty]
+    offense = {a: damage_pmf(a) for a in (ATTACK, DEFEND, REST, SPECIAL)}
+    lebron_offense = dict(offense)
+    lebron_offense[SPECIAL] = damage_pmf(SPECIAL, multiplier)
+
+    # player_hits[a_l][player defends][level] / lebron_hits[a_p][LeBron defends][level]
+    player_hits = {
+        a: [health_moves(max_player, hp_step, lebron_offense[a], d, heals=False) for d in (False, True)]
+        for a in range(4)
+    }
+    lebron_hits = {
+        a: [health_moves(max_lebron, hp_step, offense[a], d, heals=True) for d in (False, True)]
+        for a in range(4)
+    }
+
+    value = np.zeros((p_levels, l_levels, RESOURCES, RESOURCES), dtype=np.float32)
+    policy = np.full((p_levels, l_levels, RESOURCES, RESOURCES), REST, dtype=np.int8)
+    value[1:, 0] = 1.0
+    invalid = np.where(valid, 0.0, -np.inf)
+
+    def shift_lebron(matrix, a_l):
+        return sum(p * matrix[:, index] for p, index in moves[a_l])
+
+    def shift_player(matrix, a_p):
+        return sum(p * matrix[index] for p, index in moves[a_p])
+
+    for pi in range(1, p_levels):
+        for li in range(1, l_levels):
+            started = time.perf_counter()
+            dist = lebron_distribution(
+                difficulty, li * hp_step < max_lebron * 0.3, min(pi * hp_step, max_player)
+            )
+            q_external = np.zeros((4, RESOURCES, RESOURCES))
+            in_layer = []
+            for a_p in range(4):
+                for a_l in range(4):
+                    p_next = player_hits[a_l][a_p == DEFEND][pi]
+                    l_next = lebron_hits[a_p][a_l == DEFEND][li]
+                    external = np.zeros((RESOURCES, RESOURCES))
+                    for p_level, p_prob in p_next.items():
+                        for l_level, l_prob in l_next.items():
+                            # A knocked out player is worth 0, a knocked out LeBron 1
+                            if p_level and (p_level, l_level) != (pi, li):
+                                external += p_prob * l_prob * value[p_level, l_level]
+                    shifted = shift_player(shift_lebron(external, a_l), a_p)
+                    q_external[a_p] += dist[:, a_l][None, :] * shifted
+                    coefficient = p_next.get(pi, 0) * l_next.get(li, 0)
+                    if coefficient:
+                        in_layer.append((a_p, a_l, coefficient))
+            q_external += invalid.T[:, :, None]
+
+            current = q_external.max(axis=0)
+            for iteration in range(10_000):
+                q = q_external.copy()
+                lebron_shifted = {}
+                for a_p, a_l, coefficient in in_layer:
+                    if a_l not in lebron_shifted:
+                        lebron_shifted[a_l] = shift_lebron(current, a_l)
+                    q[a_p] += coefficient * dist[:, a_l][None, :] * shift_player(lebron_shifted[a_l], a_p)
+                updated = q.max(axis=0)
+                delta = np.abs(updated - current).max()
+                current = updated
+                if delta < tol:
+                    break
+            value[pi, li] = current
+            policy[pi, li] = q.argmax(axis=0)
+            if verbose:
+                print(f"  layer hp=({pi * hp_step}, {li * hp_step}) "
+                      f"{iteration + 1} iterations in {time.perf_counter() - started:.3f}s")
+    return value, policy
+
+
+def solve(difficulty, hp_step=10, cache_dir=CACHE_DIR, refresh=False, tol=1e-9, verbose=False):
+    """Load the cached solution for ``difficulty`` or compute and cache it."""
+    if difficulty not in batch_sim.LEBRON_HEALTH:
+        raise ValueError(f"Unknown difficulty: {difficulty}")
+    key = rules_hash(difficulty, hp_step)
+    if cache_dir and not refresh:
+        path = Solution.path(difficulty, key, cache_dir)
+        if os.path.exists(path):
+            return Solution.load(path)
+    value, policy = _solve(difficulty, hp_step, tol, verbose)
+    solution = Solution(difficulty, hp_step, value, policy, key)
+    if cache_dir:
+        solution.save(cache_dir)
+    return solution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve the LeBron battle by dynamic programming")
+    parser.add_argument("--difficulty", default="Medium", choices=list(batch_sim.LEBRON_HEALTH))
+    parser.add_argument("--hp-step", type=int, default=10)
+    parser.add_argument("--refresh", action="store_true", help="ignore the cached solution")
+    parser.add_argument("--check", type=int, default=0, help="simulate N battles with the optimal policy")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    solution = solve(args.difficulty, args.hp_step, refresh=args.refresh, verbose=args.verbose)
+    print(f"{args.difficulty} (hp step {args.hp_step}, rules {solution.key}) "
+          f"ready in {time.perf_counter() - start:.2f}s")
+    print(f"  optimal win probability: {solution.win_probability():.4f}")
+
+    if args.check:
+        results = batch_sim.simulate_batch(args.difficulty, args.check, solution.batch_policy())
+        summary = batch_sim.summarize(results)
+        print(f"  simulated with optimal policy: win {summary['win']:.4f}, "
+              f"tie {summary['tie']:.4f}, loss {summary['loss']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""User accounts, stats and XP persistence.
+
+``get_user_stats`` reads through ``stats_cache``, an in-process LRU with a TTL.
+Every write in this module drops the affected users from it once its
+transaction commits; callers that award XP inside their own transaction
+(``record_multiplayer_result``) call ``invalidate_stats`` after committing.
+Writes from other processes (the game server, ``bulk_users``) show up within
+``USER_STATS_TTL`` seconds.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import auth
+import db
+import profiling
+from progression import level_for_xp
+
+USER_STATS_CACHE_SIZE = 1024
+USER_STATS_TTL = 30.0
+
+
+class StatsCache:
+    """Read-through LRU of per-user stats; entries expire after ``ttl`` seconds."""
+
+    def __init__(self, size=USER_STATS_CACHE_SIZE, ttl=USER_STATS_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # bumped by every invalidation, so a load that raced a write is not cached
+        self.generation = 0
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, username, load):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self.entries.move_to_end(username)
+                    self.counters["hits"] += 1
+                    return dict(entry[0])
+                del self.entries[username]
+                self.counters["expired"] += 1
+            self.counters["misses"] += 1
+            generation = self.generation
+        stats = load(username)
+        with self.lock:
+            if self.generation == generation:
+                self.entries[username] = (stats, now)
+                self.entries.move_to_end(username)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+                    self.counters["evictions"] += 1
+        return dict(stats)
+
+    def invalidate(self, *usernames):
+        with self.lock:
+            self.generation += 1
+            for username in usernames:
+                self.entries.pop(username, None)
+            self.counters["invalidations"] += len(usernames)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, size=len(self.entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+stats_cache = StatsCache()
+
+
+def invalidate_stats(*usernames):
+    """Drop cached stats for ``usernames``; call after the transaction that changed them commits."""
+    stats_cache.invalidate(*usernames)
+
+
+@profiling.timed("db.register_user")
+def register_user(username, password):
+    hashed_pw = auth.hash_password(password)
+    conn = db.connect()
+    c = conn.cursor()
+    try:
+        c.execute(
+            "INSERT INTO users (username, password, xp, level, wins, losses) VALUES (?, ?, 0, 1, 0, 0)",
+            (username, hashed_pw),
+        )
+        conn.commit()
+        invalidate_stats(username)  # a lookup before signing up cached the defaults
+        return True
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return False
+
+
+@profiling.timed("db.authenticate_user")
+def authenticate_user(username, password):
+    conn = db.connect()
+    c = conn.cursor()
+    c.execute("SELECT password FROM users WHERE username = ?", (username,))
+    result = c.fetchone()
+    if not result or not result[0] or not auth.check_password(password, result[0]):
+        return False
+    if auth.needs_rehash(result[0]):
+        # the configured cost changed since this hash was made; upgrade it while we have the password
+        with db.transaction() as conn:
+            conn.execute(
+                "UPDATE users SET password = ? WHERE username = ?",
+                (auth.hash_password(password), username),
+            )
+    return True
+
+
+def token_generation(username):
+    """The user's current session token generation, or None if there is no such user."""
+    row = db.connect().execute("SELECT token_generation FROM users WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else None
+
+
+def session_token(username):
+    """A signed session token for a user who has just signed in."""
+    return auth.issue_token(username, token_generation(username))
+
+
+def session_user(token):
+    """The user a session token belongs to, or None if it is invalid or has been revoked."""
+    return auth.verify_token(token, token_generation)
+
+
+@profiling.timed("db.revoke_sessions")
+def revoke_sessions(username):
+    """Invalidate every session token issued to ``username`` so far (logout, password change)."""
+    with db.transaction() as conn:
+        conn.execute("UPDATE users SET token_generation = token_generation + 1 WHERE username = ?", (username,))
+
+
+def get_user_stats(username):
+    """``xp``, ``level``, ``wins`` and ``losses``, from the cache while fresh."""
+    return stats_cache.get(username, load_user_stats)
+
+
+@profiling.timed("db.get_user_stats")
+def load_user_stats(username):
+    conn = db.connect()
+    c = conn.cursor()
+    c.execute("SELECT xp, level, wins, losses FROM users WHERE username = ?", (username,))
+    result = c.fetchone()
+    if result:
+        return {
+            "xp": result[0],
+            "level": result[1],
+            "wins": result[2],
+            "losses": result[3],
+        }
+    return {"xp": 0, "level": 1, "wins": 0, "losses": 0}
+
+
+def award_xp(conn, username, xp_earned, won=False):
+    """Add XP and a win or loss inside the caller's transaction; True on level up."""
+    c = conn.cursor()
+    c.execute("SELECT xp, level, wins, losses FROM users WHERE username = ?", (username,))
+    result = c.fetchone()
+
+    if result is None:
+        c.execute(
+            "INSERT INTO users (username, xp, level, wins, losses) VALUES (?, ?, ?, ?, ?)",
+            (username, xp_earned, 1, 1 if won else 0, 0 if won else 1),
+        )
+        return False
+
+    current_xp, current_level, wins, losses = result
+    if won:
+        wins += 1
+    else:
+        losses += 1
+    new_xp = current_xp + xp_earned
+    new_level = max(current_level, level_for_xp(new_xp))
+
+    c.execute(
+        """
+        UPDATE users
+        SET xp = ?, level = ?, wins = ?, losses = ?
+        WHERE username = ?
+        """,
+        (new_xp, new_level, wins, losses, username),
+    )
+    return new_level > current_level
+
+
+@profiling.timed("db.update_user_xp_fixed")
+def update_user_xp_fixed(username, xp_earned, won=False):
+    """Update user XP, wins, and losses with better error handling"""
+    # award_xp reads then writes, so take the write lock before the read
+    with db.transaction(immediate=True) as conn:
+        leveled_up = award_xp(conn, username, xp_earned, won)
+    invalidate_stats(username)
+    return leveled_up
+
+
+@profiling.timed("db.add_xp")
+def add_xp(username, xp_earned):
+    """XP with no win or loss attached (a tied battle); only for existing users."""
+    with db.transaction(immediate=True) as conn:
+        result = conn.execute("SELECT xp, level FROM users WHERE username = ?", (username,)).fetchone()
+        if result:
+            current_xp, current_level = result
+            new_xp = current_xp + xp_earned
+            new_level = max(current_level, level_for_xp(new_xp))
+            conn.execute("UPDATE users SET xp = ?, level = ? WHERE username = ?", (new_xp, new_level, username))
+    invalidate_stats(username)
+
+
+def record_multiplayer_result(conn, winner, loser):
+    """Match win/loss counters and XP for a finished PvP match, in the caller's transaction.
+
+    The caller must ``invalidate_stats(winner, loser)`` once that commits.
+    """
+    conn.execute("UPDATE users SET multiplayer_wins = multiplayer_wins + 1 WHERE username = ?", (winner,))
+    conn.execute("UPDATE users SET multiplayer_losses = multiplayer_losses + 1 WHERE username = ?", (loser,))
+    award_xp(conn, winner, 150, True)
+    award_xp(conn, loser, 100, False)